@@ -0,0 +1,148 @@
+from __future__ import annotations
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import datetime
+from typing import List, Optional
+
+sys.path.insert(0, ".")
+
+from PySide6 import QtCore, QtWidgets
+
+from package.ExifDate import EXIF_DATE_FORMAT, format_exif_date, parse_exif_date
+from package.FileList import FileList
+from package.ImageMetadata import ImageMetadata
+from package.Rules import DateRule
+
+
+# Throughput of the file list and of batch date conversion:
+#   QT_QPA_PLATFORM=offscreen python benchmarks/filelist_throughput.py [-n 100000]
+# The file list loads a folder of n (empty) JPEG files, selects all and highlights all, and filters
+# them by (synthetic, indexed) metadata; the dates of n synthetic EXIF date fields are parsed,
+# changed in one batch ('DateRule.convert_many') and formatted, as by the metadata loader, the
+# plan and the writer, compared against 'strptime' and 'strftime' per date.
+
+
+def _timed(label: str, func) -> float:
+    t0: float = time.perf_counter()
+    func()
+    elapsed: float = time.perf_counter() - t0
+    print(f"  {label:<22} {elapsed:.3f} s")
+    return elapsed
+
+
+def _load(file_list: FileList, load) -> None:
+    # runs a (background) load of the file list and waits until it is complete
+    loop: QtCore.QEventLoop = QtCore.QEventLoop()
+    file_list.signal_load_directory.connect(loop.quit)
+    load()
+    if file_list.is_loading():
+        loop.exec()
+    file_list.signal_load_directory.disconnect(loop.quit)
+
+
+def bench_filelist(n: int) -> None:
+    app: QtWidgets.QApplication = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+    with tempfile.TemporaryDirectory() as dirpath:
+        for i in range(n):
+            open(os.path.join(dirpath, f"IMG_{i:06d}.JPG"), "wb").close()
+
+        file_list: FileList = FileList()
+        file_list.resize(400, 600)
+        file_list.show()
+        print(f"file list, {n} files")
+        _timed("load", lambda: _load(file_list, lambda: file_list.load_directory(dirpath)))
+        _timed("select all", lambda: file_list.on_select_all(True))
+        assert file_list.num_selected() == n
+        _timed("highlight all", file_list.highlight_all)
+        _timed("highlighted paths", file_list.highlighted_paths)
+        assert file_list.num_highlighted() == n
+        _timed("deselect highlighted", lambda: file_list.on_select_highlight(False))
+        assert file_list.num_selected() == 0
+        _timed(
+            "reload with selection",
+            lambda: _load(
+                file_list,
+                lambda: file_list.reload(
+                    selected_filepaths=file_list.paths()[::2],
+                    highlighted_filepaths=file_list.paths()[n // 4 : n // 2],
+                ),
+            ),
+        )
+        assert file_list.num_selected() == (n + 1) // 2
+
+        # (the files are empty, so the index is filled with synthetic metadata)
+        models: List[str] = ["ILCE-7C", "ILCE-7M3", "X-T4", "EOS R5"]
+        start: datetime.datetime = datetime.datetime(2023, 4, 22)
+        file_list.add_metadata(
+            ImageMetadata(
+                path,
+                0,
+                0,
+                camera_model=models[i % len(models)],
+                iso=100 << (i % 5),
+                date_taken=start + datetime.timedelta(minutes=i % 1440),
+            )
+            for i, path in enumerate(file_list.paths())
+        )
+        _timed("filter", lambda: file_list.set_filter("ILCE-7C date:2023-04-22 time:14..16"))
+        assert file_list.is_indexed() and not file_list.is_indexing()
+        assert file_list.num_shown() == sum(
+            1 for i in range(n) if i % len(models) == 0 and 14 * 60 <= i % 1440 < 17 * 60
+        )
+        _timed("select all shown", lambda: file_list.on_select_all(True))
+        _timed("clear filter", lambda: file_list.set_filter(""))
+        assert file_list.num_shown() == n
+        app.processEvents()
+        file_list.close()
+
+
+def bench_dates(n: int) -> None:
+    rng: random.Random = random.Random(0)
+    start: datetime.datetime = datetime.datetime(2020, 1, 1)
+    raws: List[Optional[bytes]] = [
+        (start + datetime.timedelta(seconds=rng.randrange(10**8))).strftime(EXIF_DATE_FORMAT).encode()
+        if rng.random() > 0.05
+        else None
+        for _ in range(n)
+    ]
+    delta: datetime.timedelta = datetime.timedelta(hours=1)
+
+    print(f"dates, {n} fields")
+    expected: List[Optional[bytes]] = []
+
+    def reference() -> None:
+        for raw in raws:
+            if raw is None:
+                expected.append(None)
+                continue
+            dt = datetime.datetime.strptime(raw.decode(), EXIF_DATE_FORMAT) + delta
+            expected.append(dt.strftime(EXIF_DATE_FORMAT).encode())
+
+    results: List[Optional[bytes]] = []
+
+    def batch() -> None:
+        dts: List[Optional[datetime.datetime]] = DateRule(delta=delta).convert_many(
+            [parse_exif_date(raw) for raw in raws]
+        )
+        results.extend(format_exif_date(dt) if dt is not None else None for dt in dts)
+
+    t_reference: float = _timed("strptime/strftime", reference)
+    t_batch: float = _timed("batch", batch)
+    assert results == expected, "batch conversion differs from the reference"
+    print(f"  speed-up:              {t_reference / t_batch:.1f}x")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", type=int, default=100_000, help="number of files and dates")
+    args = parser.parse_args()
+    bench_filelist(args.n)
+    bench_dates(args.n)
+
+
+if __name__ == "__main__":
+    main()
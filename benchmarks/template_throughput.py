@@ -0,0 +1,119 @@
+from __future__ import annotations
+import re
+import sys
+import time
+import random
+import argparse
+import datetime
+from typing import Dict, List, Optional
+
+sys.path.insert(0, ".")
+
+from package.ExifMap import ExifMap
+from package.ImageMetadata import ImageMetadata
+from package.Rules import DateRule, FileNameRule
+
+
+# Throughput of file name templates on synthetic metadata records:
+#   python benchmarks/template_throughput.py [-n 100000] [--template TEXT]
+# The compiled 'FileNameRule' is compared against evaluating the template with regular
+# expressions for every image (as before templates were compiled), and both results are checked
+# to be equal.
+
+_MAKERS: List[str] = ["SONY", "Canon", "NIKON CORPORATION", "FUJIFILM", "Apple", "samsung"]
+_MODELS: List[str] = ["ILCE-7C", "EOS R6", "NIKON Z 6_2", "X-T4", "iPhone 13 Pro", "SM-G991B"]
+_PREFIXES: List[str] = ["DSC", "IMG_", "DSCF", "_MG_", "PXL_"]
+
+
+def records(n: int, seed: int = 0) -> List[ImageMetadata]:
+    rng: random.Random = random.Random(seed)
+    start: datetime.datetime = datetime.datetime(2020, 1, 1)
+    metadatas: List[ImageMetadata] = []
+    for i in range(n):
+        camera: int = rng.randrange(len(_MAKERS))
+        metadatas.append(
+            ImageMetadata(
+                f"/photos/{rng.choice(_PREFIXES)}{i:05d}.JPG",
+                size=rng.randrange(1 << 20, 1 << 24),
+                mtime_ns=i,
+                # some images have no date taken
+                date_taken=(
+                    start + datetime.timedelta(seconds=rng.randrange(10**8))
+                    if rng.random() > 0.05
+                    else None
+                ),
+                camera_maker=_MAKERS[camera],
+                camera_model=_MODELS[camera],
+            )
+        )
+    return metadatas
+
+
+def reference_filename(
+    exif_map: ExifMap, img: ImageMetadata, text: str
+) -> Optional[str]:
+    # evaluates the template with regular expressions for every image
+    exif_map.reset()
+    tags: List[str] = re.findall(r"\[([^\[\]]*)\]", text)
+    getters: Dict[str, object] = {
+        "ORG": exif_map.basename,
+        "YYYY": exif_map.year,
+        "MM": exif_map.month,
+        "DD": exif_map.day,
+        "hh": exif_map.hour,
+        "mm": exif_map.minute,
+        "ss": exif_map.second,
+        "MAK": lambda img: exif_map.camera_maker(img),
+        "MOD": lambda img: exif_map.camera_model(img),
+        "UPT:": lambda img, arg: exif_map.text_upto(img, arg, False),
+        "UPTI:": lambda img, arg: exif_map.text_upto(img, arg, True),
+        "FRM:": lambda img, arg: exif_map.text_from(img, arg, False),
+        "FRMI:": lambda img, arg: exif_map.text_from(img, arg, True),
+    }
+    mapping: Dict[str, Optional[str]] = {}
+    for tag in tags:
+        split: List[str] = tag.rsplit(":", 1)
+        if len(split) > 1:
+            mapping[tag] = getters[f"{split[0]}:"](img, split[1])
+        else:
+            mapping[tag] = getters[tag](img)
+    if len(mapping) > 0 and any(element is not None for element in mapping.values()):
+        for tag, new in mapping.items():
+            text = text.replace(f"[{tag}]", new if new is not None else "")
+        if any(char.isalnum() for char in text):
+            return f"{text}{img.extension()}"
+    return None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", type=int, default=100_000, help="number of records")
+    parser.add_argument(
+        "--template", default="[YYYY][MM][DD]-[hh][mm][ss]_[MAK]-[MOD]_[FRMI:DSC]"
+    )
+    args = parser.parse_args()
+
+    metadatas: List[ImageMetadata] = records(args.n)
+    date_rule: DateRule = DateRule(delta=datetime.timedelta(hours=1))
+
+    exif_map: ExifMap = ExifMap(date_rule)
+    t0: float = time.perf_counter()
+    expected: List[Optional[str]] = [
+        reference_filename(exif_map, img, args.template) for img in metadatas
+    ]
+    t_reference: float = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    rule: FileNameRule = FileNameRule(args.template, date_rule)
+    results: List[Optional[str]] = [rule.compile_filename(img) for img in metadatas]
+    t_compiled: float = time.perf_counter() - t0
+
+    assert results == expected, "compiled template differs from the reference"
+    print(f"{args.n} records, template '{args.template}'")
+    print(f"  per-image regex: {t_reference:.3f} s ({args.n / t_reference:,.0f} records/s)")
+    print(f"  compiled:        {t_compiled:.3f} s ({args.n / t_compiled:,.0f} records/s)")
+    print(f"  speed-up:        {t_reference / t_compiled:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,10 @@
 if __name__ == "__main__":
+    import multiprocessing
+
+    # the worker processes of a frozen (PyInstaller) build start this executable again; they must
+    # run the worker instead of the app
+    multiprocessing.freeze_support()
+
     import sys
     from package import app
 
@@ -0,0 +1,133 @@
+from __future__ import annotations
+import os
+import collections
+import concurrent.futures
+from typing import Deque, Iterable, Iterator, List, Optional, Union
+
+from package.FileOperation import (
+    EXECUTOR_PROCESS,
+    EXECUTOR_SERIAL,
+    EXECUTOR_THREAD,
+    create_executor,
+)
+from package.ImageBackend import default_backend_name, open_image
+from package.ImageMetadata import ImageMetadata
+from package.MetadataCache import MetadataCache, default_cache
+
+_CACHE_BATCH_SIZE: int = 256
+
+
+def _load(backend: str, path: str) -> Optional[ImageMetadata]:
+    # Reads the metadata of a single file. Defined at module level so that it can be sent to
+    # worker processes.
+
+    try:
+        return open_image(path, backend).metadata()
+    except Exception as e:
+        print(f"Cannot read '{path}': {e!r}")
+        return None
+
+
+def load_many(
+    paths: Iterable[str],
+    executor: Union[str, concurrent.futures.Executor] = EXECUTOR_THREAD,
+    max_workers: Optional[int] = None,
+    max_in_flight: Optional[int] = None,
+    is_ordered: bool = True,
+    cache: Optional[MetadataCache] = None,
+    backend: Optional[str] = None,
+) -> Iterator[ImageMetadata]:
+    # Loads the metadata of many files and yields the records as they become available: in input
+    # order if 'is_ordered', otherwise in completion order. Cached records only cost a stat call;
+    # the other files are read by a thread pool (I/O bound), a process pool (CPU-bound parsing), a
+    # given executor, or serially, with at most 'max_in_flight' files submitted at a time. Files
+    # that cannot be read are skipped.
+
+    if cache is None:
+        cache = default_cache()
+    if backend is None:
+        backend = default_backend_name()
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    if max_in_flight is None:
+        max_in_flight = 4 * max_workers
+
+    pool: Optional[concurrent.futures.Executor]
+    is_own_pool: bool
+    pool, is_own_pool = create_executor(executor, max_workers)
+
+    # pending entries are records (cache hits) or futures (files being read)
+    pending: Deque[Union[ImageMetadata, concurrent.futures.Future]] = collections.deque()
+    num_in_flight: int = 0
+    loaded: List[ImageMetadata] = []
+
+    def store(metadata: Optional[ImageMetadata]) -> Optional[ImageMetadata]:
+        if metadata is not None:
+            loaded.append(metadata)
+            if len(loaded) >= _CACHE_BATCH_SIZE:
+                cache.put_many(loaded)
+                loaded.clear()
+        return metadata
+
+    def take() -> Iterator[ImageMetadata]:
+        # yields the finished entries (in order: only those at the front of the queue)
+        nonlocal num_in_flight
+        if is_ordered:
+            while pending and (
+                not isinstance(pending[0], concurrent.futures.Future) or pending[0].done()
+            ):
+                entry = pending.popleft()
+                if isinstance(entry, concurrent.futures.Future):
+                    num_in_flight -= 1
+                    entry = store(entry.result())
+                if entry is not None:
+                    yield entry
+        else:
+            remaining: Deque[Union[ImageMetadata, concurrent.futures.Future]] = (
+                collections.deque()
+            )
+            while pending:
+                entry = pending.popleft()
+                if isinstance(entry, concurrent.futures.Future):
+                    if not entry.done():
+                        remaining.append(entry)
+                        continue
+                    num_in_flight -= 1
+                    entry = store(entry.result())
+                if entry is not None:
+                    yield entry
+            pending.extend(remaining)
+
+    def wait() -> None:
+        # blocks until at least one file in flight has been read
+        futures: List[concurrent.futures.Future] = [
+            entry for entry in pending if isinstance(entry, concurrent.futures.Future)
+        ]
+        if is_ordered:
+            futures = futures[:1]
+        concurrent.futures.wait(futures, return_when=concurrent.futures.FIRST_COMPLETED)
+
+    try:
+        for path in paths:
+            metadata: Optional[ImageMetadata] = cache.get(path)
+            if metadata is not None:
+                pending.append(metadata)
+            elif pool is None:
+                pending.append(store(_load(backend, path)))
+            else:
+                pending.append(pool.submit(_load, backend, path))
+                num_in_flight += 1
+            yield from take()
+
+            while num_in_flight >= max_in_flight:
+                wait()
+                yield from take()
+
+        while pending:
+            wait()
+            yield from take()
+    finally:
+        if loaded:
+            cache.put_many(loaded)
+        if is_own_pool:
+            pool.shutdown(wait=True, cancel_futures=True)
@@ -5,6 +5,7 @@ from typing import Optional
 from PySide6 import QtCore, QtWidgets
 
 from package.NestedList import NestedListItem
+from package.Rules import DateRule
 from package.constants import MIN_TEXTWIDGET_HEIGHT
 
 
@@ -85,18 +86,21 @@ class ChangeDateTaken(QtWidgets.QWidget):
     def specific(self) -> datetime.datetime:
         return self._datetime_specific.date_time()
 
+    def rule(self) -> Optional[DateRule]:
+        # Returns the configured date change (None if the date taken is not changed).
+
+        if not self.is_checked():
+            return None
+        if self._is_relative:
+            return DateRule(delta=self._datetime_relative.plus_minus() * self.relative())
+        return DateRule(date_time=self.specific())
+
     def convert_date_taken(
         self, dt: Optional[datetime.datetime]
     ) -> Optional[datetime.datetime]:
-        if self.is_checked():
-            if not self._is_relative:
-                # relative date
-                new_dt: datetime.datetime = self.specific()
-                return new_dt
-            elif dt is not None:
-                # specific date
-                new_dt: datetime.datetime = self._datetime_relative.date_time(dt)
-                return new_dt
+        rule: Optional[DateRule] = self.rule()
+        if rule is not None:
+            return rule.convert_date_taken(dt)
         return None
 
     # emit
@@ -1,12 +1,12 @@
 from __future__ import annotations
 import re
 import functools
-from typing import Optional, List, Dict, Callable
+from typing import Optional, List, Dict
 
 from PySide6 import QtCore, QtWidgets
 
-from package.Image import Image
-from package.ExifMap import ExifMap
+from package.ImageMetadata import ImageMetadata
+from package.Rules import TAGS, FileNameRule
 from package.NestedList import NestedListItem
 from package.ChangeDateTaken import ChangeDateTaken
 from package.constants import MIN_TEXTWIDGET_HEIGHT
@@ -17,11 +17,10 @@ class ChangeFileName(QtWidgets.QWidget):
     _SETTING: str = "filename"
     _nested: NestedListItem
     _settings: QtCore.QSettings
-    _img: Optional[Image]
+    _img: Optional[ImageMetadata]
     _text: Optional[str]
 
-    _map: ExifMap
-    _tags: Dict[str, Callable]
+    _change_date_taken: ChangeDateTaken
 
     signal_changed = QtCore.Signal(str)
 
@@ -42,42 +41,13 @@ class ChangeFileName(QtWidgets.QWidget):
         self._img = None
         change_date_taken.signal_changed.connect(self.emit_filename)
 
-        self._map = ExifMap(change_date_taken)
-        self._tags = {
-            "ORG": Tag("Original file name", self._map.basename),
-            "YYYY": Tag("Year", self._map.year),
-            "MM": Tag("Month", self._map.month),
-            "DD": Tag("Day", self._map.day),
-            "hh": Tag("Hour", self._map.hour),
-            "mm": Tag("Minute", self._map.minute),
-            "ss": Tag("Second", self._map.second),
-            "MAK": Tag("Camera maker", self._map.camera_maker),
-            "MOD": Tag("Camera model", self._map.camera_model),
-            "UPT:": Tag(
-                "Up to", lambda img, text: self._map.text_upto(img, text, False)
-            ),
-            "UPTI:": Tag(
-                "Up to and including",
-                lambda img, text: self._map.text_upto(img, text, True),
-            ),
-            "FRM:": Tag(
-                "From", lambda img, text: self._map.text_from(img, text, False)
-            ),
-            "FRMI:": Tag(
-                "From and including",
-                lambda img, text: self._map.text_from(img, text, True),
-            ),
-        }
+        self._change_date_taken = change_date_taken
 
         layout: QtWidgets.QLayout = QtWidgets.QVBoxLayout()
         layout.setContentsMargins(0, 0, 0, 0)
         self.setLayout(layout)
 
-        tags: Dict[str, str] = {}
-        for tag, element in self._tags.items():
-            tags[tag] = element.description()
-
-        widget: FileNameFormat = FileNameFormat(self._text, tags)
+        widget: FileNameFormat = FileNameFormat(self._text, TAGS)
         widget.signal_text_changed.connect(self.on_text_changed)
         layout.addWidget(widget)
 
@@ -90,51 +60,25 @@ class ChangeFileName(QtWidgets.QWidget):
     def is_checked(self) -> bool:
         return self._nested.is_checked()
 
-    def set_file(self, img: Optional[Image]) -> None:
+    def set_file(self, img: Optional[ImageMetadata]) -> None:
         self._img = img
         self.emit_filename()
 
     def has_file(self) -> bool:
         return self._img is not None
 
-    def replace_tags(self, text: str, tags: Dict[str, str]) -> str:
-        for tag, new in tags.items():
-            assert tag in text
-            full_tag: str = f"[{tag}]"
-            if new is None:
-                new = ""
-            text = text.replace(full_tag, new)
-        return text
-
-    def compile_filename(self, img: Image, text: str) -> str:
-        assert(len(text) > 0)
-        
-        tag_pattern = r"\[([^\[\]]*)\]"
-        tags: List[str] = re.findall(tag_pattern, text)
+    def rule(self) -> Optional[FileNameRule]:
+        # Returns the configured file name template, with the configured date change (None if
+        # the file name is not changed).
+
+        if self.is_checked() and len(self._text) > 0:
+            return FileNameRule(self._text, self._change_date_taken.rule())
+        return None
 
-        mapping: Dict[str, str] = {}
-        for tag in tags:
-            split: List[str] = tag.rsplit(":", 1)
-            element: str
-            if len(split) > 1:
-                # tags with arguments
-                subtag = f"{split[0]}:"
-                arg: str = split[1]
-                element = self._tags[subtag].mapping(img, arg)
-            else:
-                # tags without arguments
-                element = self._tags[tag].mapping(img)
-            mapping[tag] = element
-
-        elements: List[str] = list(mapping.values())
-        if len(elements) > 0 and any(element is not None for element in elements):
-            new_filename: str = self.replace_tags(text, mapping)
-            if any(char.isalnum() for char in new_filename):
-                return f"{new_filename}{img.extension()}"
-
-    def convert_filename(self, img: Optional[Image]) -> Optional[str]:
-        if self.is_checked() and self.has_file() and len(self._text) > 0:
-            return self.compile_filename(img, self._text)
+    def convert_filename(self, img: Optional[ImageMetadata]) -> Optional[str]:
+        rule: Optional[FileNameRule] = self.rule()
+        if rule is not None and img is not None:
+            return rule.compile_filename(img)
         return None
 
     # emit
@@ -235,18 +179,3 @@ class FileNameFormat(QtWidgets.QWidget):
         else:
             self._line_edit.setStyleSheet("border: 2px solid red")
         self._button.setEnabled(is_valid)
-
-
-class Tag(object):
-    _description: str
-    _mapping: Callable[[], str]
-
-    def __init__(self, description: str, mapping: Callable[[], str]) -> None:
-        self._description = description
-        self._mapping = mapping
-
-    def description(self) -> str:
-        return self._description
-
-    def mapping(self, *args) -> Callable[[], str]:
-        return self._mapping(*args)
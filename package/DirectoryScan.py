@@ -0,0 +1,181 @@
+from __future__ import annotations
+import os
+import time
+import fnmatch
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+
+
+# Listing of the images of a directory (or a directory tree), free of Qt: the file list runs it on
+# a worker thread (see 'FileList.DirectoryLister'), and the command line interface runs it
+# directly.
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg")
+
+# the files of a modification in progress (temporary files and names of rename cycles) are never
+# listed
+TEMP_PREFIX: str = ".exifedit-"
+
+# a batch is reported when it holds this many files, or when this much time (seconds) has passed
+# since the last batch (so slow directories, e.g., on network shares, still show progress)
+_BATCH_SIZE: int = 2048
+_BATCH_INTERVAL: float = 0.1
+
+
+class ScanOptions(object):
+    # Which images of a directory are listed: those directly in it, or also those in its
+    # subdirectories (at most 'max_depth' levels below it; None = all levels). Globs are matched
+    # against the name and the path relative to the directory (with '/' separators), e.g.,
+    # '*.jpg', 'DCIM/*', '.*'. With include globs, only matching files are listed; excluded files
+    # are not listed, and excluded directories are not entered.
+
+    _is_recursive: bool
+    _max_depth: Optional[int]
+    _include: Tuple[str, ...]
+    _exclude: Tuple[str, ...]
+
+    def __init__(
+        self,
+        is_recursive: bool = False,
+        max_depth: Optional[int] = None,
+        include: Iterable[str] = (),
+        exclude: Iterable[str] = (),
+    ) -> None:
+        assert max_depth is None or max_depth >= 0, "The depth limit cannot be negative"
+        self._is_recursive = is_recursive
+        self._max_depth = max_depth
+        self._include = tuple(include)
+        self._exclude = tuple(exclude)
+
+    def is_recursive(self) -> bool:
+        return self._is_recursive
+
+    def max_depth(self) -> Optional[int]:
+        return self._max_depth
+
+    def include(self) -> Tuple[str, ...]:
+        return self._include
+
+    def exclude(self) -> Tuple[str, ...]:
+        return self._exclude
+
+    @staticmethod
+    def _matches(globs: Tuple[str, ...], name: str, relpath: str) -> bool:
+        return any(
+            fnmatch.fnmatch(name, glob) or fnmatch.fnmatch(relpath, glob) for glob in globs
+        )
+
+    def is_entered(self, name: str, relpath: str, depth: int) -> bool:
+        # Returns whether a subdirectory (at 'depth' levels below the directory) is listed.
+
+        return (
+            self._is_recursive
+            and (self._max_depth is None or depth <= self._max_depth)
+            and not self._matches(self._exclude, name, relpath)
+        )
+
+    def is_listed(self, name: str, relpath: str) -> bool:
+        # Returns whether an image file is listed.
+
+        if self._include and not self._matches(self._include, name, relpath):
+            return False
+        return not self._matches(self._exclude, name, relpath)
+
+
+def is_image_name(name: str) -> bool:
+    return name.lower().endswith(IMAGE_EXTENSIONS) and not name.startswith(TEMP_PREFIX)
+
+
+def entry_inode(entry: os.DirEntry) -> int:
+    # Returns the inode of a directory entry: on POSIX, it comes with the listing; on Windows, it
+    # would cost a stat call, so 0 (unknown) is returned.
+
+    return entry.inode() if os.name != "nt" else 0
+
+
+def sort_key(path: str) -> Tuple[str, str]:
+    # Sort key of listed files: by directory, then by name (so that the files of a subdirectory
+    # stay together, before or after those of its subdirectories).
+
+    dirpath, _, name = path.rpartition(os.sep)
+    return dirpath, name
+
+
+def scan_images(
+    dirpath: str,
+    options: Optional[ScanOptions] = None,
+    batch_size: int = _BATCH_SIZE,
+    interval: float = _BATCH_INTERVAL,
+    is_cancelled: Optional[Callable[[], bool]] = None,
+) -> Iterator[List[os.DirEntry]]:
+    # Yields the directory entries of the images of a directory (and, see 'ScanOptions', of its
+    # subdirectories) in batches, unsorted. The tree is walked lazily, one directory at a time and
+    # depth first, so the files of a subdirectory come together; only the subdirectories still to
+    # list are kept (not the entries of the tree), and symbolic links to directories are not
+    # followed. The file types come from the directory entries ('os.scandir'), so most files cost
+    # no extra stat call.
+    #
+    # Stops early once 'is_cancelled' returns True. Raises 'OSError' if the directory cannot be
+    # listed; subdirectories that cannot be listed are skipped.
+
+    if options is None:
+        options = ScanOptions()
+    prefix: int = len(os.path.join(dirpath, ""))
+    is_filtered: bool = bool(options.include() or options.exclude())
+
+    batch: List[os.DirEntry] = []
+    t_batch: float = time.monotonic()
+    stack: List[Tuple[str, int]] = [(dirpath, 0)]
+    while stack:
+        path, depth = stack.pop()
+        subdirpaths: List[str] = []
+        try:
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    if is_cancelled is not None and is_cancelled():
+                        return
+                    try:
+                        if options.is_recursive() and entry.is_dir(follow_symlinks=False):
+                            if options.is_entered(
+                                entry.name, entry.path[prefix:].replace(os.sep, "/"), depth + 1
+                            ):
+                                subdirpaths.append(entry.path)
+                        elif (
+                            is_image_name(entry.name)
+                            and entry.is_file()
+                            and (
+                                not is_filtered
+                                or options.is_listed(
+                                    entry.name, entry.path[prefix:].replace(os.sep, "/")
+                                )
+                            )
+                        ):
+                            batch.append(entry)
+                    except OSError:
+                        continue
+                    if batch and (
+                        len(batch) >= batch_size or time.monotonic() - t_batch >= interval
+                    ):
+                        yield batch
+                        batch = []
+                        t_batch = time.monotonic()
+        except OSError as e:
+            if depth == 0:
+                raise
+            print(f"Cannot list '{path}': {e}")
+            continue
+
+        # list the subdirectories next, in name order
+        subdirpaths.sort(reverse=True)
+        stack.extend((subdirpath, depth + 1) for subdirpath in subdirpaths)
+    if batch:
+        yield batch
+
+
+def list_directory(dirpath: str, options: Optional[ScanOptions] = None) -> List[str]:
+    # Returns the sorted paths of the images of a directory (see 'scan_images').
+
+    filepaths: List[str] = []
+    for batch in scan_images(dirpath, options):
+        filepaths.extend(entry.path for entry in batch)
+    filepaths.sort(key=sort_key)
+    return filepaths
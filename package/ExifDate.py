@@ -0,0 +1,66 @@
+from __future__ import annotations
+import datetime
+from typing import Optional, Union
+
+
+# EXIF dates are fixed-width ASCII ('YYYY:MM:DD HH:MM:SS', 19 bytes), so they are parsed and
+# formatted by offset instead of with 'strptime' and 'strftime' (which interpret the format string
+# for every date).
+
+EXIF_DATE_LENGTH: int = 19
+EXIF_DATE_FORMAT: str = "%Y:%m:%d %H:%M:%S"
+
+_COLON: int = ord(":")
+_SPACE: int = ord(" ")
+
+
+def parse_exif_date(raw: Optional[Union[bytes, str]]) -> Optional[datetime.datetime]:
+    # Returns the date of an EXIF date field, or None if it is missing or not a valid date (some
+    # cameras write blanks, e.g., '    :  :     ').
+
+    if raw is None:
+        return None
+    if isinstance(raw, str):
+        raw = raw.encode("ascii", "replace")
+    if (
+        len(raw) < EXIF_DATE_LENGTH
+        or raw[4] != _COLON
+        or raw[7] != _COLON
+        or raw[10] != _SPACE
+        or raw[13] != _COLON
+        or raw[16] != _COLON
+    ):
+        return _parse_loose(raw)
+    try:
+        return datetime.datetime(
+            int(raw[0:4]),
+            int(raw[5:7]),
+            int(raw[8:10]),
+            int(raw[11:13]),
+            int(raw[14:16]),
+            int(raw[17:19]),
+        )
+    except ValueError:
+        return None
+
+
+def _parse_loose(raw: bytes) -> Optional[datetime.datetime]:
+    # fallback for dates that are not zero-padded (accepted by 'strptime')
+    try:
+        return datetime.datetime.strptime(
+            raw.rstrip(b"\x00").decode("ascii").strip(), EXIF_DATE_FORMAT
+        )
+    except ValueError:
+        return None
+
+
+def format_exif_date(dt: datetime.datetime) -> bytes:
+    return b"%04d:%02d:%02d %02d:%02d:%02d" % (
+        dt.year,
+        dt.month,
+        dt.day,
+        dt.hour,
+        dt.minute,
+        dt.second,
+    )
+
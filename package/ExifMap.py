@@ -1,92 +1,115 @@
+from __future__ import annotations
 import os
-from typing import Optional
+import functools
+from typing import TYPE_CHECKING, Optional
 import datetime
 import re
 
-from package.Image import Image
-from package.ChangeDateTaken import ChangeDateTaken
+from package.ImageMetadata import ImageMetadata
+
+if TYPE_CHECKING:
+    from package.Rules import DateRule
+
+
+# characters that are not allowed in file names composed from EXIF text
+_INVALID_CHARS = re.compile(r"[^a-zA-Z0-9_-]")
+
+
+@functools.lru_cache(maxsize=1024)
+def _fix_string(text: str, replacement: str = "-") -> str:
+    # memoized: EXIF text (camera maker, model) takes few distinct values within a batch
+    return _INVALID_CHARS.sub(replacement, text)
 
 
 class ExifMap(object):
-    _img: Optional[Image]
+    _img: Optional[ImageMetadata]
     _dt: Optional[datetime.datetime]
+    _date_rule: Optional[DateRule]
 
-    def __init__(self, change_date_taken: ChangeDateTaken) -> None:
+    def __init__(self, date_rule: Optional[DateRule] = None) -> None:
         self._img = None
-        self._change_date_taken = change_date_taken
+        self._dt = None
+        self._date_rule = date_rule
 
     # private
-    def _fix_string(self, text: str, replacement: str = "-") -> str:
-        return re.sub(r"[^a-zA-Z0-9_-]", replacement, text)
-
     def _has_date_time(self) -> bool:
         return self._date_time is not None
 
-    def _date_time(self, file: Image) -> Optional[datetime.datetime]:
-        dt: Optional[datetime.datetime] = file.date_taken()
-        new_dt: Optional[
-            datetime.datetime
-        ] = self._change_date_taken.convert_date_taken(dt)
-        if new_dt is not None:
-            return new_dt
-        return dt
+    def _date_time(self, file: ImageMetadata) -> Optional[datetime.datetime]:
+        # the (converted) date/time is computed once per image and shared by all date/time tags
+        if file is not self._img:
+            dt: Optional[datetime.datetime] = file.date_taken()
+            new_dt: Optional[datetime.datetime] = None
+            if self._date_rule is not None:
+                new_dt = self._date_rule.convert_date_taken(dt)
+            self._img = file
+            self._dt = new_dt if new_dt is not None else dt
+        return self._dt
+
+    # public
+    def reset(self) -> None:
+        # Clears the date/time computed for the last image, e.g., because the date/time
+        # conversion has changed.
+
+        self._img = None
+        self._dt = None
 
     # public
-    def basename(self, img: Image) -> Optional[str]:
+    def basename(self, img: ImageMetadata) -> Optional[str]:
         filename_: Optional[str] = img.filename()
         if filename_ is not None:
             return os.path.splitext(filename_)[0]
         return None
 
-    def year(self, img: Image) -> Optional[str]:
+    def year(self, img: ImageMetadata) -> Optional[str]:
         dt: Optional[datetime.datetime] = self._date_time(img)
         if dt is not None:
             return f"{dt.year:0>4}"
         return None
 
-    def month(self, img: Image) -> Optional[str]:
+    def month(self, img: ImageMetadata) -> Optional[str]:
         dt: Optional[datetime.datetime] = self._date_time(img)
         if dt is not None:
             return f"{dt.month:0>2}"
         return None
 
-    def day(self, img: Image) -> Optional[str]:
+    def day(self, img: ImageMetadata) -> Optional[str]:
         dt: Optional[datetime.datetime] = self._date_time(img)
         if dt is not None:
             return f"{dt.day:0>2}"
         return None
 
-    def hour(self, img: Image) -> Optional[str]:
+    def hour(self, img: ImageMetadata) -> Optional[str]:
         dt: Optional[datetime.datetime] = self._date_time(img)
         if dt is not None:
             return f"{dt.hour:0>2}"
         return None
 
-    def minute(self, img: Image) -> Optional[str]:
+    def minute(self, img: ImageMetadata) -> Optional[str]:
         dt: Optional[datetime.datetime] = self._date_time(img)
         if dt is not None:
             return f"{dt.minute:0>2}"
         return None
 
-    def second(self, img: Image) -> Optional[str]:
+    def second(self, img: ImageMetadata) -> Optional[str]:
         dt: Optional[datetime.datetime] = self._date_time(img)
         if dt is not None:
             return f"{dt.second:0>2}"
         return None
 
-    def camera_maker(self, img: Image) -> Optional[str]:
+    def camera_maker(self, img: ImageMetadata) -> Optional[str]:
         exif_value: Optional[str] = img.camera_maker()
         if exif_value is not None:
-            return self._fix_string(exif_value)
+            return _fix_string(exif_value)
         return None
 
-    def camera_model(self, img: Image) -> Optional[str]:
+    def camera_model(self, img: ImageMetadata) -> Optional[str]:
         exif_value: Optional[str] = img.camera_model()
         if exif_value is not None:
-            return self._fix_string(exif_value)
+            return _fix_string(exif_value)
         return None
 
-    def text_upto(self, img: Image, text: str, is_include: bool) -> Optional[str]:
+    def text_upto(self, img: ImageMetadata, text: str, is_include: bool) -> Optional[str]:
         filename: Optional[str] = self.basename(img)
         if filename is not None:
             pos: int = filename.find(text)
@@ -96,7 +119,7 @@ class ExifMap(object):
                 return filename[:pos]
         return None
 
-    def text_from(self, img: Image, text: str, is_include: bool) -> Optional[str]:
+    def text_from(self, img: ImageMetadata, text: str, is_include: bool) -> Optional[str]:
         filename: Optional[str] = self.basename(img)
         if filename is not None:
             pos: int = filename.find(text)
@@ -1,17 +1,18 @@
 from __future__ import annotations
 import datetime
-from typing import Optional
+from typing import Optional, Tuple
 
 from PySide6 import QtCore, QtWidgets
 
 from package.ChangeDateTaken import ChangeDateTaken
 from package.ChangeFileName import ChangeFileName
-from package.Image import Image
+from package.ImageMetadata import ImageMetadata
+from package.Rules import Rules
 
 
 class FileEdit(QtWidgets.QWidget):
 
-    _file: Optional[Image]
+    _file: Optional[ImageMetadata]
     _dt: Optional[datetime.datetime]
     _filename: Optional[str]
     _is_checked: bool
@@ -66,7 +67,7 @@ class FileEdit(QtWidgets.QWidget):
             self._change_filename.is_checked() or self._change_date_taken.is_checked()
         )
 
-    def set_file(self, file: Image) -> None:
+    def set_file(self, file: ImageMetadata) -> None:
         self._file = file
 
         dt: Optional[datetime.datetime] = file.date_taken()
@@ -74,23 +75,18 @@ class FileEdit(QtWidgets.QWidget):
         self._change_date_taken.set_date_taken(dt)
         self._change_filename.set_file(file)
 
-    def convert_file(self, img: Image) -> Optional[str]:
-        new_filename: Optional[str] = self._change_filename.convert_filename(img)
+    def rules(self) -> Rules:
+        # Returns a snapshot of the configured rules, which can be evaluated without the widgets
+        # (e.g., on another thread or process).
 
-        dt: Optional[datetime.datetime] = img.date_taken()
-        new_dt: Optional[
-            datetime.datetime
-        ] = self._change_date_taken.convert_date_taken(dt)
+        return Rules(self._change_filename.rule(), self._change_date_taken.rule())
 
-        if new_dt is None:
-            if new_filename is None:
-                return None
-        else:
-            img.set_date_taken(new_dt)
-            if new_filename is None:
-                new_filename = img.filename()
+    def convert(
+        self, metadata: ImageMetadata
+    ) -> Tuple[Optional[str], Optional[datetime.datetime]]:
+        # Returns the new file name and the new date taken of a file (None if unchanged).
 
-        return new_filename
+        return self.rules().convert(metadata)
 
     # preview
     def clear(self) -> None:
@@ -1,40 +1,499 @@
 import os
-from typing import List, Optional
+import time
+import collections
+import bisect
+import itertools
+import threading
+from typing import AbstractSet, Deque, Dict, Iterable, List, Mapping, Optional, Set, Tuple
 
-from PySide6 import QtWidgets, QtCore
+from PySide6 import QtWidgets, QtCore, QtGui
+
+from package.BatchLoad import load_many
+from package.DirectoryScan import ScanOptions, entry_inode, scan_images, sort_key
+from package.FileOperation import EXECUTOR_THREAD
+from package.ImageMetadata import ImageMetadata
+from package.MetadataIndex import MetadataIndex, MetadataQuery
+from package.Selection import SET_DIFFERENCE, SET_INTERSECT, SET_UNION, Selection
+
+
+# menu entries of a named selection set: (text, operation on the selection)
+_SET_ACTIONS: List[Tuple[str, Optional[str]]] = [
+    ("Restore", None),
+    ("Add to selection", SET_UNION),
+    ("Intersect with selection", SET_INTERSECT),
+    ("Remove from selection", SET_DIFFERENCE),
+]
+
+# directory changes are applied once the directory is quiet for this long (ms); directories that
+# cannot be watched are polled
+_RESCAN_DELAY: int = 250
+_POLL_INTERVAL: int = 2000
+
+# larger changes are applied by resetting the model (instead of inserting and removing rows)
+_MAX_INCREMENTAL_CHANGES: int = 256
+
+# in recursive mode, at most this many subdirectories (with listed files) are watched
+_MAX_WATCHED_DIRECTORIES: int = 256
+
+# the workers of the file list (listings and indexers) notify it of their queued results at most
+# every this many seconds
+_NOTIFY_INTERVAL: float = 0.1
+
+# the metadata index is filled by this many reader threads, in batches of this many files (or of
+# the files read within this time, in seconds); the filter is applied once typing pauses for this
+# long (ms)
+_INDEX_WORKERS: int = 2
+_INDEX_BATCH_SIZE: int = 256
+_INDEX_BATCH_INTERVAL: float = 0.2
+_FILTER_DELAY: int = 150
+
+_FILTER_HELP: str = (
+    "Show the images whose metadata match all words:\n"
+    "  text: camera maker, model or lens contains the text\n"
+    "  maker:text  model:text  lens:\"text with spaces\"\n"
+    "  iso:400  iso:100..800  iso:..200\n"
+    "  f:2.8  f:1.4..4\n"
+    "  date:2023-04-22  date:2023-04..2023-06  date:2023-04-22T14:00..2023-04-22T16:00\n"
+    "  time:14:00..16:00 (time of day)"
+)
+
+
+class FileListModel(QtCore.QAbstractListModel):
+    # List model of the files of a directory, with a checkbox (selection) per file. The check
+    # states are held by a 'Selection' (in a bitset); the view only requests the rows it shows,
+    # and bulk changes are reported with a single 'dataChanged'.
+    #
+    # With a filter, the model only has the shown files: its rows ('view rows') map to the
+    # (ascending) rows of the selection. Files are then only appended (hidden), and other changes
+    # reset the model.
+
+    _selection: Selection
+    _filenames: List[str]
+    _shown: Optional[List[int]]
+    _shown_bits: Optional[bytearray]
+
+    # emitted when a check state is changed through the view: row
+    signal_checked: QtCore.Signal = QtCore.Signal(int)
+
+    def __init__(self, selection: Selection, parent: Optional[QtCore.QObject] = None) -> None:
+        super().__init__(parent)
+        self._selection = selection
+        self._filenames = []
+        self._shown = None
+        self._shown_bits = None
+
+    # model
+    def rowCount(self, parent: QtCore.QModelIndex = QtCore.QModelIndex()) -> int:
+        if parent.isValid():
+            return 0
+        return len(self._shown) if self._shown is not None else len(self._filenames)
+
+    def data(self, index: QtCore.QModelIndex, role: int = QtCore.Qt.DisplayRole) -> object:
+        if not index.isValid():
+            return None
+        row: int = self.row(index.row())
+        if role == QtCore.Qt.DisplayRole:
+            return self._filenames[row]
+        if role == QtCore.Qt.CheckStateRole:
+            return QtCore.Qt.Checked if self._selection.is_selected(row) else QtCore.Qt.Unchecked
+        if role == QtCore.Qt.ToolTipRole:
+            return self._selection.filepaths()[row]
+        return None
+
+    def setData(
+        self, index: QtCore.QModelIndex, value: object, role: int = QtCore.Qt.EditRole
+    ) -> bool:
+        if not index.isValid() or role != QtCore.Qt.CheckStateRole:
+            return False
+        row: int = self.row(index.row())
+        self._selection.set_selected(row, QtCore.Qt.CheckState(value) == QtCore.Qt.Checked)
+        self.dataChanged.emit(index, index, [QtCore.Qt.CheckStateRole])
+        self.signal_checked.emit(row)
+        return True
+
+    def flags(self, index: QtCore.QModelIndex) -> QtCore.Qt.ItemFlags:
+        if not index.isValid():
+            return QtCore.Qt.NoItemFlags
+        return QtCore.Qt.ItemIsEnabled | QtCore.Qt.ItemIsSelectable | QtCore.Qt.ItemIsUserCheckable
+
+    # protected
+    def _set_shown(self, bits: Optional[bytearray]) -> None:
+        self._shown_bits = bits
+        self._shown = list(itertools.compress(range(len(bits)), bits)) if bits is not None else None
+
+    # public
+    def set_files(
+        self,
+        filepaths: List[str],
+        selected: Optional[Iterable[str]] = None,
+        highlighted: Optional[Iterable[str]] = None,
+        filenames: Optional[List[str]] = None,
+        shown: Optional[bytearray] = None,
+    ) -> None:
+        # Sets the files, and the bitset of the shown files (None = all).
+
+        self.beginResetModel()
+        self._selection.set_files(filepaths, selected, highlighted)
+        if filenames is None:
+            filenames = [os.path.basename(filepath) for filepath in filepaths]
+        self._filenames = filenames
+        self._set_shown(shown)
+        self.endResetModel()
+
+    def set_shown(self, shown: Optional[bytearray]) -> None:
+        # Shows the files of a bitset (None = all).
+
+        self.beginResetModel()
+        self._set_shown(shown)
+        self.endResetModel()
+
+    def add_files(
+        self,
+        filepaths: List[str],
+        filenames: List[str],
+        selected: Optional[AbstractSet[str]] = None,
+    ) -> None:
+        # Appends files (e.g., a batch of a directory that is being listed).
+
+        if not filepaths:
+            return
+        if self._shown is not None:
+            # (hidden until the filter is applied again)
+            self._selection.add_files(filepaths, selected)
+            self._filenames.extend(filenames)
+            self._shown_bits.extend(bytes(len(filepaths)))
+            return
+        row: int = len(self._filenames)
+        self.beginInsertRows(QtCore.QModelIndex(), row, row + len(filepaths) - 1)
+        self._selection.add_files(filepaths, selected)
+        self._filenames.extend(filenames)
+        self.endInsertRows()
+
+    def insert_files(
+        self,
+        row: int,
+        filepaths: List[str],
+        filenames: List[str],
+        selected: Optional[bytes] = None,
+        highlighted: Optional[bytes] = None,
+    ) -> None:
+        # Inserts files before a row (see 'Selection.insert_files').
+
+        assert self._shown is None, "Cannot insert files while filtered"
+        self.beginInsertRows(QtCore.QModelIndex(), row, row + len(filepaths) - 1)
+        self._selection.insert_files(row, filepaths, selected, highlighted)
+        self._filenames[row:row] = filenames
+        self.endInsertRows()
+
+    def remove_rows(self, first: int, last: int) -> None:
+        assert self._shown is None, "Cannot remove files while filtered"
+        self.beginRemoveRows(QtCore.QModelIndex(), first, last)
+        self._selection.remove_rows(first, last)
+        del self._filenames[first : last + 1]
+        self.endRemoveRows()
+
+    def filenames(self) -> List[str]:
+        return self._filenames
+
+    def shown_bits(self) -> Optional[bytearray]:
+        # (None if all files are shown)
+        return self._shown_bits
+
+    def row(self, view_row: int) -> int:
+        # Returns the row (of the selection) of a view row.
+
+        return self._shown[view_row] if self._shown is not None else view_row
+
+    def view_row(self, row: int) -> Optional[int]:
+        # Returns the view row of a row, or None if the file is not shown.
+
+        if self._shown is None:
+            return row
+        view_row: int = bisect.bisect_left(self._shown, row)
+        if view_row < len(self._shown) and self._shown[view_row] == row:
+            return view_row
+        return None
+
+    def nearest_view_row(self, row: int) -> Optional[int]:
+        # Returns the view row of a row, or else of the next shown file (or else of the last
+        # one); None if no files are shown.
+
+        num_rows: int = self.rowCount()
+        if num_rows == 0:
+            return None
+        if self._shown is None:
+            return min(row, num_rows - 1)
+        return min(bisect.bisect_left(self._shown, row), num_rows - 1)
+
+    def view_ranges(self, ranges: Iterable[Tuple[int, int]]) -> List[Tuple[int, int]]:
+        # Returns the (first, last) view rows of ascending (first, last) rows (without the hidden
+        # files; ranges separated only by hidden files are merged).
+
+        if self._shown is None:
+            return list(ranges)
+        view_ranges: List[Tuple[int, int]] = []
+        for first, last in ranges:
+            first_view: int = bisect.bisect_left(self._shown, first)
+            last_view: int = bisect.bisect_right(self._shown, last) - 1
+            if last_view < first_view:
+                continue
+            if view_ranges and view_ranges[-1][1] == first_view - 1:
+                view_ranges[-1] = (view_ranges[-1][0], last_view)
+            else:
+                view_ranges.append((first_view, last_view))
+        return view_ranges
+
+    def row_ranges(self, view_ranges: Iterable[Tuple[int, int]]) -> List[Tuple[int, int]]:
+        # Returns the (first, last) rows of (first, last) view rows.
+
+        if self._shown is None:
+            return list(view_ranges)
+        ranges: List[Tuple[int, int]] = []
+        for first_view, last_view in view_ranges:
+            for row in self._shown[first_view : last_view + 1]:
+                if ranges and ranges[-1][1] == row - 1:
+                    ranges[-1] = (ranges[-1][0], row)
+                else:
+                    ranges.append((row, row))
+        return ranges
+
+    def checked_changed(self, rows: Optional[Tuple[int, int]] = None) -> None:
+        # Reports changed check states of the (first, last) view rows (by default, of all rows)
+        # with a single 'dataChanged'.
+
+        first, last = rows if rows is not None else (0, self.rowCount() - 1)
+        if last >= first:
+            self.dataChanged.emit(
+                self.index(first), self.index(last), [QtCore.Qt.CheckStateRole]
+            )
+
+
+class QueuedWorker(QtCore.QObject):
+    # Base of the workers of the file list, which run on the thread they are moved to: results
+    # are queued in batches, and taken by the file list ('take_batches'). Instead of a signal per
+    # batch, the file list is notified at most every '_NOTIFY_INTERVAL' seconds, and once the work
+    # is done (the batches queued by then are taken at once). Each worker has the generation of
+    # the list it works for, so that the results of a cancelled worker can be told apart.
+
+    _generation: int
+    _cancelled: threading.Event
+    _batches: Deque[object]
+    _t_notify: Optional[float]
+
+    # generation (batches are queued)
+    signal_ready: QtCore.Signal = QtCore.Signal(int)
+    # generation
+    signal_done: QtCore.Signal = QtCore.Signal(int)
+
+    def __init__(self, generation: int, parent: Optional[QtCore.QObject] = None) -> None:
+        super().__init__(parent)
+        self._generation = generation
+        self._cancelled = threading.Event()
+        self._batches = collections.deque()
+        self._t_notify = None
+
+    # protected
+    def _put(self, batch: object) -> None:
+        self._batches.append(batch)
+        t_now: float = time.monotonic()
+        if self._t_notify is None or t_now - self._t_notify >= _NOTIFY_INTERVAL:
+            self._t_notify = t_now
+            self.signal_ready.emit(self._generation)
+
+    # public
+    def generation(self) -> int:
+        return self._generation
+
+    def cancel(self) -> None:
+        # (thread-safe)
+        self._cancelled.set()
+
+    def take_batches(self) -> List[object]:
+        # Returns the queued batches, in order (thread-safe).
+
+        batches: List[object] = []
+        while self._batches:
+            batches.append(self._batches.popleft())
+        return batches
+
+
+class DirectoryLister(QueuedWorker):
+    # Lists the images of a directory (see 'scan_images'). The batches are tuples of file paths,
+    # file names (relative to the directory) and inodes (0 if unknown).
+
+    _dirpath: str
+    _options: ScanOptions
+
+    def __init__(
+        self,
+        dirpath: str,
+        options: ScanOptions,
+        generation: int,
+        parent: Optional[QtCore.QObject] = None,
+    ) -> None:
+        super().__init__(generation, parent)
+        self._dirpath = dirpath
+        self._options = options
+
+    def run(self) -> None:
+        prefix: int = len(os.path.join(self._dirpath, ""))
+        try:
+            for batch in scan_images(
+                self._dirpath, self._options, is_cancelled=self._cancelled.is_set
+            ):
+                self._put((
+                    [entry.path for entry in batch],
+                    [entry.path[prefix:] for entry in batch],
+                    [entry_inode(entry) for entry in batch],
+                ))
+        except OSError as e:
+            print(f"Cannot list '{self._dirpath}': {e}")
+        self.signal_done.emit(self._generation)
+
+
+class MetadataIndexer(QueuedWorker):
+    # Reads the metadata of files (see 'load_many': files in the metadata cache only cost a stat
+    # call) for the metadata index of the file list. The batches are lists of the metadata read
+    # ('ImageMetadata').
+
+    _paths: List[str]
+
+    def __init__(
+        self, paths: List[str], generation: int, parent: Optional[QtCore.QObject] = None
+    ) -> None:
+        super().__init__(generation, parent)
+        self._paths = paths
+
+    def run(self) -> None:
+        batch: List[ImageMetadata] = []
+        t_batch: float = time.monotonic()
+        for metadata in load_many(
+            self._paths, EXECUTOR_THREAD, max_workers=_INDEX_WORKERS, is_ordered=False
+        ):
+            if self._cancelled.is_set():
+                break
+            batch.append(metadata)
+            if (
+                len(batch) >= _INDEX_BATCH_SIZE
+                or time.monotonic() - t_batch >= _INDEX_BATCH_INTERVAL
+            ):
+                self._put(batch)
+                batch = []
+                t_batch = time.monotonic()
+        if batch and not self._cancelled.is_set():
+            self._put(batch)
+        self.signal_done.emit(self._generation)
 
 
 class FileList(QtWidgets.QWidget):
-    
+
     _dirpath: Optional[str]
-    _filepaths: List[str]
+    _options: ScanOptions
     _index_highlight: int
-    _selected: List[bool]
+    _is_loading: bool
+
+    # listing of the directory: generation of the current listing, running listings by
+    # generation, and the files to select and highlight once listed
+    _generation: int
+    _listings: Dict[int, Tuple[QtCore.QThread, DirectoryLister]]
+    _pending_selected: Optional[Set[str]]
+    _pending_highlighted: Optional[List[str]]
+
+    # changes of the directory (after loading): the watcher (or poll timer), the inodes of the
+    # listed files (to recognize files renamed by other programs), and the files of a running
+    # rescan (path -> (name, inode))
+    _watcher: QtCore.QFileSystemWatcher
+    _rescan_timer: QtCore.QTimer
+    _poll_timer: QtCore.QTimer
+    _dir_mtime: Optional[int]
+    _is_watching: bool
+    _is_rescan_pending: bool
+    _inodes: Dict[str, int]
+    _rescan: Optional[Dict[str, Tuple[str, int]]]
 
-    _file_tree: QtWidgets.QTreeWidget
+    # metadata filter: the index of the listed files (built once the filter is used, on worker
+    # threads), its generation (of the directory), the running indexers, and the query of the
+    # filter bar (None if no filter)
+    _index: MetadataIndex
+    _is_indexed: bool
+    _index_generation: int
+    _indexers: Dict[QtCore.QThread, MetadataIndexer]
+    _query: Optional[MetadataQuery]
+    _filter_timer: QtCore.QTimer
+
+    _selection: Selection
+    _model: FileListModel
+    _file_view: QtWidgets.QTableView
     _button_select: QtWidgets.QPushButton
     _button_deselect: QtWidgets.QPushButton
+    _button_subfolders: QtWidgets.QToolButton
     _checkbox_select_all: QtWidgets.QCheckBox
+    _button_sets: QtWidgets.QToolButton
     _selection_info: QtWidgets.QLabel
+    _filter_edit: QtWidgets.QLineEdit
+    _filter_info: QtWidgets.QLabel
 
     signal_load_directory: QtCore.Signal = QtCore.Signal(int)
     signal_selection_changed: QtCore.Signal = QtCore.Signal()
     signal_highlight_changed: QtCore.Signal = QtCore.Signal(str)
+    # emitted when files were added or removed after loading: number of files
+    signal_files_changed: QtCore.Signal = QtCore.Signal(int)
 
     def __init__(self, parent: Optional[QtWidgets.QWidget] = None) -> None:
         super().__init__(parent)
         self._dirpath = None
-        self._filepaths = []
+        self._options = ScanOptions()
         self._index_highlight = 0
-        self._selected = []
-        self._is_filetree_signals_blocked = False
-
-        self._file_tree = QtWidgets.QTreeWidget(parent=self)
-        self._file_tree.setAlternatingRowColors(True)
-        self._file_tree.setHeaderHidden(True)
-        self._file_tree.itemChanged.connect(self.on_check_select)
-        self._file_tree.setSelectionMode(QtWidgets.QAbstractItemView.ExtendedSelection)
-        self._file_tree.selectionModel().selectionChanged.connect(self.on_highlight)
+        self._is_loading = False
+        self._generation = 0
+        self._listings = {}
+        self._pending_selected = None
+        self._pending_highlighted = None
+        self._dir_mtime = None
+        self._is_watching = True
+        self._is_rescan_pending = False
+        self._inodes = {}
+        self._rescan = None
+        self._index = MetadataIndex()
+        self._is_indexed = False
+        self._index_generation = 0
+        self._indexers = {}
+        self._query = None
+
+        self._watcher = QtCore.QFileSystemWatcher(self)
+        self._watcher.directoryChanged.connect(self.on_directory_changed)
+        self._rescan_timer = QtCore.QTimer(self)
+        self._rescan_timer.setSingleShot(True)
+        self._rescan_timer.setInterval(_RESCAN_DELAY)
+        self._rescan_timer.timeout.connect(self.on_rescan)
+        self._poll_timer = QtCore.QTimer(self)
+        self._poll_timer.setInterval(_POLL_INTERVAL)
+        self._poll_timer.timeout.connect(self.on_poll)
+        self._filter_timer = QtCore.QTimer(self)
+        self._filter_timer.setSingleShot(True)
+        self._filter_timer.setInterval(_FILTER_DELAY)
+        self._filter_timer.timeout.connect(self.on_filter)
+
+        # a single-column table with fixed row heights: unlike a list view, it does not lay out
+        # every row, and it only requests the data of the visible rows
+        self._selection = Selection()
+        self._model = FileListModel(self._selection, self)
+        self._model.signal_checked.connect(self.on_check_select)
+        self._file_view = QtWidgets.QTableView(parent=self)
+        self._file_view.setModel(self._model)
+        self._file_view.horizontalHeader().hide()
+        self._file_view.horizontalHeader().setStretchLastSection(True)
+        self._file_view.verticalHeader().hide()
+        self._file_view.verticalHeader().setSectionResizeMode(QtWidgets.QHeaderView.Fixed)
+        self._file_view.verticalHeader().setDefaultSectionSize(
+            self._file_view.fontMetrics().height() + 6
+        )
+        self._file_view.setShowGrid(False)
+        self._file_view.setWordWrap(False)
+        self._file_view.setAlternatingRowColors(True)
+        self._file_view.setSelectionBehavior(QtWidgets.QAbstractItemView.SelectRows)
+        self._file_view.setSelectionMode(QtWidgets.QAbstractItemView.ExtendedSelection)
+        self._file_view.selectionModel().selectionChanged.connect(self.on_highlight)
         self._button_select: QtWidgets.QPushButton = QtWidgets.QPushButton(
             "Select highlighted", parent=self
         )
@@ -45,60 +504,529 @@ class FileList(QtWidgets.QWidget):
         )
         self._button_deselect.setEnabled(False)
         self._button_deselect.pressed.connect(lambda: self.on_select_highlight(False))
+
+        # recursive mode (include subfolders), with its options in the menu
+        self._button_subfolders: QtWidgets.QToolButton = QtWidgets.QToolButton(parent=self)
+        self._button_subfolders.setText("Subfolders")
+        self._button_subfolders.setToolTip("Include the images in subfolders")
+        self._button_subfolders.setCheckable(True)
+        self._button_subfolders.setPopupMode(QtWidgets.QToolButton.MenuButtonPopup)
+        self._button_subfolders.toggled.connect(self.on_subfolders)
+        menu_subfolders: QtWidgets.QMenu = QtWidgets.QMenu(self._button_subfolders)
+        menu_subfolders.addAction("Options...").triggered.connect(self.on_subfolder_options)
+        self._button_subfolders.setMenu(menu_subfolders)
         self._checkbox_select_all: QtWidgets.QCheckBox = QtWidgets.QCheckBox(
             "Select all", parent=self
         )
         self._checkbox_select_all.setEnabled(False)
         self._checkbox_select_all.toggled.connect(self.on_select_all)
+
+        # named selection sets
+        self._button_sets: QtWidgets.QToolButton = QtWidgets.QToolButton(parent=self)
+        self._button_sets.setText("Sets")
+        self._button_sets.setPopupMode(QtWidgets.QToolButton.InstantPopup)
+        menu_sets: QtWidgets.QMenu = QtWidgets.QMenu(self._button_sets)
+        menu_sets.aboutToShow.connect(lambda: self.on_menu_sets(menu_sets))
+        self._button_sets.setMenu(menu_sets)
         self._selection_info: QtWidgets.QLabel = QtWidgets.QLabel(parent=self)
 
+        # metadata filter
+        self._filter_edit: QtWidgets.QLineEdit = QtWidgets.QLineEdit(parent=self)
+        self._filter_edit.setPlaceholderText("Filter, e.g., ILCE-7C date:2023-04-22 time:14..16")
+        self._filter_edit.setToolTip(_FILTER_HELP)
+        self._filter_edit.setClearButtonEnabled(True)
+        self._filter_edit.textChanged.connect(lambda text: self._filter_timer.start())
+        self._filter_info: QtWidgets.QLabel = QtWidgets.QLabel(parent=self)
+
         button_layout: QtWidgets.QLayout = QtWidgets.QHBoxLayout()
         button_layout.setContentsMargins(0, 0, 0, 0)
         button_layout.addWidget(self._button_select)
         button_layout.addWidget(self._button_deselect)
+        button_layout.addWidget(self._button_subfolders)
+
+        filter_layout: QtWidgets.QLayout = QtWidgets.QHBoxLayout()
+        filter_layout.setContentsMargins(0, 0, 0, 0)
+        filter_layout.addWidget(self._filter_edit)
+        filter_layout.addWidget(self._filter_info)
 
         selection_layout: QtWidgets.QLayout = QtWidgets.QHBoxLayout()
         selection_layout.setContentsMargins(0, 0, 0, 0)
         selection_layout.addWidget(self._checkbox_select_all)
+        selection_layout.addWidget(self._button_sets)
         selection_layout.addWidget(self._selection_info, 0, QtCore.Qt.AlignRight)
 
         layout: QtWidgets.QLayout = QtWidgets.QVBoxLayout()
         layout.setContentsMargins(0, 0, 0, 0)
         layout.addItem(button_layout)
-        layout.addWidget(self._file_tree)
+        layout.addItem(filter_layout)
+        layout.addWidget(self._file_view)
         layout.addItem(selection_layout)
         self.setLayout(layout)
 
+    def _view_selection(self, view_ranges: Iterable[Tuple[int, int]]) -> QtCore.QItemSelection:
+        # Returns the selection of the given (first, last) rows of the view. The ranges are added
+        # as selections ('QItemSelection.select' drops a reference to None per call in PySide6
+        # 6.12, which adds up for thousands of ranges).
+
+        selection: QtCore.QItemSelection = QtCore.QItemSelection()
+        for first, last in view_ranges:
+            selection += QtCore.QItemSelection(self._model.index(first), self._model.index(last))
+        return selection
+
+    def _highlight_ranges(self, ranges: List[Tuple[int, int]]) -> None:
+        # Highlights the given (first, last) rows in the view with one selection (files that are
+        # not shown are not highlighted).
+
+        selection: QtCore.QItemSelection = self._view_selection(self._model.view_ranges(ranges))
+        self._file_view.selectionModel().select(
+            selection, QtCore.QItemSelectionModel.ClearAndSelect
+        )
+
+    def _set_files(
+        self,
+        filepaths: List[str],
+        filenames: List[str],
+        selected: Iterable[str],
+        highlighted: Iterable[str],
+    ) -> None:
+        # Resets the model (showing the files that match the filter), and highlights the given
+        # files in the view (without reporting it).
+
+        is_loading: bool = self._is_loading
+        self._is_loading = True
+        shown: Optional[bytearray] = None
+        if self._query is not None:
+            shown = self._index.match(self._query, filepaths)
+        self._model.set_files(filepaths, selected, highlighted, filenames, shown)
+        if shown is not None:
+            self._selection.keep_highlighted(shown)
+        ranges: List[Tuple[int, int]] = self._selection.highlighted_ranges()
+        if ranges:
+            self._highlight_ranges(ranges)
+        self._is_loading = is_loading
+
+    def _watch(self, dirpath: Optional[str]) -> None:
+        # Watches a directory for changes (or polls it, if it cannot be watched); None stops
+        # watching.
+
+        if self._watcher.directories():
+            self._watcher.removePaths(self._watcher.directories())
+        self._poll_timer.stop()
+        self._rescan_timer.stop()
+        self._dir_mtime = None
+        if dirpath is not None and not self._watcher.addPath(dirpath):
+            self._dir_mtime = self._directory_mtime(dirpath)
+            self._poll_timer.start()
+
+    def _watch_subdirectories(self) -> None:
+        # In recursive mode, also watches the subdirectories with listed files (up to
+        # '_MAX_WATCHED_DIRECTORIES'; new subdirectories are noticed in their parent directory).
+
+        if not self._options.is_recursive() or self._dirpath is None:
+            return
+        dirpaths: List[str] = sorted({filepath.rpartition(os.sep)[0] for filepath in self.paths()})
+        watched: Set[str] = set(self._watcher.directories())
+        missing: List[str] = [
+            dirpath for dirpath in dirpaths[:_MAX_WATCHED_DIRECTORIES] if dirpath not in watched
+        ]
+        if missing:
+            self._watcher.addPaths(missing)
+
+    def _display_name(self, filepath: str) -> str:
+        # the name of a file in the list: its path relative to the directory
+        prefix: str = os.path.join(self._dirpath, "")
+        if filepath.startswith(prefix):
+            return filepath[len(prefix) :]
+        return os.path.basename(filepath)
+
+    @staticmethod
+    def _directory_mtime(dirpath: str) -> Optional[int]:
+        try:
+            return os.stat(dirpath).st_mtime_ns
+        except OSError:
+            return None
+
+    def _apply_rescan(self, listed: Dict[str, Tuple[str, int]]) -> None:
+        # Compares the listed files with the list, and applies the differences. A removed file
+        # whose inode is listed under another path was renamed (and keeps its state).
+
+        removed: List[str] = [filepath for filepath in self.paths() if filepath not in listed]
+        added: Dict[str, str] = {
+            filepath: filename
+            for filepath, (filename, inode) in listed.items()
+            if self._selection.row(filepath) is None
+        }
+        renamed: Dict[str, str] = {}
+        if removed and added:
+            removed_inodes: Dict[int, str] = {
+                self._inodes[filepath]: filepath
+                for filepath in removed
+                if self._inodes.get(filepath)
+            }
+            for filepath in added:
+                old_filepath: Optional[str] = removed_inodes.get(listed[filepath][1])
+                if old_filepath is not None:
+                    renamed[old_filepath] = filepath
+        for filepath in removed:
+            self._inodes.pop(filepath, None)
+        for filepath in added:
+            self._inodes[filepath] = listed[filepath][1]
+
+        renamed_filepaths: Set[str] = set(renamed.values())
+        self._apply_changes(
+            [filepath for filepath in removed if filepath not in renamed],
+            {
+                filepath: filename
+                for filepath, filename in added.items()
+                if filepath not in renamed_filepaths
+            },
+            renamed,
+        )
+
+    def _apply_changes(
+        self, removed: List[str], added: Mapping[str, str], renamed: Mapping[str, str]
+    ) -> None:
+        # Removes, adds (path -> name) and renames (old path -> new path) files, keeping the
+        # rows sorted and the files selected and highlighted. Few changes are applied as row
+        # removals and insertions (so the view keeps its state); many changes reset the model.
+
+        selection: Selection = self._selection
+        is_loading: bool
+        first_highlighted: Optional[int] = selection.first_highlighted()
+        first_highlighted_path: Optional[str] = (
+            self.path_from_index(first_highlighted) if first_highlighted is not None else None
+        )
+
+        # rows to remove, and files to insert: path -> (name, selected, highlighted)
+        rows: Set[int] = set()
+        inserts: Dict[str, Tuple[str, bool, bool]] = {}
+        for old_filepath, new_filepath in renamed.items():
+            row: Optional[int] = selection.row(old_filepath)
+            if row is None:
+                continue
+            rows.add(row)
+            if selection.row(new_filepath) is None:
+                inserts[new_filepath] = (
+                    self._display_name(new_filepath),
+                    selection.is_selected(row),
+                    selection.is_highlighted(row),
+                )
+        for filepath in removed:
+            row = selection.row(filepath)
+            if row is not None:
+                rows.add(row)
+        for filepath, filename in added.items():
+            if filepath not in inserts and selection.row(filepath) is None:
+                inserts[filepath] = (filename, False, False)
+        if not rows and not inserts:
+            return
+        is_selection_changed: bool = any(selection.is_selected(row) for row in rows)
+        selection.rename_paths(renamed)
+        self._index.rename_paths(renamed)
+        self._index.remove_many(removed)
+
+        if (
+            len(rows) + len(inserts) > _MAX_INCREMENTAL_CHANGES
+            or self._model.shown_bits() is not None
+        ):
+            # reset (also while filtered): merge the remaining files with the inserted ones
+            kept: List[Tuple[str, str]] = [
+                (filepath, filename)
+                for row, (filepath, filename) in enumerate(
+                    zip(selection.filepaths(), self._model.filenames())
+                )
+                if row not in rows
+            ]
+            selected: List[str] = [
+                filepath
+                for filepath in selection.selected_paths()
+                if selection.row(filepath) not in rows
+            ]
+            highlighted: List[str] = [
+                filepath
+                for filepath in selection.highlighted_paths()
+                if selection.row(filepath) not in rows
+            ]
+            for filepath, (filename, is_selected, is_highlighted) in inserts.items():
+                kept.append((filepath, filename))
+                if is_selected:
+                    selected.append(filepath)
+                if is_highlighted:
+                    highlighted.append(filepath)
+            kept.sort(key=lambda file: sort_key(file[0]))
+            self._set_files(
+                [filepath for filepath, filename in kept],
+                [filename for filepath, filename in kept],
+                selected,
+                highlighted,
+            )
+
+        else:
+            # remove runs of rows, from the last one
+            sorted_rows: List[int] = sorted(rows, reverse=True)
+            i: int = 0
+            while i < len(sorted_rows):
+                last: int = sorted_rows[i]
+                first: int = last
+                i += 1
+                while i < len(sorted_rows) and sorted_rows[i] == first - 1:
+                    first = sorted_rows[i]
+                    i += 1
+                self._model.remove_rows(first, last)
+
+            # insert runs of files at their sorted positions, from the last one
+            keys: List[Tuple[str, str]] = [sort_key(filepath) for filepath in selection.filepaths()]
+            runs: List[Tuple[int, List[str]]] = []
+            for filepath in sorted(inserts, key=sort_key):
+                position: int = bisect.bisect_left(keys, sort_key(filepath))
+                if runs and runs[-1][0] == position:
+                    runs[-1][1].append(filepath)
+                else:
+                    runs.append((position, [filepath]))
+            highlighted_rows: List[Tuple[int, int]] = []
+            for position, run in reversed(runs):
+                self._model.insert_files(
+                    position,
+                    run,
+                    [inserts[filepath][0] for filepath in run],
+                    bytes(inserts[filepath][1] for filepath in run),
+                )
+                highlighted_rows = [
+                    (first + len(run), last + len(run)) for first, last in highlighted_rows
+                ]
+                highlighted_rows.extend(
+                    (position + j, position + j)
+                    for j, filepath in enumerate(run)
+                    if inserts[filepath][2]
+                )
+
+            # highlight the renamed files that were highlighted (without reporting it)
+            if highlighted_rows:
+                is_loading = self._is_loading
+                self._is_loading = True
+                highlight: QtCore.QItemSelection = self._view_selection(highlighted_rows)
+                self._file_view.selectionModel().select(
+                    highlight, QtCore.QItemSelectionModel.Select
+                )
+                self._is_loading = is_loading
+
+        is_selection_changed |= any(is_selected for _, is_selected, _ in inserts.values())
+
+        # if the highlighted files were removed, highlight the (shown) file that took their place
+        row_highlighted: Optional[int] = first_highlighted
+        first_highlighted = selection.first_highlighted()
+        view_row: Optional[int] = None
+        if first_highlighted is None and row_highlighted is not None:
+            view_row = self._model.nearest_view_row(row_highlighted)
+        if view_row is not None:
+            first_highlighted = self._model.row(view_row)
+            is_loading = self._is_loading
+            self._is_loading = True
+            self._highlight_ranges([(first_highlighted, first_highlighted)])
+            self._is_loading = is_loading
+
+        # index the new files (renamed files keep their metadata)
+        if self._is_indexed:
+            self._start_indexing(
+                [filepath for filepath in inserts if not self._index.is_indexed(filepath)]
+            )
+
+        # update buttons, UI and emit signals
+        self._button_select.setEnabled(first_highlighted is not None)
+        self._button_deselect.setEnabled(first_highlighted is not None)
+        self.update_ui()
+        self.signal_files_changed.emit(self.num_items())
+        if is_selection_changed:
+            self.signal_selection_changed.emit()
+        if first_highlighted is not None:
+            self._index_highlight = first_highlighted
+            path: str = self.path_from_index(first_highlighted)
+            if path != first_highlighted_path:
+                self.signal_highlight_changed.emit(path)
+        else:
+            self._index_highlight = 0
+
+    def _selection_changed(self) -> None:
+        # Repaints the check states of all rows, updates the UI and emits signal
+        # 'signal_selection_changed'.
+
+        self._model.checked_changed()
+        self.update_ui()
+        self.signal_selection_changed.emit()
+
+    def _cancel_listing(self) -> None:
+        # Cancels the running listing (its remaining batches are ignored).
+
+        self._generation += 1
+        for thread, lister in self._listings.values():
+            lister.cancel()
+
+    def _start_listing(self, dirpath: str) -> None:
+        # Creates and runs a directory-lister thread.
+
+        thread: QtCore.QThread = QtCore.QThread()
+        lister: DirectoryLister = DirectoryLister(dirpath, self._options, self._generation)
+        lister.moveToThread(thread)
+        thread.started.connect(lister.run)
+        lister.signal_ready.connect(self.on_listing_ready)
+        lister.signal_done.connect(self.on_listing_done)
+        lister.signal_done.connect(thread.quit)
+        thread.finished.connect(
+            lambda generation=self._generation: self._listings.pop(generation, None)
+        )
+        self._listings[self._generation] = (thread, lister)
+        thread.start()
+
+    def _start_indexing(self, filepaths: List[str]) -> None:
+        # Creates and runs a metadata-indexer thread for the given files.
+
+        if not filepaths:
+            return
+        thread: QtCore.QThread = QtCore.QThread()
+        indexer: MetadataIndexer = MetadataIndexer(filepaths, self._index_generation)
+        indexer.moveToThread(thread)
+        thread.started.connect(indexer.run)
+        indexer.signal_ready.connect(self.on_index_ready)
+        indexer.signal_done.connect(self.on_index_done)
+        indexer.signal_done.connect(thread.quit)
+        thread.finished.connect(lambda: self._indexers.pop(thread, None))
+        self._indexers[thread] = indexer
+        thread.start()
+        self._update_filter_info()
+
+    def _cancel_indexing(self) -> None:
+        # Cancels the running indexers, and clears the index (of the previous directory).
+
+        self._index_generation += 1
+        for indexer in self._indexers.values():
+            indexer.cancel()
+        self._index.clear()
+        self._is_indexed = False
+
+    def _is_indexing(self) -> bool:
+        return any(
+            indexer.generation() == self._index_generation for indexer in self._indexers.values()
+        )
+
+    def _apply_filter(self) -> None:
+        # Shows the files that match the query of the filter bar (all files without a query).
+        # The highlighted files that are hidden are unhighlighted; if none remain, the first shown
+        # file is highlighted.
+
+        shown: Optional[bytearray] = None
+        if self._query is not None:
+            shown = self._index.match(self._query, self.paths())
+        if shown == self._model.shown_bits():
+            self._update_filter_info()
+            return
+
+        first_highlighted: Optional[int] = self._selection.first_highlighted()
+        first_highlighted_path: Optional[str] = (
+            self.path_from_index(first_highlighted) if first_highlighted is not None else None
+        )
+        scroll_bar: QtWidgets.QScrollBar = self._file_view.verticalScrollBar()
+        scroll: int = scroll_bar.value()
+
+        # highlight changes are reported below
+        is_loading: bool = self._is_loading
+        self._is_loading = True
+        if shown is not None:
+            self._selection.keep_highlighted(shown)
+        self._model.set_shown(shown)
+        ranges: List[Tuple[int, int]] = self._selection.highlighted_ranges()
+        if not ranges and not is_loading and self._model.rowCount() > 0:
+            row: int = self._model.row(0)
+            ranges = [(row, row)]
+        if ranges:
+            self._highlight_ranges(ranges)
+        self._is_loading = is_loading
+        scroll_bar.setValue(scroll)
+
+        self.update_ui()
+        self._update_filter_info()
+        if is_loading:
+            return
+        first_highlighted = self._selection.first_highlighted()
+        self._button_select.setEnabled(first_highlighted is not None)
+        self._button_deselect.setEnabled(first_highlighted is not None)
+        if first_highlighted is not None:
+            self._index_highlight = first_highlighted
+            path: str = self.path_from_index(first_highlighted)
+            if path != first_highlighted_path:
+                self.signal_highlight_changed.emit(path)
+
+    def _set_query(self, query: MetadataQuery) -> None:
+        # Sets the query of the filter (an empty query shows all files), and applies it; the
+        # directory is indexed when the filter is first used.
+
+        self._query = query if not query.is_empty() else None
+        if self._query is not None and not self._is_indexed and not self._is_loading:
+            self._is_indexed = True
+            self._start_indexing(
+                [filepath for filepath in self.paths() if not self._index.is_indexed(filepath)]
+            )
+        self._apply_filter()
+
+    def _update_filter_info(self) -> None:
+        # Shows the progress of the index, or the number of files that match the filter.
+
+        if self._query is not None and self._is_indexing():
+            num_items: int = self.num_items()
+            num_indexed: int = min(self._index.num_files(), num_items)
+            self._filter_info.setText(f"Indexing {num_indexed}/{num_items}")
+        elif self._query is not None:
+            self._filter_info.setText(f"{self.num_shown()} match")
+        else:
+            self._filter_info.setText("")
+
     def clear(self) -> None:
-        # Clear file-tree, resets UI elements, reset all related attributes.
+        # Clear file-list, resets UI elements, reset all related attributes.
 
+        self._cancel_listing()
+        self._cancel_indexing()
+        self._watch(None)
+        self._is_loading = False
+        self._is_rescan_pending = False
+        self._pending_selected = None
+        self._pending_highlighted = None
+        self._inodes = {}
+        self._rescan = None
         self._dirpath = None
-        self._filepaths = []
         self._index_highlight = 0
-        self._selected = []
-        self._file_tree.clear()
+        self._model.set_files([], shown=bytearray() if self._query is not None else None)
         self._button_select.setEnabled(False)
         self._button_deselect.setEnabled(False)
         self.update_ui()
+        self._update_filter_info()
 
     def update_ui(self) -> None:
-        # Update the UI (file-tree dynamic UI elements: 'Select all', and the 'x/n selected'
-        # selection counter).
+        # Update the UI (file-list dynamic UI elements: 'Select all' (of the shown files), and
+        # the 'x/n selected' selection counter).
 
         num_items: int = self.num_items()
         num_selected: int = self.num_selected()
-        
+        num_shown: int = self.num_shown()
+        shown: Optional[bytearray] = self._model.shown_bits()
+        num_selected_shown: int = (
+            num_selected if shown is None else self._selection.num_selected_of(shown)
+        )
+
         # update checkbox 'Select all'
         is_checkbox_signals_blocked: bool = self._checkbox_select_all.blockSignals(True)
         self._checkbox_select_all.setEnabled(False)
         self._checkbox_select_all.setCheckState(QtCore.Qt.Unchecked)
-        if num_items > 0:
+        if num_shown > 0:
             self._checkbox_select_all.setEnabled(True)
-            if num_selected == num_items:
+            if num_selected_shown == num_shown:
                 self._checkbox_select_all.setCheckState(QtCore.Qt.Checked)
 
         # update 'x/n selected' selection counter
-        self._selection_info.setText(f'{num_selected}/{num_items} selected')
+        if shown is None:
+            self._selection_info.setText(f'{num_selected}/{num_items} selected')
+        else:
+            self._selection_info.setText(
+                f'{num_selected}/{num_items} selected ({num_selected_shown}/{num_shown} shown)'
+            )
 
         # restore signals
         self._checkbox_select_all.blockSignals(is_checkbox_signals_blocked)
@@ -106,86 +1034,38 @@ class FileList(QtWidgets.QWidget):
     def load_directory(
         self,
         dirpath: str,
-        selected_filepaths: Optional[List[str]] = None,
-        highlighted_filepaths: Optional[List[str]] = None,
+        selected_filepaths: Optional[Iterable[str]] = None,
+        highlighted_filepaths: Optional[Iterable[str]] = None,
     ) -> None:
         # Loads a directory: lists all files that end with '.jpg' or .jpeg' (case insensitive)
-        # within the directory. Optionally, files to be highlighted and selected can be provided
-        # as arguments.
+        # within the directory, on a worker thread. The files are added to the list in batches as
+        # they are found, and sorted once the listing is complete; then signal
+        # 'signal_load_directory' is emitted. Optionally, files to be highlighted and selected
+        # can be provided as arguments (restored in linear time).
 
         assert os.path.exists(dirpath), f"'{dirpath}' does not exist!"
 
-        is_items_highlighted: bool = False
-
-        # temporarily block signals
-        is_filetree_signals_blocked: bool = self._file_tree.blockSignals(True)
-
-        # clear state
+        # clear state (cancels a running listing)
         self.clear()
         self._dirpath = dirpath
 
-        # add items to file-tree
-        try:
-            filenames: List[str] = os.listdir(dirpath)
-            filenames.sort()
-            for filename in filenames:
-                filepath: str = os.path.join(dirpath, filename)
-                if os.path.isfile(filepath) and filename.lower().endswith(
-                    (".jpg", ".jpeg")
-                ):
-                    self._filepaths.append(filepath)
-
-                    # create file-tree items
-                    item: QtWidgets.QTreeWidgetItem = QtWidgets.QTreeWidgetItem(
-                        self._file_tree, [filename]
-                    )
-
-                    # configure item selection
-                    is_selected: bool = False
-                    if selected_filepaths is not None:
-                        is_selected: bool = filepath in selected_filepaths
-                    self._selected.append(is_selected)
-                    checkstate: QtCore.Qt.CheckState = (
-                        QtCore.Qt.Checked if is_selected else QtCore.Qt.Unchecked
-                    )
-                    item.setCheckState(0, checkstate)
-
-                    # configure item highlighting
-                    is_highlighted: bool = False
-                    if highlighted_filepaths is not None:
-                        is_highlighted = filepath in highlighted_filepaths
-                        if is_highlighted:
-                            is_items_highlighted = True
-                    item.setSelected(is_highlighted)
-            
-            # select first item and update buttons
-            if self.num_items() > 0:
-
-                # select first item
-                if not is_items_highlighted:
-                    first_item: QtWidgets.QTreeWidgetItem = self._file_tree.topLevelItem(0)
-                    first_item.setSelected(True)
-                
-                # enable buttons
-                self._button_select.setEnabled(True)
-                self._button_deselect.setEnabled(True)
-            
-            # update user interface
-            self.update_ui()
-
-        except PermissionError:
-            pass
-
-        # restore signals
-        self._file_tree.blockSignals(is_filetree_signals_blocked)
+        # highlight changes are not reported while loading
+        self._is_loading = True
+        self._pending_selected = set(selected_filepaths) if selected_filepaths else None
+        self._pending_highlighted = (
+            list(highlighted_filepaths) if highlighted_filepaths is not None else None
+        )
+        self._selection_info.setText("Listing...")
+        self._start_listing(dirpath)
+        self._watch(dirpath)
 
-        # emit signal
-        self.signal_load_directory.emit(self.num_items())
+    def is_loading(self) -> bool:
+        return self._is_loading
 
     def reload(
         self,
-        selected_filepaths: Optional[List[str]] = None,
-        highlighted_filepaths: Optional[List[str]] = None,
+        selected_filepaths: Optional[Iterable[str]] = None,
+        highlighted_filepaths: Optional[Iterable[str]] = None,
     ) -> None:
         return self.load_directory(
             self._dirpath,
@@ -193,161 +1073,501 @@ class FileList(QtWidgets.QWidget):
             highlighted_filepaths=highlighted_filepaths,
         )
 
+    def apply_renames(self, renamed: Mapping[str, str]) -> None:
+        # Applies renames (old path -> new path), e.g., of a file modification, without listing
+        # the directory: the renamed files keep their rows' state, and the named selection sets
+        # are updated.
+
+        if self._dirpath is None or not renamed:
+            return
+        for old_filepath, new_filepath in renamed.items():
+            # (the file may have been replaced)
+            self._inodes.pop(old_filepath, None)
+        # files moved to another directory are removed
+        self._apply_changes(
+            [
+                old_filepath
+                for old_filepath, new_filepath in renamed.items()
+                if os.path.dirname(new_filepath) != os.path.dirname(old_filepath)
+            ],
+            {},
+            {
+                old_filepath: new_filepath
+                for old_filepath, new_filepath in renamed.items()
+                if os.path.dirname(new_filepath) == os.path.dirname(old_filepath)
+            },
+        )
+
+    def scan_options(self) -> ScanOptions:
+        return self._options
+
+    def set_scan_options(self, options: ScanOptions) -> None:
+        # Sets which files are listed (e.g., also those in subfolders), and lists the loaded
+        # directory again (keeping the selected and highlighted files).
+
+        self._options = options
+        is_blocked: bool = self._button_subfolders.blockSignals(True)
+        self._button_subfolders.setChecked(options.is_recursive())
+        self._button_subfolders.blockSignals(is_blocked)
+        if self._dirpath is not None:
+            self.reload(
+                selected_filepaths=self.selected_paths(),
+                highlighted_filepaths=self.highlighted_paths(),
+            )
+
+    def set_watching(self, is_watching: bool) -> None:
+        # Pauses (e.g., while files are modified) or resumes applying changes of the directory;
+        # when resumed, the directory is compared once with the list.
+
+        self._is_watching = is_watching
+        if is_watching:
+            self._rescan_timer.start()
+        else:
+            self._rescan_timer.stop()
+            if self._rescan is not None:
+                self._cancel_listing()
+                self._rescan = None
+
     def increment_highlight(self, increment: int = 1) -> Optional[str]:
         # Changes the highlighted item as an (positive or negative) incremenet from the first
-        # highlighted item. Function returns the path of the new highlighted item if the tree
+        # highlighted item. Function returns the path of the new highlighted item if the list
         # contains items; otherwise it will return None.
 
-        num_paths: int = self.num_items()
-        if num_paths > 0:
-            new_index: int = (self._index_highlight + increment) % num_paths
-            self._index_highlight = new_index
-            item: QtWidgets.QTreeWidgetItem = self._file_tree.topLevelItem(new_index)
-            self._file_tree.setCurrentItem(item)
-            return self.path_from_index(new_index)
+        # (through the shown files)
+        num_shown: int = self.num_shown()
+        if num_shown > 0:
+            view_row: int = self._model.nearest_view_row(self._index_highlight)
+            new_view_row: int = (view_row + increment) % num_shown
+            self._index_highlight = self._model.row(new_view_row)
+            index: QtCore.QModelIndex = self._model.index(new_view_row)
+            self._file_view.setCurrentIndex(index)
+            self._file_view.scrollTo(index)
+            return self.path_from_index(self._index_highlight)
         return None
 
-    def next_highlight(self) -> str:
+    def next_highlight(self) -> Optional[str]:
         # Returns the path of the next highlighted item (increment +1).
 
         return self.increment_highlight(1)
 
-    def previous_highlight(self) -> str:
+    def previous_highlight(self) -> Optional[str]:
         # Returns the path of the previous highlighted item (increment -1).
 
         return self.increment_highlight(-1)
 
-    def item_with_path(self, path: str) -> Optional[QtWidgets.QTreeWidgetItem]:
-        if path in self._filepaths:
-            index: int = self._filepaths.index(path)
-            return self._file_tree.topLevelItem(index)
-        return None
+    def index_with_path(self, path: str) -> Optional[int]:
+        return self._selection.row(path)
 
-    def item_with_text(self, text: str) -> Optional[QtWidgets.QTreeWidgetItem]:
-        for i in range(self._file_tree.topLevelItemCount()):
-            item = self._file_tree.topLevelItem(i)
-            if item.text(0) == text:
-                return item
-        return None
+    def index_with_text(self, text: str) -> Optional[int]:
+        if self._dirpath is None:
+            return None
+        return self._selection.row(os.path.join(self._dirpath, text))
 
     def select_item_with_text(self, text: str) -> None:
-        item: Optional[QtWidgets.QTreeWidgetItem] = self.item_with_text(text)
-        if item is not None:
-            self._file_tree.setCurrentItem(item)
+        index: Optional[int] = self.index_with_text(text)
+        view_row: Optional[int] = self._model.view_row(index) if index is not None else None
+        if view_row is not None:
+            self._file_view.setCurrentIndex(self._model.index(view_row))
 
     def path_from_index(self, index: int) -> str:
         # Returns the file-path of the item at a given index.
-        
+
         assert index < self.num_items()
-        return self._filepaths[index]
+        return self._selection.filepaths()[index]
 
     def paths(self) -> List[str]:
         # Returns all file-paths.
 
-        return self._filepaths
+        return self._selection.filepaths()
 
     def selected_paths(self) -> List[str]:
-        return [path for i, path in enumerate(self._filepaths) if self._selected[i]]
+        return self._selection.selected_paths()
 
     def highlighted_paths(self) -> List[str]:
-        return [
-            self._filepaths[self._file_tree.indexOfTopLevelItem(item)]
-            for item in self._file_tree.selectedItems()
-        ]
+        return self._selection.highlighted_paths()
+
+    def highlight_all(self) -> None:
+        # Highlights all shown files.
+
+        self._file_view.selectAll()
 
     def num_items(self) -> int:
-        return len(self._filepaths)
+        return self._selection.num_files()
 
     def num_highlighted(self) -> int:
-        return len(self._file_tree.selectedItems())
+        return self._selection.num_highlighted()
+
+    def num_shown(self) -> int:
+        # Returns the number of files shown (that match the filter).
+
+        return self._model.rowCount()
 
     def num_selected(self) -> int:
-        return sum(self._selected)
-    
+        return self._selection.num_selected()
+
+    def filter_text(self) -> str:
+        return self._filter_edit.text()
+
+    def set_filter(self, text: str) -> None:
+        # Filters the files by their metadata (see 'MetadataIndex'), at once; raises 'ValueError'
+        # if the query is invalid.
+
+        is_blocked: bool = self._filter_edit.blockSignals(True)
+        self._filter_edit.setText(text)
+        self._filter_edit.blockSignals(is_blocked)
+        self._filter_timer.stop()
+        query: MetadataQuery = MetadataQuery.parse(text)
+        self._set_query(query)
+
+    def is_indexing(self) -> bool:
+        return self._is_indexing()
+
+    def is_indexed(self) -> bool:
+        # Returns whether the listed files are indexed (once the filter is first used).
+
+        return self._is_indexed
+
+    def add_metadata(self, metadatas: Iterable[ImageMetadata]) -> None:
+        # Adds metadata that was read elsewhere to the index (of the files that are listed), and
+        # applies the filter again. Files indexed this way are not read when the filter is first
+        # used.
+
+        self._index.add_many(
+            metadata for metadata in metadatas if self._selection.row(metadata.path()) is not None
+        )
+        if self._query is not None:
+            self._apply_filter()
+
+    def update_metadata(self, filepaths: Iterable[str]) -> None:
+        # Indexes the metadata of listed files again (e.g., after their date taken was changed).
+
+        if self._is_indexed:
+            self._start_indexing(
+                [filepath for filepath in filepaths if self._selection.row(filepath) is not None]
+            )
+
+    def selection_sets(self) -> List[str]:
+        return self._selection.set_names()
+
+    def save_selection_set(self, name: str) -> None:
+        # Saves the selected files as a named set.
+
+        self._selection.save_set(name)
+
+    def restore_selection_set(self, name: str, operation: Optional[str] = None) -> None:
+        # Selects the files of a named set, or combines the set with the selection (see
+        # 'Selection.restore_set').
+
+        self._selection.restore_set(name, operation)
+        self._selection_changed()
+
+    def remove_selection_set(self, name: str) -> None:
+        self._selection.remove_set(name)
+
     # handlers
+    def on_listing_ready(self, generation: int) -> None:
+        # Adds the queued batches of listed files (unsorted) to the list, or collects them for a
+        # rescan.
+
+        if generation != self._generation:
+            return
+        batches: List[object] = self._listings[generation][1].take_batches()
+        if not batches:
+            return
+        filepaths: List[str] = []
+        filenames: List[str] = []
+        inodes: List[int] = []
+        for batch_filepaths, batch_filenames, batch_inodes in batches:
+            filepaths.extend(batch_filepaths)
+            filenames.extend(batch_filenames)
+            inodes.extend(batch_inodes)
+        if self._rescan is not None:
+            self._rescan.update(zip(filepaths, zip(filenames, inodes)))
+            return
+        self._inodes.update(zip(filepaths, inodes))
+        self._model.add_files(filepaths, filenames, self._pending_selected)
+        self._selection_info.setText(f"Listing... {self.num_items()} files")
+
+    def on_listing_done(self, generation: int) -> None:
+        # Sorts the listed files, restores the selected and highlighted files (also those changed
+        # during the listing), updates UI and emits signal 'signal_load_directory'.
+
+        if generation != self._generation:
+            return
+        self.on_listing_ready(generation)
+        if self._rescan is not None:
+            listed: Dict[str, Tuple[str, int]] = self._rescan
+            self._rescan = None
+            self._apply_rescan(listed)
+            self._watch_subdirectories()
+            if self._is_rescan_pending:
+                self._is_rescan_pending = False
+                self._rescan_timer.start()
+            return
+
+        files: List[Tuple[str, str]] = sorted(
+            zip(self._selection.filepaths(), self._model.filenames()),
+            key=lambda file: sort_key(file[0]),
+        )
+        filepaths: List[str] = [filepath for filepath, filename in files]
+        filenames: List[str] = [filename for filepath, filename in files]
+        selected: List[str] = self._selection.selected_paths()
+        highlighted: List[str] = self._selection.highlighted_paths()
+        if self._pending_highlighted:
+            highlighted.extend(self._pending_highlighted)
+        self._pending_selected = None
+        self._pending_highlighted = None
+        self._set_files(filepaths, filenames, selected, highlighted)
+
+        # select first item and update buttons
+        if self.num_shown() > 0:
+
+            # highlight the given files, or else the first (shown) file
+            ranges: List[Tuple[int, int]] = self._selection.highlighted_ranges()
+            if not ranges:
+                row: int = self._model.row(0)
+                ranges = [(row, row)]
+                self._highlight_ranges(ranges)
+            self._index_highlight = ranges[0][0]
+            self._file_view.scrollTo(
+                self._model.index(self._model.view_row(self._index_highlight))
+            )
+
+            # enable buttons
+            self._button_select.setEnabled(True)
+            self._button_deselect.setEnabled(True)
+
+        # update user interface, and index the files for the filter
+        self.update_ui()
+        self._is_loading = False
+        if self._query is not None:
+            self._is_indexed = True
+            self._start_indexing(list(self.paths()))
+
+        # emit signal
+        self.signal_load_directory.emit(self.num_items())
+
+        # apply the changes made while listing
+        self._watch_subdirectories()
+        if self._is_rescan_pending:
+            self._is_rescan_pending = False
+            self._rescan_timer.start()
+
+    def on_index_ready(self, generation: int) -> None:
+        # Adds the queued batches of metadata to the index (of the files that are still listed),
+        # and applies the filter again (at most every '_FILTER_DELAY' ms).
+
+        if generation != self._index_generation:
+            return
+        metadatas: List[ImageMetadata] = [
+            metadata
+            for indexer in self._indexers.values()
+            if indexer.generation() == generation
+            for batch in indexer.take_batches()
+            for metadata in batch
+        ]
+        if not metadatas:
+            return
+        self._index.add_many(
+            metadata for metadata in metadatas if self._selection.row(metadata.path()) is not None
+        )
+        if self._query is not None and not self._filter_timer.isActive():
+            self._filter_timer.start()
+        self._update_filter_info()
+
+    def on_index_done(self, generation: int) -> None:
+        self.on_index_ready(generation)
+        if generation == self._index_generation and self._query is not None:
+            self._filter_timer.start()
+
+    def on_filter(self) -> None:
+        # Applies the query of the filter bar (an invalid query is shown, and ignored).
+
+        try:
+            query: MetadataQuery = MetadataQuery.parse(self._filter_edit.text())
+        except ValueError as e:
+            self._filter_info.setText("Invalid filter")
+            self._filter_info.setToolTip(str(e))
+            return
+        self._filter_info.setToolTip("")
+        self._set_query(query)
+
+    def on_directory_changed(self, path: str) -> None:
+        if self._is_watching:
+            # (restarted by each change)
+            self._rescan_timer.start()
+
+    def on_poll(self) -> None:
+        mtime: Optional[int] = self._directory_mtime(self._dirpath)
+        if mtime != self._dir_mtime:
+            self._dir_mtime = mtime
+            if self._is_watching:
+                self._rescan_timer.start()
+
+    def on_rescan(self) -> None:
+        # Lists the directory again (on a worker thread), to apply the differences.
+
+        if self._dirpath is None or not self._is_watching:
+            return
+        if self._is_loading or self._rescan is not None:
+            self._is_rescan_pending = True
+            return
+        self._cancel_listing()
+        self._rescan = {}
+        self._start_listing(self._dirpath)
+
     def on_highlight(
         self, selected: QtCore.QItemSelection, deselected: QtCore.QItemSelection
     ) -> None:
         # Updates buttons 'Select highlighted' and 'Deselect highlighted', and emits signal
         # 'signal_highlight_changed' after a highlight change was made.
 
-        # only update if signals are not blocked, because the selectionChanged signal cannot be blocked
-        if not self._file_tree.signalsBlocked():
-        
-            # update 'Select highlighted' and 'Deselect highlighted' buttons
-            if self.num_highlighted() > 0:
-                self._button_select.setEnabled(True)
-                self._button_deselect.setEnabled(True)
+        # keep the highlighted bitset in sync with the view (only the changed ranges)
+        self._selection.set_highlighted_ranges(
+            self._model.row_ranges(
+                (selection_range.top(), selection_range.bottom()) for selection_range in deselected
+            ),
+            False,
+        )
+        self._selection.set_highlighted_ranges(
+            self._model.row_ranges(
+                (selection_range.top(), selection_range.bottom()) for selection_range in selected
+            ),
+            True,
+        )
+        if self._is_loading:
+            return
 
-                # find first highlighted item
-                first_item: QtWidgets.QTreeWidgetItem = self._file_tree.selectedItems()[0]
-                first_item_index: int = self._file_tree.indexOfTopLevelItem(first_item)
+        # update 'Select highlighted' and 'Deselect highlighted' buttons
+        first_item_index: Optional[int] = self._selection.first_highlighted()
+        if first_item_index is not None:
+            self._button_select.setEnabled(True)
+            self._button_deselect.setEnabled(True)
 
-                # if first highlighted item changed
-                if first_item_index != self._index_highlight:
-                    self._index_highlight = first_item_index
-                    path: str = self.path_from_index(first_item_index)
-                    self.signal_highlight_changed.emit(path)
+            # if first highlighted item changed
+            if first_item_index != self._index_highlight:
+                self._index_highlight = first_item_index
+                path: str = self.path_from_index(first_item_index)
+                self.signal_highlight_changed.emit(path)
 
-            else:
-                # disable buttons
-                self._button_select.setEnabled(False)
-                self._button_deselect.setEnabled(False)
+        else:
+            # disable buttons
+            self._button_select.setEnabled(False)
+            self._button_deselect.setEnabled(False)
 
-    def on_check_select(self, item: QtWidgets.QTreeWidgetItem, column: int) -> None:
-        # Updates 'self._selected' and UI after an item selection was changed via its checkbox.
+    def on_check_select(self, row: int) -> None:
+        # Updates UI after an item selection was changed via its checkbox.
 
-        is_selected: bool = item.checkState(column) == QtCore.Qt.Checked
-        index: int = self._file_tree.indexOfTopLevelItem(item)
-        self._selected[index] = is_selected
-        
         self.update_ui()
         self.signal_selection_changed.emit()
 
     def on_select_highlight(self, is_selected: bool) -> None:
-        # Updates the checkboxes of highlighted items, 'self._selected' and UI, after the 'Select
-        # highlighted' or 'Deselect highlighted' buttons were pressed.
+        # Updates the checkboxes of highlighted items and UI, after the 'Select highlighted' or
+        # 'Deselect highlighted' buttons were pressed.
+
+        self._selection.select_highlighted(is_selected)
+        self._selection_changed()
 
-        checkstate: QtCore.Qt.CheckState = (
-            QtCore.Qt.Checked if is_selected else QtCore.Qt.Unchecked
+    def on_select_all(self, is_selected: bool) -> None:
+        # Updates the checkboxes of all (shown) items and UI after the 'Select all' button was
+        # pressed.
+
+        shown: Optional[bytearray] = self._model.shown_bits()
+        if shown is None:
+            self._selection.set_selected_all(is_selected)
+        else:
+            self._selection.select_bits(shown, is_selected)
+        self._selection_changed()
+
+    def on_subfolders(self, is_checked: bool) -> None:
+        options: ScanOptions = self._options
+        self.set_scan_options(
+            ScanOptions(is_checked, options.max_depth(), options.include(), options.exclude())
         )
 
-        # temporarily block signals
-        is_filetree_signals_blocked: bool = self._file_tree.blockSignals(True)
+    def on_subfolder_options(self) -> None:
+        dialog: ScanOptionsDialog = ScanOptionsDialog(self._options, self)
+        if dialog.exec() == QtWidgets.QDialog.Accepted:
+            self.set_scan_options(dialog.options())
 
-        # update selected items
-        for item in self._file_tree.selectedItems():
-            index: int = self._file_tree.indexOfTopLevelItem(item)
-            self._selected[index] = is_selected
-            item.setCheckState(0, checkstate)
-        
-        # restore signals
-        self._file_tree.blockSignals(is_filetree_signals_blocked)
+    def on_menu_sets(self, menu: QtWidgets.QMenu) -> None:
+        # Fills the menu of named selection sets before it is shown.
 
-        # update UI and emit signal
-        self.update_ui()        
-        self.signal_selection_changed.emit()
+        menu.clear()
+        action_save: QtGui.QAction = menu.addAction("Save selection as...")
+        action_save.setEnabled(self.num_selected() > 0)
+        action_save.triggered.connect(self.on_save_set)
+        names: List[str] = self.selection_sets()
+        if names:
+            menu.addSeparator()
+        for name in names:
+            submenu: QtWidgets.QMenu = menu.addMenu(name)
+            for text, operation in _SET_ACTIONS:
+                submenu.addAction(text).triggered.connect(
+                    lambda is_checked=False, name=name, operation=operation: (
+                        self.restore_selection_set(name, operation)
+                    )
+                )
+            submenu.addSeparator()
+            submenu.addAction("Delete").triggered.connect(
+                lambda is_checked=False, name=name: self.remove_selection_set(name)
+            )
 
-    def on_select_all(self, is_selected: bool) -> None:
-        # Updates the checkboxes of all items, 'self._selected' and UI after the 'Select all'
-        # button was pressed.
+    def on_save_set(self) -> None:
+        name, is_ok = QtWidgets.QInputDialog.getText(self, "Save selection", "Name:")
+        if is_ok and name.strip():
+            self.save_selection_set(name.strip())
+
+
+class ScanOptionsDialog(QtWidgets.QDialog):
+    # Edits the options of the recursive mode (see 'ScanOptions'): the depth limit, and the
+    # include and exclude globs (separated by spaces or ';').
+
+    _is_recursive: QtWidgets.QCheckBox
+    _max_depth: QtWidgets.QSpinBox
+    _include: QtWidgets.QLineEdit
+    _exclude: QtWidgets.QLineEdit
+
+    def __init__(self, options: ScanOptions, parent: Optional[QtWidgets.QWidget] = None) -> None:
+        super().__init__(parent)
+        self.setWindowTitle("Subfolders")
 
-        checkstate: QtCore.Qt.CheckState = (
-            QtCore.Qt.Checked if is_selected else QtCore.Qt.Unchecked
+        self._is_recursive = QtWidgets.QCheckBox("Include subfolders", parent=self)
+        self._is_recursive.setChecked(options.is_recursive())
+
+        # 0 = no limit
+        self._max_depth = QtWidgets.QSpinBox(parent=self)
+        self._max_depth.setRange(0, 99)
+        self._max_depth.setSpecialValueText("No limit")
+        self._max_depth.setValue(options.max_depth() or 0)
+
+        self._include = QtWidgets.QLineEdit(" ".join(options.include()), parent=self)
+        self._include.setPlaceholderText("All images, e.g., DSC*.jpg")
+        self._exclude = QtWidgets.QLineEdit(" ".join(options.exclude()), parent=self)
+        self._exclude.setPlaceholderText("Nothing, e.g., .* *thumb*")
+
+        buttons: QtWidgets.QDialogButtonBox = QtWidgets.QDialogButtonBox(
+            QtWidgets.QDialogButtonBox.Ok | QtWidgets.QDialogButtonBox.Cancel, parent=self
         )
+        buttons.accepted.connect(self.accept)
+        buttons.rejected.connect(self.reject)
 
-        # temporarily block signals
-        is_filetree_signals_blocked: bool = self._file_tree.blockSignals(True)
+        layout: QtWidgets.QFormLayout = QtWidgets.QFormLayout()
+        layout.addRow(self._is_recursive)
+        layout.addRow("Depth limit:", self._max_depth)
+        layout.addRow("Include:", self._include)
+        layout.addRow("Exclude:", self._exclude)
+        layout.addRow(buttons)
+        self.setLayout(layout)
 
-        # update selected items
-        for i, _ in enumerate(self._selected):
-            self._selected[i] = is_selected
-            item: QtWidgets.QTreeWidgetItem = self._file_tree.topLevelItem(i)
-            item.setCheckState(0, checkstate)
-        
-        # restore signals
-        self._file_tree.blockSignals(is_filetree_signals_blocked)
+    @staticmethod
+    def _globs(text: str) -> List[str]:
+        return text.replace(";", " ").split()
 
-        # update UI and emit signal
-        self.update_ui()        
-        self.signal_selection_changed.emit()
+    def options(self) -> ScanOptions:
+        return ScanOptions(
+            self._is_recursive.isChecked(),
+            self._max_depth.value() or None,
+            self._globs(self._include.text()),
+            self._globs(self._exclude.text()),
+        )
@@ -1,17 +1,23 @@
 from __future__ import annotations
-import os
 import time
-from typing import List, Optional
+import concurrent.futures
+from typing import Dict, List, Optional, Union
 
 from PySide6 import QtCore, QtWidgets
 
-from package.Image import Image, ImageExif, ImagePiexif
+from package.FileOperation import EXECUTOR_PROCESS
 from package.FileEdit import FileEdit
+from package.FilePlan import OUTPUT_REWRITE, OUTPUT_SIDECAR, FilePlan
+from package.PlanExecutor import PlanExecutor
+from package.PlanView import PlanDialog
+from package.Rules import Rules
 
 
 class FileModify(QtWidgets.QWidget):
 
     _is_send2trash: bool
+    _output: str
+    _is_sidecar_rename: bool
 
     _UPDATE_RATIO: float = 0.3
     _t_previous: float
@@ -22,12 +28,18 @@ class FileModify(QtWidgets.QWidget):
     _file_edit: FileEdit
 
     _button_modify: QtWidgets.QPushButton
+    _button_preview: QtWidgets.QPushButton
     _progress_bar: QtWidgets.QProgressBar
     _status_label: QtWidgets.QLabel
     _thread: Optional[QtCore.QThread]
     _modifier: Optional[FileModifier]
+    _planner_thread: Optional[QtCore.QThread]
+    _planner: Optional[PlanBuilder]
+    _is_preview: bool
 
     signal_done: QtCore.Signal = QtCore.Signal(bool)
+    # emitted before 'signal_done' (True): the renamed files (old path -> new path)
+    signal_renamed: QtCore.Signal = QtCore.Signal(dict)
 
     def __init__(
         self, file_edit: FileEdit, parent: Optional[QtWidgets.QWidget]
@@ -35,7 +47,12 @@ class FileModify(QtWidgets.QWidget):
         super().__init__(parent)
         self._thread = None
         self._modifier = None
+        self._planner_thread = None
+        self._planner = None
+        self._is_preview = False
         self._is_send2trash = True
+        self._output = OUTPUT_REWRITE
+        self._is_sidecar_rename = True
         self._t_previous = 0.0
         self._t_delta = 0.0
 
@@ -60,6 +77,11 @@ class FileModify(QtWidgets.QWidget):
         )  # dependency: button-modify
         button_layout.addWidget(self._button_modify)
 
+        self._button_preview: QtWidgets.QPushButton = QtWidgets.QPushButton("Preview plan")
+        self._button_preview.setEnabled(False)
+        self._button_preview.pressed.connect(self.on_preview_button_pressed)
+        button_layout.addWidget(self._button_preview)
+
         self._button_stop: QtWidgets.QPushButton = QtWidgets.QPushButton("Stop")
         self._button_stop.pressed.connect(self.on_stop)
         self._button_stop.setEnabled(False)
@@ -94,6 +116,7 @@ class FileModify(QtWidgets.QWidget):
         self._modified_filepaths = []
         is_checked_fileedit: bool = self._file_edit.is_checked()
         self._button_modify.setEnabled(is_checked_fileedit)
+        self._button_preview.setEnabled(is_checked_fileedit)
 
     def has_images(self) -> bool:
         # Returns whether image file-paths are saved.
@@ -105,6 +128,7 @@ class FileModify(QtWidgets.QWidget):
 
         self._filepaths = []
         self._button_modify.setEnabled(False)
+        self._button_preview.setEnabled(False)
 
     def update_progress(self, n: int) -> None:
         if n == 0:
@@ -132,8 +156,10 @@ class FileModify(QtWidgets.QWidget):
             seconds = total_seconds % 60
 
             self._progress_bar.setValue(percent)
+            num_skipped: int = self._modifier.num_skipped() if self._modifier is not None else 0
+            skipped_text: str = f" ({num_skipped} skipped)" if num_skipped > 0 else ""
             self._items_label.setText(
-                f"{n}/{N} images modified"
+                f"{n}/{N} images modified{skipped_text}"
             )
             self._time_label.setText(
                 f"({hours:02d}:{minutes:02d}:{seconds:02d} remaining)"
@@ -142,6 +168,11 @@ class FileModify(QtWidgets.QWidget):
             self._t_previous = t_now
             self._t_delta = t_delta_filtered
 
+    def update_plan_progress(self, n: int) -> None:
+        N: int = len(self._filepaths)
+        self._progress_bar.setValue(int(round(100 * n / N)))
+        self._items_label.setText(f"{n}/{N} images read")
+
     def clear_progress(self) -> None:
         self._button_stop.setEnabled(False)
         self._progress_bar.reset()
@@ -151,6 +182,61 @@ class FileModify(QtWidgets.QWidget):
     def enable_send2trash(self, is_send2trash: bool) -> None:
         self._is_send2trash = is_send2trash
 
+    def set_output(self, output: str) -> None:
+        assert output in (OUTPUT_REWRITE, OUTPUT_SIDECAR), f"Unknown output mode '{output}'"
+        self._output = output
+
+    def enable_sidecar_rename(self, is_sidecar_rename: bool) -> None:
+        # In sidecar mode, either rename the files or only record the new names in the sidecars.
+        self._is_sidecar_rename = is_sidecar_rename
+
+    def build_plan(self, is_preview: bool = False) -> None:
+        # Creates and runs plan-builder thread, which evaluates the file modifiers for all saved
+        # images (without modifying any file). The plan is then shown (preview) or executed.
+
+        assert self._planner is None
+        self._is_preview = is_preview
+
+        # disable modify buttons (and the other widgets) while the metadata is read
+        self._button_modify.setEnabled(False)
+        self._button_preview.setEnabled(False)
+        self._modified_filepaths = []
+        self.signal_done.emit(False)
+
+        thread: QtCore.QThread = QtCore.QThread()
+        planner: PlanBuilder = PlanBuilder(
+            self._file_edit.rules(),
+            self._filepaths,
+            output=self._output,
+            is_sidecar_rename=self._is_sidecar_rename,
+        )
+        planner.moveToThread(thread)
+        thread.started.connect(planner.run)
+        planner.signal_progress.connect(self.update_plan_progress)
+        planner.signal_done.connect(self.on_plan_built)
+        planner.signal_done.connect(thread.quit)
+        planner.signal_done.connect(planner.deleteLater)
+        self._planner_thread = thread
+        self._planner = planner
+        thread.start()
+
+    def execute_plan(self, plan: FilePlan) -> None:
+        # Creates and runs file-modifier thread.
+
+        thread: QtCore.QThread = QtCore.QThread()
+        modifier: FileModifier = FileModifier(plan, is_send2trash=self._is_send2trash)
+        modifier.moveToThread(thread)
+        thread.started.connect(modifier.run)
+        modifier.signal_status.connect(self.on_modifier_status)
+        modifier.signal_status.connect(lambda status: thread.quit() if status == -1 else None)
+        modifier.signal_status.connect(
+            lambda status: modifier.deleteLater() if status == -1 else None
+        )
+        self._thread = thread
+        self._modifier = modifier
+        print("Thread started")
+        thread.start()
+
     # getters
     def filepaths(self) -> List[str]:
         return self._filepaths
@@ -163,13 +249,15 @@ class FileModify(QtWidgets.QWidget):
     def on_fileedit_checked(self, is_enabled: bool) -> None:
         is_enabled_button: bool = len(self._filepaths) > 0 and is_enabled
         self._button_modify.setEnabled(is_enabled_button)
+        self._button_preview.setEnabled(is_enabled_button)
 
     @QtCore.Slot()
     def on_modifier_status(self, status: int) -> None:
 
         if status == 0:
-            # disable modify button
+            # disable modify buttons
             self._button_modify.setEnabled(False)
+            self._button_preview.setEnabled(False)
             
             # update progress
             self.update_progress(0)
@@ -184,38 +272,53 @@ class FileModify(QtWidgets.QWidget):
         elif status < 0:
             # extract new filepaths
             self._modified_filepaths = self._modifier.new_filepaths()
+            renamed: Dict[str, str] = self._modifier.renamed()
+            num_skipped: int = self._modifier.num_skipped()
             
             # clean modifier
             self._modifier = None
 
             # clear progress bar
             self.clear_progress()
+            if num_skipped > 0:
+                self._items_label.setText(f"{num_skipped} unchanged images skipped")
 
-            # enable modify button
+            # enable modify buttons
             self._button_modify.setEnabled(True)
+            self._button_preview.setEnabled(True)
 
-            # emit signal done
+            # publish renames and emit signal done
+            self.signal_renamed.emit(renamed)
+            self.signal_done.emit(True)
+
+    @QtCore.Slot()
+    def on_plan_built(self, plan: Optional[FilePlan]) -> None:
+        # Executes the plan, or first shows it (preview); it is executed as-is if confirmed.
+
+        self._planner = None
+        self.clear_progress()
+        if plan is not None and self._is_preview:
+            dialog: PlanDialog = PlanDialog(plan, self)
+            if dialog.exec() != QtWidgets.QDialog.Accepted:
+                plan = None
+            else:
+                plan = dialog.plan()
+
+        if plan is not None:
+            self.execute_plan(plan)
+        else:
+            # nothing modified: enable modify buttons (and the other widgets)
+            self._button_modify.setEnabled(True)
+            self._button_preview.setEnabled(True)
             self.signal_done.emit(True)
 
     @QtCore.Slot()
     def on_modify_button_pressed(self) -> None:
-        # Creates and runs file-modifier thread.
+        self.build_plan()
 
-        self._thread: QtCore.QThread = QtCore.QThread()
-        self._modifier: FileModifier = FileModifier(
-            self._filepaths, self._file_edit, is_send2trash=self._is_send2trash
-        )
-        self._modifier.moveToThread(self._thread)
-        self._thread.started.connect(self._modifier.run)
-        self._modifier.signal_status.connect(self.on_modifier_status)
-        self._modifier.signal_status.connect(
-            lambda status: self._thread.quit() if status == -1 else None
-        )
-        self._modifier.signal_status.connect(
-            lambda status: self._modifier.deleteLater() if status == -1 else None
-        )
-        print("Thread started")
-        self._thread.start()
+    @QtCore.Slot()
+    def on_preview_button_pressed(self) -> None:
+        self.build_plan(is_preview=True)
 
     @QtCore.Slot()
     def on_stop(self) -> None:
@@ -223,59 +326,103 @@ class FileModify(QtWidgets.QWidget):
         self._modifier.stop()
 
 
-class FileModifier(QtCore.QObject):
+class PlanBuilder(QtCore.QObject):
+    # Builds the plan of a batch modification (see 'Rules.plan': the metadata of all files is
+    # read) on the thread it is moved to, and reports its progress.
 
-    _is_send2trash: bool
+    _PROGRESS_INTERVAL: float = 0.1
 
+    _rules: Rules
     _filepaths: List[str]
-    _new_filepaths: List[str]
-    _file_edit: FileEdit
+    _output: str
+    _is_sidecar_rename: bool
+
+    # number of files read (at most every '_PROGRESS_INTERVAL' seconds)
+    signal_progress: QtCore.Signal = QtCore.Signal(int)
+    # the plan ('FilePlan'), or None if it cannot be built
+    signal_done: QtCore.Signal = QtCore.Signal(object)
+
+    def __init__(
+        self,
+        rules: Rules,
+        filepaths: List[str],
+        output: str = OUTPUT_REWRITE,
+        is_sidecar_rename: bool = True,
+        parent: Optional[QtCore.QObject] = None,
+    ) -> None:
+        super().__init__(parent)
+        self._rules = rules
+        self._filepaths = list(filepaths)
+        self._output = output
+        self._is_sidecar_rename = is_sidecar_rename
+
+    def run(self) -> None:
+        t_progress: float = time.monotonic()
+
+        def on_progress(n: int) -> None:
+            nonlocal t_progress
+            if time.monotonic() - t_progress >= self._PROGRESS_INTERVAL:
+                self.signal_progress.emit(n)
+                t_progress = time.monotonic()
+
+        plan: Optional[FilePlan] = None
+        try:
+            plan = self._rules.plan(
+                self._filepaths,
+                output=self._output,
+                is_sidecar_rename=self._is_sidecar_rename,
+                on_progress=on_progress,
+            )
+        except Exception as e:
+            print(f"Cannot plan the modification: {e!r}")
+        finally:
+            self.signal_done.emit(plan)
+
+
+class FileModifier(QtCore.QObject):
+    # Runs a 'PlanExecutor' on the thread it is moved to and reports its progress.
+
+    _executor: PlanExecutor
 
     # 0 = started; 1 - n = running; -1 = done
     signal_status: QtCore.Signal = QtCore.Signal(int)
 
     def __init__(
         self,
-        filepaths: List[str],
-        file_edit: FileEdit,
+        plan: FilePlan,
         is_send2trash: bool = True,
+        executor: Union[str, concurrent.futures.Executor] = EXECUTOR_PROCESS,
+        max_workers: Optional[int] = None,
         parent: Optional[QtCore.QObject] = None,
     ) -> None:
         super().__init__(parent)
-        self._is_send2trash = is_send2trash
-        self._file_edit = file_edit
-
-        self._filepaths = filepaths
-        self._new_filepaths = []
-        self._is_running = False
+        self._executor = PlanExecutor(
+            plan, is_send2trash=is_send2trash, executor=executor, max_workers=max_workers
+        )
 
     def stop(self) -> None:
-        assert self._is_running == True
-        self._is_running = False
+        assert self._executor.is_running() == True
+        self._executor.stop()
+
+    def plan(self) -> FilePlan:
+        return self._executor.plan()
 
     def new_filepaths(self) -> List[str]:
-        return self._new_filepaths
+        # the paths of all files of the plan after the run, in input order
+        return self._executor.new_filepaths()
+
+    def renamed(self) -> Dict[str, str]:
+        return self._executor.renamed()
+
+    def num_skipped(self) -> int:
+        return self._executor.num_skipped()
 
     def run(self) -> None:
-        assert self._is_running == False
-        
-        self._is_running = True
+        # (done is always reported, so that the buttons are enabled again if the run fails)
         self.signal_status.emit(0)
-        for i, filepath in enumerate(self._filepaths):
-            if not self._is_running:
-                break
-            else:
-                self.signal_status.emit(i)
-
-                if os.path.isfile(filepath):
-                    img: Image = ImagePiexif(filepath)
-                    new_filename: Optional[str] = self._file_edit.convert_file(img)
-                    if new_filename is not None:
-                        new_filepath: str = os.path.join(img.dirname(), new_filename)
-                        img.save_with_filename(
-                            filepath=new_filepath, is_send2trash=self._is_send2trash
-                        )
-                        self._new_filepaths.append(new_filepath)
-                else:
-                    print(f"Cannot find file '{filepath}'")
-        self.signal_status.emit(-1)
+        try:
+            self._executor.run(on_progress=self.signal_status.emit)
+        except Exception as e:
+            print(f"Cannot modify the files: {e!r}")
+        finally:
+            self.signal_status.emit(-1)
\ No newline at end of file
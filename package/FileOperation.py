@@ -0,0 +1,49 @@
+from __future__ import annotations
+import os
+import datetime
+import multiprocessing
+import concurrent.futures
+from typing import Optional, Tuple, Union
+
+from package.ImageBackend import open_image
+
+
+# File operations that can run in worker threads or processes: everything here is free of Qt and
+# defined at module level, so that it can be sent to worker processes.
+
+EXECUTOR_SERIAL: str = "serial"
+EXECUTOR_THREAD: str = "thread"
+EXECUTOR_PROCESS: str = "process"
+
+
+def create_executor(
+    executor: Union[str, concurrent.futures.Executor], max_workers: Optional[int] = None
+) -> Tuple[Optional[concurrent.futures.Executor], bool]:
+    # Returns the pool for the given executor type (None for serial execution), and whether the
+    # pool was created here (and should be shut down by the caller). Worker processes are spawned
+    # rather than forked, as the app process runs Qt threads.
+
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    if executor == EXECUTOR_THREAD:
+        return concurrent.futures.ThreadPoolExecutor(max_workers=max_workers), True
+    if executor == EXECUTOR_PROCESS:
+        return concurrent.futures.ProcessPoolExecutor(
+            max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")
+        ), True
+    if isinstance(executor, concurrent.futures.Executor):
+        return executor, False
+    assert executor == EXECUTOR_SERIAL, f"Unknown executor '{executor}'"
+    return None, False
+
+
+def write_image(
+    backend: str, path: str, dt: datetime.datetime, tmp_path: Optional[str] = None
+) -> Optional[str]:
+    # Sets the date taken of an image and writes it (see 'Image.write'): returns None if the file
+    # was patched in place, or otherwise the path of the temporary file that holds the result. The
+    # file is not renamed, so that names can be assigned in order by the caller.
+
+    img = open_image(path, backend)
+    img.set_date_taken(dt)
+    return img.write(tmp_path)
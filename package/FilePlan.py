@@ -0,0 +1,355 @@
+from __future__ import annotations
+import os
+import csv
+import json
+import datetime
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from package.BatchLoad import load_many
+from package.ImageMetadata import ImageMetadata
+from package.MetadataCache import MetadataCache, default_cache
+from package.NameIndex import NameIndex
+
+
+# output modes: rewrite the JPEG files, or write the changes to XMP sidecar files
+OUTPUT_REWRITE: str = "rewrite"
+OUTPUT_SIDECAR: str = "sidecar"
+
+# planned actions
+ACTION_MISSING: str = "missing"  # file not found (or unreadable)
+ACTION_SKIP: str = "skip"  # name and date do not change
+ACTION_RENAME: str = "rename"  # only the name changes
+ACTION_REWRITE: str = "rewrite"  # the date (and possibly the name) changes
+ACTION_SIDECAR: str = "sidecar"  # changes go to the XMP sidecar (the file may be renamed)
+
+# evaluates the new file names and dates taken (None if unchanged) of a batch of files (see
+# 'Rules.convert_many')
+Converter = Callable[
+    [Sequence[ImageMetadata]], List[Tuple[Optional[str], Optional[datetime.datetime]]]
+]
+
+
+class PlannedFile(object):
+    # The planned modification of a single file.
+
+    _index: int
+    _source: str
+    _target: str
+    _metadata: Optional[ImageMetadata]
+    _new_filename: Optional[str]
+    _new_dt: Optional[datetime.datetime]
+    _action: str
+    _is_collision: bool
+    _is_cycle: bool
+
+    def __init__(
+        self,
+        index: int,
+        source: str,
+        metadata: Optional[ImageMetadata],
+        new_filename: Optional[str],
+        new_dt: Optional[datetime.datetime],
+        action: str,
+    ) -> None:
+        self._index = index
+        self._source = source
+        self._target = source
+        self._metadata = metadata
+        self._new_filename = new_filename
+        self._new_dt = new_dt
+        self._action = action
+        self._is_collision = False
+        self._is_cycle = False
+
+    def index(self) -> int:
+        return self._index
+
+    def source(self) -> str:
+        return self._source
+
+    def target(self) -> str:
+        # the final path (with a suffix if the requested name is taken)
+        return self._target
+
+    def metadata(self) -> Optional[ImageMetadata]:
+        return self._metadata
+
+    def new_filename(self) -> Optional[str]:
+        # the requested file name (None if unchanged)
+        return self._new_filename
+
+    def date_taken(self) -> Optional[datetime.datetime]:
+        return self._metadata.date_taken() if self._metadata is not None else None
+
+    def new_date_taken(self) -> Optional[datetime.datetime]:
+        # the new date taken (None if unchanged)
+        return self._new_dt
+
+    def action(self) -> str:
+        return self._action
+
+    def is_change(self) -> bool:
+        return self._action not in (ACTION_MISSING, ACTION_SKIP)
+
+    def is_move(self) -> bool:
+        return self._target != self._source
+
+    def is_collision(self) -> bool:
+        # whether a suffix was added because the requested name is taken
+        return self._is_collision
+
+    def is_cycle(self) -> bool:
+        # whether the file is part of a rename cycle (resolved through a temporary name)
+        return self._is_cycle
+
+    def set_target(self, target: str, is_collision: bool = False) -> None:
+        self._target = target
+        self._is_collision = is_collision
+
+    def set_cycle(self, is_cycle: bool = True) -> None:
+        self._is_cycle = is_cycle
+
+
+class FilePlan(object):
+    # Execution plan of a batch modification: the template and date change are evaluated for all
+    # files in one pass, and the final names are assigned up front. A requested name is free if
+    # no file has it, or if its file is itself moved away in the batch; otherwise a suffix is
+    # added. The operations are then ordered so that files are moved out of a name before another
+    # file moves in, and rename cycles (A -> B, B -> A) are broken by first moving one file to a
+    # temporary name. The plan is executed as-is by 'FileModifier'.
+
+    _TEMP_PREFIX: str = ".exifedit-swap"
+
+    _files: List[PlannedFile]
+    _steps: List[Tuple[int, str, str]]
+    _output: str
+    _is_sidecar_rename: bool
+
+    def __init__(
+        self,
+        files: List[PlannedFile],
+        output: str = OUTPUT_REWRITE,
+        is_sidecar_rename: bool = True,
+    ) -> None:
+        assert output in (OUTPUT_REWRITE, OUTPUT_SIDECAR), f"Unknown output mode '{output}'"
+        self._files = files
+        self._steps = []
+        self._output = output
+        self._is_sidecar_rename = is_sidecar_rename
+        self._assign_targets()
+        self._order_steps()
+
+    @classmethod
+    def build(
+        cls,
+        filepaths: Iterable[str],
+        convert: Converter,
+        output: str = OUTPUT_REWRITE,
+        is_sidecar_rename: bool = True,
+        cache: Optional[MetadataCache] = None,
+        on_progress: Optional[Callable[[int], None]] = None,
+    ) -> FilePlan:
+        # Evaluates the given converter for all files in one batch (with metadata from the cache,
+        # or else read in parallel) and returns the plan. 'on_progress' is called with the number
+        # of files read after each file.
+
+        if cache is None:
+            cache = default_cache()
+        filepaths = list(filepaths)
+        loaded: Dict[str, ImageMetadata] = {}
+        for metadata in load_many(filepaths, cache=cache):
+            loaded[metadata.path()] = metadata
+            if on_progress is not None:
+                on_progress(len(loaded))
+
+        found: List[ImageMetadata] = [
+            loaded[filepath] for filepath in filepaths if filepath in loaded
+        ]
+        conversions: Iterable[Tuple[Optional[str], Optional[datetime.datetime]]] = iter(
+            convert(found)
+        )
+
+        files: List[PlannedFile] = []
+        for i, filepath in enumerate(filepaths):
+            metadata: Optional[ImageMetadata] = loaded.get(filepath)
+            if metadata is None:
+                files.append(PlannedFile(i, filepath, None, None, None, ACTION_MISSING))
+                continue
+
+            new_filename, new_dt = next(conversions)
+            if new_filename == metadata.filename():
+                new_filename = None
+            if new_dt == metadata.date_taken():
+                new_dt = None
+
+            action: str
+            if new_filename is None and new_dt is None:
+                action = ACTION_SKIP
+            elif output == OUTPUT_SIDECAR:
+                action = ACTION_SIDECAR
+            elif new_dt is None:
+                action = ACTION_RENAME
+            else:
+                action = ACTION_REWRITE
+            files.append(PlannedFile(i, filepath, metadata, new_filename, new_dt, action))
+        return cls(files, output=output, is_sidecar_rename=is_sidecar_rename)
+
+    # protected
+    def _is_renamed(self, file: PlannedFile) -> bool:
+        if file.new_filename() is None or not file.is_change():
+            return False
+        return file.action() != ACTION_SIDECAR or self._is_sidecar_rename
+
+    def _assign_targets(self) -> None:
+        # Assigns the final names in input order.
+
+        names: NameIndex = NameIndex()
+        renamed: List[PlannedFile] = [file for file in self._files if self._is_renamed(file)]
+        vacated: Set[Tuple[str, str]] = set(names.key(file.source()) for file in renamed)
+        assigned: Set[Tuple[str, str]] = set()
+        next_suffix: Dict[Tuple[str, str], int] = {}
+
+        def is_free(path: str, source: str) -> bool:
+            key: Tuple[str, str] = names.key(path)
+            if key in assigned:
+                return False
+            return key == names.key(source) or key in vacated or not names.is_taken(path)
+
+        for file in renamed:
+            requested: str = os.path.join(os.path.dirname(file.source()), file.new_filename())
+            target: str = requested
+            basename, extension = os.path.splitext(requested)
+            i: int = next_suffix.get(names.key(requested), 1)
+            while not is_free(target, file.source()):
+                target = f"{basename}-{i}{extension}"
+                i += 1
+            if target != requested:
+                next_suffix[names.key(requested)] = i
+            assigned.add(names.key(target))
+            file.set_target(target, is_collision=target != requested)
+
+    def _temp_path(self, file: PlannedFile) -> str:
+        # (not an image name, so that listings and the file list ignore the file meanwhile)
+        return os.path.join(
+            os.path.dirname(file.source()),
+            f"{self._TEMP_PREFIX}-{file.index()}-{os.path.basename(file.source())}.tmp",
+        )
+
+    def _order_steps(self) -> None:
+        # Orders the operations as (file index, from path, to path) steps, in input order except
+        # that a file is moved out of a name before another file moves into it. The last step of
+        # a file is its actual operation; files in a cycle first get a step to a temporary name.
+
+        names: NameIndex = NameIndex()
+        owners: Dict[Tuple[str, str], int] = {
+            names.key(file.source()): file.index() for file in self._files if file.is_move()
+        }
+
+        # the file (if any) that has to move out of the target of each file first
+        dependencies: Dict[int, int] = {}
+        for file in self._files:
+            if file.is_move():
+                owner: Optional[int] = owners.get(names.key(file.target()))
+                if owner is not None and owner != file.index():
+                    dependencies[file.index()] = owner
+
+        # 0 = not visited; 1 = on the current chain; 2 = ordered
+        states: List[int] = [0] * len(self._files)
+        from_paths: List[str] = [file.source() for file in self._files]
+        for file in self._files:
+            if not file.is_change() or states[file.index()] != 0:
+                continue
+
+            # follow the chain of dependencies (each file has at most one)
+            chain: List[int] = []
+            i: int = file.index()
+            while True:
+                states[i] = 1
+                chain.append(i)
+                j: Optional[int] = dependencies.get(i)
+                if j is None or states[j] == 2:
+                    break
+                if states[j] == 1:
+                    # cycle: move the file at which the chain closes out of the way first
+                    temp_path: str = self._temp_path(self._files[j])
+                    self._steps.append((j, from_paths[j], temp_path))
+                    from_paths[j] = temp_path
+                    for k in chain[chain.index(j):]:
+                        self._files[k].set_cycle()
+                    break
+                i = j
+
+            for i in reversed(chain):
+                self._steps.append((i, from_paths[i], self._files[i].target()))
+                states[i] = 2
+
+    # public
+    def files(self) -> List[PlannedFile]:
+        return self._files
+
+    def steps(self) -> List[Tuple[int, str, str]]:
+        return self._steps
+
+    def output(self) -> str:
+        return self._output
+
+    def is_sidecar_rename(self) -> bool:
+        return self._is_sidecar_rename
+
+    def num_files(self) -> int:
+        return len(self._files)
+
+    def num_changes(self) -> int:
+        return sum(1 for file in self._files if file.is_change())
+
+    def num_skipped(self) -> int:
+        return sum(1 for file in self._files if file.action() == ACTION_SKIP)
+
+    def num_collisions(self) -> int:
+        return sum(1 for file in self._files if file.is_collision())
+
+    def num_cycles(self) -> int:
+        # number of files in rename cycles
+        return sum(1 for file in self._files if file.is_cycle())
+
+    def rows(self) -> List[Dict[str, object]]:
+        # Returns the plan as table rows (one per file, in input order).
+
+        rows: List[Dict[str, object]] = []
+        for file in self._files:
+            date_taken: Optional[datetime.datetime] = file.date_taken()
+            new_date_taken: Optional[datetime.datetime] = file.new_date_taken()
+            notes: List[str] = []
+            if file.is_collision():
+                notes.append("collision")
+            if file.is_cycle():
+                notes.append("cycle")
+            rows.append(
+                {
+                    "action": file.action(),
+                    "source": file.source(),
+                    "target": file.target(),
+                    "date_taken": date_taken.isoformat() if date_taken is not None else None,
+                    "new_date_taken": (
+                        new_date_taken.isoformat() if new_date_taken is not None else None
+                    ),
+                    "notes": ", ".join(notes),
+                }
+            )
+        return rows
+
+    def export(self, path: str) -> None:
+        # Exports the plan as CSV, or as JSON if the path ends with '.json'.
+
+        rows: List[Dict[str, object]] = self.rows()
+        if path.lower().endswith(".json"):
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(rows, f, indent=2)
+        else:
+            with open(path, "w", encoding="utf-8", newline="") as f:
+                writer: csv.DictWriter = csv.DictWriter(
+                    f,
+                    fieldnames=["action", "source", "target", "date_taken", "new_date_taken", "notes"],
+                )
+                writer.writeheader()
+                writer.writerows(rows)
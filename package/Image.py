@@ -1,14 +1,68 @@
 from __future__ import annotations
 import os
 import abc
+import sys
+import struct
+import uuid
 import send2trash
 import datetime
-from typing import Any, Optional, Dict, Tuple, Union, BinaryIO, Callable
+from typing import Any, Optional, Dict, List, Tuple, Union, BinaryIO, Callable
 
 import exif
 import piexif
 from PIL import Image as PILImage
 
+from package.JpegHeader import JpegHeader
+from package.ExifDate import format_exif_date, parse_exif_date
+from package.ImageMetadata import ImageMetadata
+from package.Sidecar import apply_sidecar
+from package.NameIndex import NameIndex
+
+
+def copy_file_tail(src: BinaryIO, dst: BinaryIO, offset: int, chunk_size: int = 1 << 20) -> None:
+    # Appends the contents of 'src' from 'offset' onwards to 'dst'. The data is copied by the
+    # kernel where possible ('copy_file_range' or 'sendfile'), and otherwise in chunks, so memory
+    # use does not depend on the file size.
+
+    dst.flush()
+    src_fd: int = src.fileno()
+    dst_fd: int = dst.fileno()
+    remaining: int = os.fstat(src_fd).st_size - offset
+
+    if hasattr(os, "copy_file_range"):
+        try:
+            while remaining > 0:
+                copied: int = os.copy_file_range(src_fd, dst_fd, remaining, offset_src=offset)
+                if copied == 0:
+                    break
+                offset += copied
+                remaining -= copied
+        except OSError:
+            # e.g., not supported between these file systems; continue with the next method
+            pass
+
+    # on macOS, 'sendfile' only supports sockets as destination
+    if remaining > 0 and hasattr(os, "sendfile") and sys.platform.startswith("linux"):
+        try:
+            while remaining > 0:
+                copied: int = os.sendfile(dst_fd, src_fd, offset, remaining)
+                if copied == 0:
+                    break
+                offset += copied
+                remaining -= copied
+        except OSError:
+            pass
+
+    if remaining > 0:
+        src.seek(offset)
+        while remaining > 0:
+            chunk: bytes = src.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            dst.write(chunk)
+            remaining -= len(chunk)
+        dst.flush()
+
 
 class Image(object):
 
@@ -16,17 +70,33 @@ class Image(object):
 
     _path: str
     _size: int
+    _mtime_ns: int
+    _metadata: Optional[ImageMetadata]
 
     def __init__(self, path: str) -> None:
         assert os.path.isfile(path)
         self._path = path
-        self._size = os.path.getsize(path)
+        stat: os.stat_result = os.stat(path)
+        self._size = stat.st_size
+        self._mtime_ns = stat.st_mtime_ns
+        self._metadata = None
 
     # protected
     def _check_path(self) -> bool:
         return os.path.isfile(self._path)
 
-    def _add_suffix(self, path: str) -> str:
+    def _patch(self) -> bool:
+        # Writes the changes in place if the backend supports it. Returns False if the file has to
+        # be rewritten instead (the default).
+
+        return False
+
+    # public
+    @staticmethod
+    def add_suffix(path: str) -> str:
+        # Returns the given path, or the path with the first suffix ('-1', '-2', ...) that is
+        # free if it is taken.
+
         dirname: str = os.path.dirname(path)
         filename: str = os.path.basename(path)
         basename: str = os.path.splitext(filename)[0]
@@ -37,7 +107,13 @@ class Image(object):
             i += 1
         return path
 
-    # public
+    @staticmethod
+    def temp_path(path: str) -> str:
+        # Returns a new (unique) name for a temporary file next to the given path, to be passed to
+        # 'write'; the file is not created.
+
+        return os.path.join(os.path.dirname(path), f".exifedit-{uuid.uuid4().hex}.tmp")
+
     def path(self) -> str:
         return self._path
 
@@ -67,6 +143,10 @@ class Image(object):
     def resolution(self) -> Tuple[int, int]:
         return
 
+    @abc.abstractmethod
+    def orientation(self) -> Optional[int]:
+        return
+
     @abc.abstractmethod
     def set_date_taken(self, dt: datetime.datetime) -> None:
         return
@@ -106,27 +186,128 @@ class Image(object):
     @abc.abstractmethod
     def save(self, filepath: str = None) -> str:
         return
+
+    def metadata(self) -> ImageMetadata:
+        # Returns a snapshot of the file information and EXIF fields as read from the file, with
+        # the values of an XMP sidecar (if any) merged over them. The fields are decoded only once,
+        # on the first call.
+
+        if self._metadata is None:
+            self._metadata = apply_sidecar(ImageMetadata(
+                path=self._path,
+                size=self._size,
+                mtime_ns=self._mtime_ns,
+                resolution=self.resolution(),
+                orientation=self.orientation(),
+                date_taken=self.date_taken(),
+                camera_maker=self.camera_maker(),
+                camera_model=self.camera_model(),
+                lens_model=self.lens_model(),
+                fstop=self.fstop(),
+                exp_time=self.exp_time(),
+                iso=self.iso(),
+                focal_length=self.focal_length(),
+            ))
+        return self._metadata
     
-    def save_with_filename(self, filepath: Optional[str] = None, is_send2trash: bool = True) -> str:
-        if filepath is None:
-            filepath = self._path
+    def write(self, tmp_path: Optional[str] = None) -> Optional[str]:
+        # Writes the changes: patched in place if possible (returns None), or otherwise saved to a
+        # temporary file next to the original (returns its path), leaving the original untouched.
+        # The temporary file gets the given name (see 'temp_path'; e.g., recorded in a journal
+        # beforehand), or else a new unique name. The result is moved into place by
+        # 'replace_original'.
 
-        # rename old file
         assert self._check_path(), "Image file not found"
-        if is_send2trash:
-            send2trash.send2trash(self._path)
+
+        if self._patch():
+            return None
+
+        # the original is read while saving
+        if tmp_path is None:
+            tmp_path = self.temp_path(self._path)
+        try:
+            self.save(tmp_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return tmp_path
+
+    @classmethod
+    def replace_original(
+        cls,
+        path: str,
+        tmp_path: Optional[str],
+        filepath: str,
+        is_send2trash: bool = True,
+        names: Optional[NameIndex] = None,
+    ) -> str:
+        # Moves the result of 'write' into place under the given path (a suffix is added if the
+        # path is taken): renames a patched file, or removes the original (trashes or deletes it)
+        # and moves the temporary file into place. If a name index is given, it is used (and
+        # updated) to find a free path instead of probing the file system. Returns the new path.
+
+        # patched in place: rename if needed
+        if tmp_path is None:
+            if filepath != path:
+                if names is not None:
+                    names.release(path)
+                    filepath = names.reserve(filepath)
+                elif not (os.path.isfile(filepath) and os.path.samefile(filepath, path)):
+                    filepath = cls.add_suffix(filepath)
+                print(f"Patching '{path}' -> '{filepath}'")
+                os.rename(path, filepath)
+            else:
+                print(f"Patching '{filepath}'")
+            return filepath
+
+        # remove old file
+        if not is_send2trash:
+            os.remove(path)
         else:
-            os.remove(self._path)
+            send2trash.send2trash(path)
+
+        return cls.move_into_place(path, tmp_path, filepath, names=names)
 
-        # save new file
-        filepath = self._add_suffix(filepath)
+    @classmethod
+    def move_into_place(
+        cls, path: str, tmp_path: str, filepath: str, names: Optional[NameIndex] = None
+    ) -> str:
+        # Moves the result of 'write' into place under the given path (a suffix is added if the
+        # path is taken), once the original at 'path' has been removed (see 'replace_original').
+        # Returns the new path.
 
-        if filepath == self._path:
+        if names is not None:
+            names.release(path)
+            filepath = names.reserve(filepath)
+        else:
+            filepath = cls.add_suffix(filepath)
+
+        if filepath == path:
             print(f"Saving '{filepath}'")
         else:
-            print(f"Saving '{self._path}' -> '{filepath}'")
+            print(f"Saving '{path}' -> '{filepath}'")
 
-        self.save(filepath)
+        os.replace(tmp_path, filepath)
+        return filepath
+
+    def save_with_filename(
+        self,
+        filepath: Optional[str] = None,
+        is_send2trash: bool = True,
+        names: Optional[NameIndex] = None,
+    ) -> str:
+        # Saves the image under the given path (a suffix is added if the path is taken) and
+        # removes the original (see 'replace_original').
+
+        if filepath is None:
+            filepath = self._path
+
+        tmp_path: Optional[str] = self.write()
+        self._path = self.replace_original(
+            self._path, tmp_path, filepath, is_send2trash=is_send2trash, names=names
+        )
+        return self._path
 
 
 class ExifField(object):
@@ -200,20 +381,17 @@ class ImageExif(Image):
             resolution_y = resolution_1
         return (resolution_x, resolution_y)
 
+    def orientation(self) -> Optional[int]:
+        return self._exif_field("orientation", func=int)
+
     def set_date_taken(self, dt: datetime.datetime) -> None:
-        date_taken_string: str = dt.strftime("%Y:%m:%d %H:%M:%S")
+        date_taken_string: str = format_exif_date(dt).decode("ascii")
         self._img.datetime = date_taken_string
         self._img.datetime_digitized = date_taken_string
         self._img.datetime_original = date_taken_string
 
     def date_taken(self) -> Optional[datetime.datetime]:
-        return self._exif_field(
-            "datetime_original",
-            func=lambda s: datetime.datetime.strptime(
-                s,
-                "%Y:%m:%d %H:%M:%S",
-            ),
-        )
+        return self._exif_field("datetime_original", func=parse_exif_date)
 
     def camera_maker(self) -> Optional[str]:
         return self._exif_field("make")
@@ -251,37 +429,72 @@ class ImagePiexif(Image):
     # see for tags: https://github.com/hMatoba/Piexif/blob/master/piexif/_exif.py
 
     _path: str
-    _img: Optional[PILImage.Image]
-    _img_data: bytes
+    _header: JpegHeader
     _exif_dict: Dict[str, Any]
+    _date_taken_patch: Optional[bytes]
 
     def __init__(self, path: str) -> None:
         super().__init__(path)
 
-        # save path for later loading in 'resolution' method
-        self._path = path
-
-        # empty image to avoid loading using PIL for each processed image
-        self._img = None
-
-        # read as bytes to leave image untouchen (no recompression)
-        img_bytes: bytes
-        with open(path, 'rb') as img_bytes:
-            self._img_data = img_bytes.read()
-        self._exif_dict = piexif.load(self._img_data)
+        # only read the marker segments up to the Exif and SOF segments; the image data is copied
+        # as bytes (to leave the image untouched, i.e., no recompression) only when it is saved
+        self._date_taken_patch = None
+        self._header = JpegHeader(path)
+        exif_data: Optional[bytes] = self._header.exif()
+        if exif_data is not None:
+            self._exif_dict = piexif.load(exif_data)
+        else:
+            self._exif_dict = {
+                "0th": {},
+                "Exif": {},
+                "GPS": {},
+                "Interop": {},
+                "1st": {},
+                "thumbnail": None,
+            }
 
         # bugfix
         if 41729 in self._exif_dict["Exif"]:
             self._exif_dict["Exif"][41729] = b'\x01'
+
+    # protected
+    def _patch(self) -> bool:
+        # The date fields are fixed-width (19 characters), so a date-only change can overwrite the
+        # existing values at their offsets in the file instead of rewriting the whole file.
+
+        if self._date_taken_patch is None:
+            return False
+
+        offsets: List[Optional[int]] = [
+            self._header.ascii_offset(tag, len(self._date_taken_patch))
+            for tag in (piexif.ExifIFD.DateTimeOriginal, piexif.ExifIFD.DateTimeDigitized)
+        ]
+        if any(offset is None for offset in offsets):
+            return False
+
+        img_bytes: BinaryIO
+        with open(self._path, "r+b") as img_bytes:
+            for offset in offsets:
+                if hasattr(os, "pwrite"):
+                    os.pwrite(img_bytes.fileno(), self._date_taken_patch, offset)
+                else:
+                    img_bytes.seek(offset)
+                    img_bytes.write(self._date_taken_patch)
+        self._date_taken_patch = None
+        return True
     
     # public 
     def resolution(self) -> Tuple[int, int]:
-        # only load image using PIL when extracting resolution
-        if self._img is None:
-            self._img = PILImage.open(self._path)
-
-        resolution_1: int = self._img.width
-        resolution_2: int = self._img.height
+        # the resolution is read from the SOF segment during the header scan; PIL is only used as
+        # fallback for files without a (recognized) SOF segment
+        size: Optional[Tuple[int, int]] = self._header.size()
+        if size is None:
+            img: PILImage.Image
+            with PILImage.open(self._path) as img:
+                size = img.size
+
+        resolution_1: int = size[0]
+        resolution_2: int = size[1]
         orientation: int = self._exif_dict["0th"].get(piexif.ImageIFD.Orientation, 1)
         
         resolution_x: int = resolution_1
@@ -291,16 +504,17 @@ class ImagePiexif(Image):
             resolution_y = resolution_1
         return (resolution_x, resolution_y)
 
+    def orientation(self) -> Optional[int]:
+        return self._exif_dict["0th"].get(piexif.ImageIFD.Orientation, None)
+
     def set_date_taken(self, dt: datetime.datetime) -> None:
-        date_taken_string: str = dt.strftime("%Y:%m:%d %H:%M:%S")
-        self._exif_dict["Exif"][piexif.ExifIFD.DateTimeOriginal] = date_taken_string.encode("utf-8")
-        self._exif_dict["Exif"][piexif.ExifIFD.DateTimeDigitized] = date_taken_string.encode("utf-8")
+        date_taken_bytes: bytes = format_exif_date(dt)
+        self._exif_dict["Exif"][piexif.ExifIFD.DateTimeOriginal] = date_taken_bytes
+        self._exif_dict["Exif"][piexif.ExifIFD.DateTimeDigitized] = date_taken_bytes
+        self._date_taken_patch = date_taken_bytes
 
     def date_taken(self) -> Optional[datetime.datetime]:
-        date_taken_str: Optional[str] = self._exif_dict["Exif"].get(piexif.ExifIFD.DateTimeOriginal, None)
-        if date_taken_str is not None:
-            return datetime.datetime.strptime(date_taken_str.decode(), "%Y:%m:%d %H:%M:%S")
-        return None
+        return parse_exif_date(self._exif_dict["Exif"].get(piexif.ExifIFD.DateTimeOriginal, None))
 
     def camera_maker(self) -> Optional[str]:
         camera_maker: Optional[str] = self._exif_dict["0th"].get(piexif.ImageIFD.Make, None)
@@ -342,8 +556,23 @@ class ImagePiexif(Image):
         return None
 
     def save(self, filepath: str) -> str:
+        # Writes SOI and the new APP1 Exif segment, followed by the unchanged remainder of the
+        # original file (which replaces the existing Exif segment as 'piexif.insert' would).
+
         exif_bytes: bytes = piexif.dump(self._exif_dict)
-        piexif.insert(exif_bytes, self._img_data, filepath)
-        
+        exif_segment: bytes = b"\xff\xe1" + struct.pack(">H", len(exif_bytes) + 2) + exif_bytes
+
+        # the original file is read while saving, so it cannot be overwritten directly
+        is_same_file: bool = os.path.isfile(filepath) and os.path.samefile(filepath, self._path)
+        out_path: str = f"{filepath}.tmp" if is_same_file else filepath
+
+        src: BinaryIO
+        dst: BinaryIO
+        with open(self._path, "rb") as src, open(out_path, "wb") as dst:
+            dst.write(b"\xff\xd8" + exif_segment)
+            copy_file_tail(src, dst, self._header.exif_insert_offset())
+
+        if is_same_file:
+            os.replace(out_path, filepath)
         return filepath
     
\ No newline at end of file
@@ -0,0 +1,147 @@
+from __future__ import annotations
+import os
+import datetime
+from typing import Any, Dict, Optional, Tuple
+
+
+class ImageMetadata(object):
+    # Immutable snapshot of the file information and EXIF fields of an image. All fields are
+    # decoded once when the snapshot is created; the getters mirror those of 'Image', so the
+    # snapshot can be passed wherever an image is only read.
+
+    __slots__ = (
+        "_path",
+        "_size",
+        "_mtime_ns",
+        "_resolution",
+        "_orientation",
+        "_date_taken",
+        "_camera_maker",
+        "_camera_model",
+        "_lens_model",
+        "_fstop",
+        "_exp_time",
+        "_iso",
+        "_focal_length",
+        "_sidecar_mtime_ns",
+    )
+
+    _path: str
+    _size: int
+    _mtime_ns: int
+    _resolution: Tuple[Optional[int], Optional[int]]
+    _orientation: Optional[int]
+    _date_taken: Optional[datetime.datetime]
+    _camera_maker: Optional[str]
+    _camera_model: Optional[str]
+    _lens_model: Optional[str]
+    _fstop: Optional[float]
+    _exp_time: Optional[float]
+    _iso: Optional[int]
+    _focal_length: Optional[float]
+    _sidecar_mtime_ns: Optional[int]
+
+    def __init__(
+        self,
+        path: str,
+        size: int,
+        mtime_ns: int,
+        resolution: Tuple[Optional[int], Optional[int]] = (None, None),
+        orientation: Optional[int] = None,
+        date_taken: Optional[datetime.datetime] = None,
+        camera_maker: Optional[str] = None,
+        camera_model: Optional[str] = None,
+        lens_model: Optional[str] = None,
+        fstop: Optional[float] = None,
+        exp_time: Optional[float] = None,
+        iso: Optional[int] = None,
+        focal_length: Optional[float] = None,
+        sidecar_mtime_ns: Optional[int] = None,
+    ) -> None:
+        self._path = path
+        self._size = size
+        self._mtime_ns = mtime_ns
+        self._resolution = resolution
+        self._orientation = orientation
+        self._date_taken = date_taken
+        self._camera_maker = camera_maker
+        self._camera_model = camera_model
+        self._lens_model = lens_model
+        self._fstop = fstop
+        self._exp_time = exp_time
+        self._iso = iso
+        self._focal_length = focal_length
+        self._sidecar_mtime_ns = sidecar_mtime_ns
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}('{self._path}')"
+
+    def replace(self, **fields: Any) -> ImageMetadata:
+        # Returns a copy with the given fields (constructor arguments) replaced.
+
+        values: Dict[str, Any] = {name[1:]: getattr(self, name) for name in self.__slots__}
+        values.update(fields)
+        return ImageMetadata(**values)
+
+    # file
+    def path(self) -> str:
+        return self._path
+
+    def dirname(self) -> str:
+        return os.path.dirname(self._path)
+
+    def filename(self) -> str:
+        return os.path.basename(self._path)
+
+    def basename(self) -> str:
+        return os.path.splitext(os.path.basename(self._path))[0]
+
+    def extension(self) -> str:
+        return os.path.splitext(os.path.basename(self._path))[1]
+
+    def size(self) -> int:
+        return self._size
+
+    def filesize_kb(self) -> float:
+        return self._size / (1 << 10)
+
+    def filesize_mb(self) -> float:
+        return self._size / (1 << 20)
+
+    def mtime_ns(self) -> int:
+        return self._mtime_ns
+
+    def sidecar_mtime_ns(self) -> Optional[int]:
+        # modification time of the XMP sidecar that was merged into the fields (None if none)
+        return self._sidecar_mtime_ns
+
+    # exif
+    def resolution(self) -> Tuple[Optional[int], Optional[int]]:
+        return self._resolution
+
+    def orientation(self) -> Optional[int]:
+        return self._orientation
+
+    def date_taken(self) -> Optional[datetime.datetime]:
+        return self._date_taken
+
+    def camera_maker(self) -> Optional[str]:
+        return self._camera_maker
+
+    def camera_model(self) -> Optional[str]:
+        return self._camera_model
+
+    def lens_model(self) -> Optional[str]:
+        return self._lens_model
+
+    def fstop(self) -> Optional[float]:
+        return self._fstop
+
+    def exp_time(self) -> Optional[float]:
+        return self._exp_time
+
+    def iso(self) -> Optional[int]:
+        return self._iso
+
+    def focal_length(self) -> Optional[float]:
+        return self._focal_length
@@ -3,7 +3,8 @@ from typing import Optional, List, Tuple, Any, Callable
 from PySide6 import QtCore, QtWidgets
 
 from package.PixLabel import SquarePixLabel
-from package.Image import Image, ImageExif, ImagePiexif
+from package.ImageMetadata import ImageMetadata
+from package.MetadataCache import default_cache
 
 
 class ImageViewer(QtWidgets.QWidget):
@@ -100,7 +101,7 @@ class ImageViewer(QtWidgets.QWidget):
         except (ValueError, TypeError):
             return ""
 
-    def _fill_tree(self, img: Image) -> None:
+    def _fill_tree(self, img: ImageMetadata) -> None:
         # Fills the EXIF value tree with formatted strings extracted from the image.
 
         # resolution
@@ -167,14 +168,14 @@ class ImageViewer(QtWidgets.QWidget):
     def previous_image(self) -> None:
         self.signal_image_cycle_next.emit(False)
 
-    def load_image(self, path: str) -> Image:
-        # Returns the image object with EXIF values extracted for the provided path. The function
+    def load_image(self, path: str) -> ImageMetadata:
+        # Returns the image metadata with EXIF values extracted for the provided path. The function
         # fills the EXIF tree and initiating image-loading in the PixLabel.
 
         assert path != None
 
         self._path = path
-        img = ImagePiexif(path)
+        img: ImageMetadata = default_cache().load(path)
         self._fill_tree(img)
         self._button_next.setEnabled(False)
         self._button_prev.setEnabled(False)
@@ -0,0 +1,427 @@
+from __future__ import annotations
+import os
+import sys
+import glob
+import json
+import time
+import datetime
+import threading
+from typing import Dict, List, Optional, Set, TextIO, Tuple
+
+import send2trash
+
+if sys.platform == "win32":
+    import msvcrt
+else:
+    import fcntl
+
+from package.Image import Image
+from package.ImageBackend import open_image
+from package.MetadataCache import cache_dir
+from package.Sidecar import has_sidecar, move_sidecar, write_sidecar
+
+
+# kinds of file operations
+KIND_RENAME: str = "rename"  # renamed (contents unchanged)
+KIND_PATCH: str = "patch"  # patched in place by a worker, then renamed
+KIND_REWRITE: str = "rewrite"  # written to 'tmp'; original trashed/removed, 'tmp' moved to 'dst'
+KIND_SIDECAR: str = "sidecar"  # date written to the sidecar of 'dst'
+KIND_SWAP: str = "swap"  # moved to a temporary name 'dst' (rename cycle); done with its last step
+
+
+def journal_dir() -> str:
+    return os.path.join(cache_dir(), "journal")
+
+
+def _lock_path(path: str) -> str:
+    # the lock file of a journal, held while its run is active
+    return f"{path}.lock"
+
+
+def _try_lock(lock_file: TextIO) -> bool:
+    # Takes an exclusive lock on the given file without blocking. Returns False if another run
+    # (of this or another instance) holds it. The lock is released when the file is closed (also
+    # if the process dies).
+
+    try:
+        if sys.platform == "win32":
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        return False
+    return True
+
+
+def _to_iso(dt: Optional[datetime.datetime]) -> Optional[str]:
+    return dt.isoformat() if dt is not None else None
+
+
+def _from_iso(text: Optional[str]) -> Optional[datetime.datetime]:
+    return datetime.datetime.fromisoformat(text) if text is not None else None
+
+
+class Journal(object):
+    # Append-only write-ahead journal of a batch modification, as JSON lines in the cache
+    # directory. The intent of each file operation is appended before it is carried out, and a
+    # completion record after. Dates are written by workers before their operation begins, so they
+    # are journaled separately ('write'). If the app dies during a run, the journal remains and its
+    # incomplete operations can be rolled forward or back with 'recover_journal'. Records are
+    # flushed one by one (which survives a crash of the app); the journal is synced and removed
+    # once all operations have completed. While the run is active, a lock file next to the
+    # journal is held, so that other instances leave the journal alone.
+
+    _path: str
+    _file: Optional[TextIO]
+    _lock_file: Optional[TextIO]
+    _next_id: int
+    _open_ids: Set[int]
+    _open_writes: Set[str]
+    _lock: threading.Lock
+
+    def __init__(self, path: Optional[str] = None) -> None:
+        if path is None:
+            path = os.path.join(
+                journal_dir(), f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.jsonl"
+            )
+        self._path = path
+        self._next_id = 0
+        self._open_ids = set()
+        self._open_writes = set()
+        self._lock = threading.Lock()
+
+        # the lock is taken before the journal exists, so that it is never seen unlocked
+        self._lock_file = None
+        self._file = None
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self._lock_file = open(_lock_path(path), "a", encoding="utf-8")
+            if not _try_lock(self._lock_file):
+                raise OSError("the journal is locked by another run")
+            self._file = open(path, "a", encoding="utf-8")
+        except OSError as e:
+            print(f"Cannot open journal '{path}': {e}")
+            if self._lock_file is not None:
+                self._lock_file.close()
+                self._lock_file = None
+        self._append({"op": "start", "pid": os.getpid(), "time": time.time()})
+
+    # protected
+    def _append(self, record: Dict[str, object]) -> None:
+        if self._file is not None:
+            self._file.write(json.dumps(record) + "\n")
+            self._file.flush()
+
+    # public
+    def path(self) -> str:
+        return self._path
+
+    def write(
+        self,
+        src: str,
+        old_date: Optional[datetime.datetime],
+        new_date: datetime.datetime,
+        tmp: Optional[str] = None,
+    ) -> None:
+        # Records that a worker is about to write a new date to a file (to the given temporary
+        # file, if it is not patched in place).
+
+        with self._lock:
+            self._open_writes.add(src)
+            self._append(
+                {
+                    "op": "write",
+                    "src": src,
+                    "tmp": tmp,
+                    "old_date": _to_iso(old_date),
+                    "new_date": _to_iso(new_date),
+                }
+            )
+
+    def cancel(self, src: str) -> None:
+        # Records that a recorded write was cancelled before it started.
+
+        with self._lock:
+            self._open_writes.discard(src)
+            self._append({"op": "cancel", "src": src})
+
+    def begin(
+        self,
+        kind: str,
+        src: str,
+        dst: str,
+        tmp: Optional[str] = None,
+        is_trash: bool = False,
+        old_date: Optional[datetime.datetime] = None,
+        new_date: Optional[datetime.datetime] = None,
+    ) -> int:
+        # Records the intent of a file operation and returns its id.
+
+        with self._lock:
+            entry_id: int = self._next_id
+            self._next_id += 1
+            self._open_ids.add(entry_id)
+            self._open_writes.discard(src)
+            self._append(
+                {
+                    "op": "begin",
+                    "id": entry_id,
+                    "kind": kind,
+                    "src": src,
+                    "dst": dst,
+                    "tmp": tmp,
+                    "trash": is_trash,
+                    "old_date": _to_iso(old_date),
+                    "new_date": _to_iso(new_date),
+                }
+            )
+            return entry_id
+
+    def removed(self, entry_ids: List[int]) -> None:
+        # Records that the originals of the given rewrites have been trashed (or removed).
+
+        with self._lock:
+            self._append({"op": "removed", "ids": entry_ids})
+
+    def done(self, entry_id: int, dst: str) -> None:
+        with self._lock:
+            self._open_ids.discard(entry_id)
+            self._append({"op": "done", "id": entry_id, "dst": dst})
+
+    def close(self) -> None:
+        # Closes the journal: removes it if all operations have completed, and otherwise keeps it
+        # for recovery.
+
+        with self._lock:
+            if self._file is None:
+                return
+            self._append({"op": "end"})
+            os.fsync(self._file.fileno())
+            self._file.close()
+            self._file = None
+            if not self._open_ids and not self._open_writes:
+                os.remove(self._path)
+            self._lock_file.close()
+            self._lock_file = None
+            os.remove(_lock_path(self._path))
+
+
+def _read(path: str) -> List[Dict[str, object]]:
+    records: List[Dict[str, object]] = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                # the last line may be incomplete
+                pass
+    return records
+
+
+def _is_active(path: str) -> bool:
+    # Returns whether the run of a journal is still active, i.e., its lock is held (by any
+    # process, including this one).
+
+    if not os.path.exists(_lock_path(path)):
+        return False
+    try:
+        with open(_lock_path(path), "a", encoding="utf-8") as lock_file:
+            return not _try_lock(lock_file)
+    except OSError:
+        return True
+
+
+def incomplete_journals() -> List[str]:
+    # Returns the journals of runs that did not complete (excluding the runs that are still
+    # active, in this or another instance of the app).
+
+    return [
+        path
+        for path in sorted(glob.glob(os.path.join(journal_dir(), "*.jsonl")))
+        if not _is_active(path)
+    ]
+
+
+def pending_operations(path: str) -> List[Dict[str, object]]:
+    # Returns the operations of a journal that did not complete, in order: operations that began
+    # but did not complete, and writes that did not begin an operation. Rewrites whose original
+    # has been removed are marked ('removed').
+
+    records: List[Dict[str, object]] = _read(path)
+    pending: Dict[Tuple[str, object], Dict[str, object]] = {}
+    for record in records:
+        op: object = record.get("op")
+        if op == "write":
+            pending[("write", record["src"])] = record
+        elif op == "cancel":
+            pending.pop(("write", record["src"]), None)
+        elif op == "begin":
+            pending.pop(("write", record["src"]), None)
+            pending[("begin", record["id"])] = record
+        elif op == "removed":
+            for entry_id in record["ids"]:
+                if ("begin", entry_id) in pending:
+                    pending[("begin", entry_id)]["removed"] = True
+        elif op == "done":
+            pending.pop(("begin", record["id"]), None)
+    return list(pending.values())
+
+
+def _set_date(path: str, dt: datetime.datetime) -> None:
+    img: Image = open_image(path)
+    img.set_date_taken(dt)
+    Image.replace_original(path, img.write(), path, is_send2trash=False)
+
+
+def _rename(src: str, dst: str) -> None:
+    print(f"Renaming '{src}' -> '{dst}'")
+    os.rename(src, dst)
+    move_sidecar(src, dst)
+
+
+def _restore_swap(record: Dict[str, object], is_forward: bool) -> None:
+    # Moves a file that was left at its temporary name (of a rename cycle) back to its original
+    # name, or next to it if the name has been taken by now. When rolling back, the date of a file
+    # that was patched in place (before it was moved) is restored.
+
+    src: str = record["src"]
+    dst: str = record["dst"]
+    if os.path.isfile(dst):
+        if os.path.exists(src):
+            src = Image.add_suffix(src)
+        _rename(dst, src)
+
+    old_date: Optional[datetime.datetime] = _from_iso(record["old_date"])
+    new_date: Optional[datetime.datetime] = _from_iso(record["new_date"])
+    if not is_forward and old_date is not None and os.path.isfile(src):
+        if open_image(src).date_taken() == new_date:
+            _set_date(src, old_date)
+
+
+def _roll_forward(record: Dict[str, object]) -> None:
+    kind: object = record["kind"]
+    if kind == KIND_SWAP:
+        _restore_swap(record, is_forward=True)
+        return
+
+    src: str = record["src"]
+    dst: str = record["dst"]
+    new_date: Optional[datetime.datetime] = _from_iso(record["new_date"])
+
+    if kind in (KIND_RENAME, KIND_PATCH):
+        if os.path.isfile(src) and not os.path.exists(dst):
+            _rename(src, dst)
+    elif kind == KIND_REWRITE:
+        tmp: str = record["tmp"]
+        if os.path.isfile(tmp):
+            # the name of a removed original may have been taken by another file (of a rename
+            # cycle), which then also holds its sidecar
+            is_removed: bool = record.get("removed", False) or not os.path.isfile(src)
+            if not is_removed:
+                if record["trash"]:
+                    print(f"Moving '{src}' to trash")
+                    send2trash.send2trash(src)
+                else:
+                    os.remove(src)
+            dst = Image.add_suffix(dst)
+            print(f"Saving '{src}' -> '{dst}'")
+            os.replace(tmp, dst)
+            if not os.path.exists(src):
+                move_sidecar(src, dst)
+            move_sidecar(tmp, dst)
+            if new_date is not None and has_sidecar(dst):
+                write_sidecar(dst, date_taken=new_date)
+    elif kind == KIND_SIDECAR:
+        write_sidecar(dst, date_taken=new_date)
+
+
+def _roll_back(record: Dict[str, object]) -> None:
+    src: str = record["src"]
+    old_date: Optional[datetime.datetime] = _from_iso(record["old_date"])
+    new_date: Optional[datetime.datetime] = _from_iso(record["new_date"])
+
+    if record["op"] == "write":
+        # a worker may have patched the file in place
+        if old_date is not None and os.path.isfile(src):
+            if open_image(src).date_taken() == new_date:
+                _set_date(src, old_date)
+        return
+
+    kind: object = record["kind"]
+    dst: str = record["dst"]
+    if kind == KIND_SWAP:
+        _restore_swap(record, is_forward=False)
+    elif kind in (KIND_RENAME, KIND_PATCH):
+        if os.path.isfile(dst) and not os.path.exists(src):
+            _rename(dst, src)
+        if kind == KIND_PATCH and old_date is not None and os.path.isfile(src):
+            _set_date(src, old_date)
+    elif kind == KIND_REWRITE:
+        # the original is trashed (or removed) right before its rewritten copy is moved into
+        # place: once it is gone, the changes are undone on the rewritten copy
+        tmp: str = record["tmp"]
+        if os.path.isfile(tmp):
+            if record.get("removed", False) or not os.path.isfile(src):
+                # (next to its name, if it has been taken by another file of a rename cycle)
+                src = Image.add_suffix(src)
+                _rename(tmp, src)
+                if old_date is not None:
+                    _set_date(src, old_date)
+            else:
+                os.remove(tmp)
+        elif os.path.isfile(dst) and (src == dst or not os.path.exists(src)):
+            if src != dst:
+                _rename(dst, src)
+            if old_date is not None:
+                _set_date(src, old_date)
+    elif kind == KIND_SIDECAR:
+        if old_date is not None:
+            write_sidecar(dst, date_taken=old_date)
+
+
+def recover_journal(path: str, is_forward: bool) -> Tuple[int, int]:
+    # Rolls the incomplete operations of a journal forward (completes them, in order) or back
+    # (undoes them, in reverse order), and removes the journal. Writes that did not begin an
+    # operation are always rolled back, as their target names were never assigned. Leftover
+    # temporary files of the journal are removed (only those it recorded: other instances may be
+    # writing in the same directories). Returns
+    # the number of operations that were recovered and that failed.
+
+    records: List[Dict[str, object]] = _read(path)
+    pending: List[Dict[str, object]] = pending_operations(path)
+    if not is_forward:
+        pending.reverse()
+
+    # files left at a temporary name (by an open rename cycle) are moved back last, once the
+    # names have been rolled forward or back
+    pending.sort(key=lambda record: record.get("kind") == KIND_SWAP)
+
+    num_recovered: int = 0
+    num_failed: int = 0
+    for record in pending:
+        try:
+            if is_forward and record["op"] == "begin":
+                _roll_forward(record)
+            else:
+                _roll_back(record)
+            num_recovered += 1
+        except Exception as e:
+            print(f"Cannot recover '{record.get('src')}': {e!r}")
+            num_failed += 1
+
+    # remove leftovers
+    tmp_paths: Set[str] = set(
+        record["tmp"]
+        for record in records
+        if record.get("op") in ("write", "begin") and record.get("tmp") is not None
+    )
+    for tmp_path in tmp_paths:
+        if os.path.isfile(tmp_path):
+            os.remove(tmp_path)
+
+    if num_failed == 0:
+        os.remove(path)
+        if os.path.exists(_lock_path(path)):
+            os.remove(_lock_path(path))
+    return num_recovered, num_failed
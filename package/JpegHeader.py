@@ -0,0 +1,200 @@
+from __future__ import annotations
+import struct
+from typing import BinaryIO, Dict, List, Optional, Tuple
+
+
+class JpegHeader(object):
+    # Walks the JPEG marker segments from the start of a file and stops as soon as both the APP1
+    # Exif segment and the SOF (start of frame) segment have been read, or the image data starts,
+    # so the entropy-coded image data is never read. For a typical camera JPEG this reads well
+    # under 64 KB.
+
+    _SOI: bytes = b"\xff\xd8"
+    _APP1: int = 0xE1
+    _SOS: int = 0xDA
+    _EOI: int = 0xD9
+    _APP0: int = 0xE0
+    _SOF: Tuple[int, ...] = tuple(
+        marker for marker in range(0xC0, 0xD0) if marker not in (0xC4, 0xC8, 0xCC)
+    )
+    _EXIF_ID: bytes = b"Exif\x00\x00"
+    _EXIF_IFD_POINTER: int = 0x8769
+    _TYPE_ASCII: int = 2
+
+    _path: str
+    _segments: List[Tuple[int, int, int]]
+    _exif: Optional[bytes]
+    _exif_offset: Optional[int]
+    _exif_segment_offset: Optional[int]
+    _size: Optional[Tuple[int, int]]
+
+    def __init__(self, path: str) -> None:
+        self._path = path
+        self._segments = []
+        self._exif = None
+        self._exif_offset = None
+        self._exif_segment_offset = None
+        self._size = None
+
+        f: BinaryIO
+        with open(path, "rb") as f:
+            self._read(f)
+
+    # protected
+    def _read(self, f: BinaryIO) -> None:
+        if f.read(2) != self._SOI:
+            raise ValueError(f"'{self._path}' is not a JPEG file")
+
+        while True:
+            # markers may be preceded by any number of 0xff fill bytes
+            byte: bytes = f.read(1)
+            if byte != b"\xff":
+                return
+            marker: int = 0xFF
+            while marker == 0xFF:
+                byte = f.read(1)
+                if not byte:
+                    return
+                marker = byte[0]
+
+            offset: int = f.tell() - 2
+            if marker in (self._SOS, self._EOI):
+                self._segments.append((marker, offset, 0))
+                return
+
+            length_bytes: bytes = f.read(2)
+            if len(length_bytes) < 2:
+                return
+            length: int = struct.unpack(">H", length_bytes)[0]
+            self._segments.append((marker, offset, length + 2))
+
+            if marker == self._APP1 and self._exif is None:
+                data: bytes = f.read(length - 2)
+                if data[: len(self._EXIF_ID)] == self._EXIF_ID:
+                    # keep the TIFF structure (the payload after the 'Exif' identifier)
+                    self._exif = data[len(self._EXIF_ID):]
+                    self._exif_offset = offset + 4 + len(self._EXIF_ID)
+                    self._exif_segment_offset = offset
+            elif marker in self._SOF and self._size is None:
+                # precision (1 byte), height (2 bytes), width (2 bytes), components...
+                data: bytes = f.read(5)
+                f.seek(length - 2 - len(data), 1)
+                if len(data) == 5:
+                    height, width = struct.unpack(">HH", data[1:5])
+                    self._size = (width, height)
+            else:
+                f.seek(length - 2, 1)
+
+            if self._exif is not None and self._size is not None:
+                return
+
+    def _ifd_entries(self, pointer: int) -> Dict[int, Tuple[int, int, int]]:
+        # Returns the entries of the IFD at the given (TIFF-relative) pointer as a mapping of tag
+        # to (type, count, TIFF-relative offset of the value field).
+
+        tiff: bytes = self._exif
+        endian: str = "<" if tiff[0:2] == b"II" else ">"
+        entries: Dict[int, Tuple[int, int, int]] = {}
+        if pointer + 2 > len(tiff):
+            return entries
+        num_entries: int = struct.unpack(f"{endian}H", tiff[pointer: pointer + 2])[0]
+        for i in range(num_entries):
+            entry_offset: int = pointer + 2 + 12 * i
+            if entry_offset + 12 > len(tiff):
+                break
+            tag, type_, count = struct.unpack(
+                f"{endian}HHL", tiff[entry_offset: entry_offset + 8]
+            )
+            entries[tag] = (type_, count, entry_offset + 8)
+        return entries
+
+    # public
+    def path(self) -> str:
+        return self._path
+
+    def segments(self) -> List[Tuple[int, int, int]]:
+        # Returns the segments read so far as (marker, file offset, total length) tuples.
+
+        return self._segments
+
+    def has_exif(self) -> bool:
+        return self._exif is not None
+
+    def exif(self) -> Optional[bytes]:
+        # Returns the TIFF structure embedded in the APP1 Exif segment (which can be passed to
+        # 'piexif.load' directly), or None if the file has no Exif segment.
+
+        return self._exif
+
+    def size(self) -> Optional[Tuple[int, int]]:
+        # Returns the (width, height) stored in the SOF segment, i.e., before applying the Exif
+        # orientation, or None if no SOF segment was found.
+
+        return self._size
+
+    def exif_offset(self) -> Optional[int]:
+        # Returns the file offset of the TIFF header within the APP1 Exif segment. Offsets stored
+        # in the Exif IFDs are relative to this position.
+
+        return self._exif_offset
+
+    def exif_insert_offset(self) -> int:
+        # Returns the file offset from which the original file is kept when a new APP1 Exif
+        # segment is written directly after SOI. As in 'piexif.insert', an Exif segment at the
+        # start of the file (possibly after an APP0 segment) is replaced, and otherwise a leading
+        # APP0 segment is replaced.
+
+        def is_marker(index: int, marker: int) -> bool:
+            return index < len(self._segments) and self._segments[index][0] == marker
+
+        def is_exif(index: int) -> bool:
+            return (
+                index < len(self._segments)
+                and self._segments[index][1] == self._exif_segment_offset
+            )
+
+        def end(index: int) -> int:
+            _, offset, length = self._segments[index]
+            return offset + length
+
+        if is_marker(0, self._APP0) and is_exif(1):
+            return end(1)
+        if is_marker(0, self._APP0) or is_exif(0):
+            return end(0)
+        return len(self._SOI)
+
+    def ascii_offset(self, tag: int, length: int) -> Optional[int]:
+        # Returns the file offset of the value of an ASCII tag in the Exif IFD, if the tag exists
+        # and holds exactly 'length' characters (plus the terminating NUL). Otherwise, returns
+        # None.
+
+        if self._exif is None:
+            return None
+        tiff: bytes = self._exif
+        endian: str = "<" if tiff[0:2] == b"II" else ">"
+        if len(tiff) < 8:
+            return None
+
+        ifd0_pointer: int = struct.unpack(f"{endian}L", tiff[4:8])[0]
+        ifd0: Dict[int, Tuple[int, int, int]] = self._ifd_entries(ifd0_pointer)
+        if self._EXIF_IFD_POINTER not in ifd0:
+            return None
+        exif_pointer_field: int = ifd0[self._EXIF_IFD_POINTER][2]
+        exif_pointer: int = struct.unpack(
+            f"{endian}L", tiff[exif_pointer_field: exif_pointer_field + 4]
+        )[0]
+
+        exif_ifd: Dict[int, Tuple[int, int, int]] = self._ifd_entries(exif_pointer)
+        if tag not in exif_ifd:
+            return None
+        type_, count, value_field = exif_ifd[tag]
+        if type_ != self._TYPE_ASCII or count != length + 1:
+            return None
+
+        # values longer than 4 bytes are stored at an offset; shorter ones in the field itself
+        value_offset: int = value_field
+        if count > 4:
+            value_offset = struct.unpack(f"{endian}L", tiff[value_field: value_field + 4])[0]
+        if value_offset + count > len(tiff):
+            return None
+        return self._exif_offset + value_offset
@@ -1,26 +1,43 @@
 import logging
-from typing import Optional, List, Tuple
+import functools
+from typing import Dict, Optional, List, Tuple
 from PySide6 import QtCore, QtWidgets, QtGui
 
 from package.FileList import FileList
 from package.FileTree import FileTree
 from package.ImageViewer import ImageViewer
 from package.FileEdit import FileEdit
-from package.Image import Image
+from package.ImageMetadata import ImageMetadata
 from package.FileModify import FileModify
+from package.FilePlan import OUTPUT_REWRITE, OUTPUT_SIDECAR
+from package.Journal import incomplete_journals, pending_operations, recover_journal
+from package.ImageBackend import (
+    backend_names,
+    benchmark_backends,
+    default_backend_name,
+    has_backend,
+    set_default_backend,
+)
 
 
 class MainWindow(QtWidgets.QMainWindow):
 
     _SIZE: Tuple[int, int] = (920, 920)
+    _SETTING_BACKEND: str = "backend"
+    _NUM_BENCHMARK_FILES: int = 8
 
     _file_tree: FileTree
     _file_list: FileList
     _image_viewer: ImageViewer
     _file_edit: FileEdit
     _file_modify: FileModify
+    _settings: QtCore.QSettings
+    _backend_actions: Dict[str, QtGui.QAction]
+    _action_sidecar_rename: QtGui.QAction
 
-    def __init__(self, parent: Optional[QtWidgets.QWidget] = None) -> None:
+    def __init__(
+        self, backend: Optional[str] = None, parent: Optional[QtWidgets.QWidget] = None
+    ) -> None:
         """
         Signal flow:
         
@@ -38,15 +55,22 @@ class MainWindow(QtWidgets.QMainWindow):
           - Action: user selects (clicks checkboxes or uses 'Select highlighted' button) path(s) from list 
               -> Signal: 'signal_selection_changed'
             - FileModify: saves image paths
+          - Action: user types a filter (metadata query) -> Signal: 'signal_highlight_changed' if
+              the highlighted image is no longer shown
+          - Action: files are added to or removed from the directory -> Signal 'signal_files_changed'
+            - ImageViewer: updates 'Next' and 'Previous' buttons (or clears if no files are left)
         
         - ImageViewer:
           - Action: user cycles through images with arrows keys -> Signal: 'signal_image_cycle'
             - FileList: returns the corresponding next/previous image path
         
         - FileModify:
+          - Action: user modifies files according to FileEdit -> Signal: 'signal_renamed'
+            - FileList: applies the renames (without listing the directory again)
           - Action: user modifies files according to FileEdit -> Signal: 'signal_done'
             - FileTree: enables/disables widget
-            - FileList: enables/disables widget
+            - FileList: enables/disables widget, pauses/resumes watching the directory and indexes
+              the metadata of the modified files (for its filter)
             - FileEdit: enables/disables widget
         """
 
@@ -55,6 +79,13 @@ class MainWindow(QtWidgets.QMainWindow):
         self.setWindowTitle("ExifEdit")
         self.setFixedSize(*self._SIZE)
         settings: QtCore.QSettings = QtCore.QSettings("ArtvL", "ExifEdit")
+        self._settings = settings
+
+        # image backend: command-line argument, or else the saved choice
+        if backend is None and settings.contains(self._SETTING_BACKEND):
+            backend = settings.value(self._SETTING_BACKEND)
+        if backend is not None and has_backend(backend):
+            set_default_backend(backend)
 
         # widgets - file-tree
         self._file_tree: FileTree = FileTree(settings, parent=self)
@@ -73,6 +104,9 @@ class MainWindow(QtWidgets.QMainWindow):
         self._file_list.signal_highlight_changed.connect(
             self.on_filelist_highlight_changed
         )  # dependency: image-viewer, file-edit
+        self._file_list.signal_files_changed.connect(
+            self.on_filelist_files_changed
+        )  # dependency: image-viewer, file-edit, file-modify
         self._image_viewer.signal_image_cycle_next.connect(
             self.on_imageviewer_image_cycle_next
         )
@@ -82,6 +116,9 @@ class MainWindow(QtWidgets.QMainWindow):
 
         # widgets - file-modify
         self._file_modify: FileModify = FileModify(self._file_edit, parent=self)
+        self._file_modify.signal_renamed.connect(
+            self._file_list.apply_renames
+        )  # dependency: file-list
         self._file_modify.signal_done.connect(
             self.on_file_modify_done
         )  # dependencies: file-tree, file-list, file-edit
@@ -130,6 +167,46 @@ class MainWindow(QtWidgets.QMainWindow):
         action_send2trash.triggered.connect(self._file_modify.enable_send2trash)
         self._file_menu.addAction(action_send2trash)
 
+        # menu - file - output
+        output_menu: QtWidgets.QMenu = self._file_menu.addMenu("Output")
+        output_group: QtGui.QActionGroup = QtGui.QActionGroup(self)
+        for output, text in (
+            (OUTPUT_REWRITE, "Rewrite image files"),
+            (OUTPUT_SIDECAR, "Write XMP sidecar files (leave images untouched)"),
+        ):
+            action_output: QtGui.QAction = QtGui.QAction(text, self)
+            action_output.setCheckable(True)
+            action_output.setChecked(output == OUTPUT_REWRITE)
+            action_output.triggered.connect(functools.partial(self.on_output_selected, output))
+            output_group.addAction(action_output)
+            output_menu.addAction(action_output)
+        output_menu.addSeparator()
+        self._action_sidecar_rename = QtGui.QAction("Rename files in sidecar mode", self)
+        self._action_sidecar_rename.setCheckable(True)
+        self._action_sidecar_rename.setChecked(True)
+        self._action_sidecar_rename.setEnabled(False)
+        self._action_sidecar_rename.triggered.connect(self._file_modify.enable_sidecar_rename)
+        output_menu.addAction(self._action_sidecar_rename)
+
+        # menu - file - image backend
+        backend_menu: QtWidgets.QMenu = self._file_menu.addMenu("Image backend")
+        backend_group: QtGui.QActionGroup = QtGui.QActionGroup(self)
+        self._backend_actions = {}
+        for name in backend_names():
+            action_backend: QtGui.QAction = QtGui.QAction(name, self)
+            action_backend.setCheckable(True)
+            action_backend.setChecked(name == default_backend_name())
+            action_backend.triggered.connect(functools.partial(self.on_backend_selected, name))
+            backend_group.addAction(action_backend)
+            backend_menu.addAction(action_backend)
+            self._backend_actions[name] = action_backend
+        backend_menu.addSeparator()
+        action_benchmark: QtGui.QAction = QtGui.QAction(
+            "Select fastest backend for current folder", self
+        )
+        action_benchmark.triggered.connect(self.on_benchmark_backends)
+        backend_menu.addAction(action_benchmark)
+
         # menu - view
         self._view_menu = self._menu.addMenu("View")
         action_resize: QtGui.QAction = QtGui.QAction("Enable window resizing", self)
@@ -138,6 +215,9 @@ class MainWindow(QtWidgets.QMainWindow):
         action_resize.triggered.connect(self.enable_resize)
         self._view_menu.addAction(action_resize)
 
+        # recover interrupted runs once the window is shown
+        QtCore.QTimer.singleShot(0, self.on_recover_journals)
+
     @QtCore.Slot()
     def exit_app(self, is_checked: bool) -> None:
         QtWidgets.QApplication.quit()
@@ -151,6 +231,105 @@ class MainWindow(QtWidgets.QMainWindow):
             self.resize(*self._SIZE)
             self.setFixedSize(*self._SIZE)
 
+    @QtCore.Slot()
+    def on_backend_selected(self, name: str, is_checked: bool = True) -> None:
+        set_default_backend(name)
+        self._settings.setValue(self._SETTING_BACKEND, name)
+        self._backend_actions[name].setChecked(True)
+
+    @QtCore.Slot()
+    def on_recover_journals(self) -> None:
+        # Offers to roll forward or back the file operations of runs that were interrupted.
+
+        journals: List[str] = []
+        num_pending: int = 0
+        for path in incomplete_journals():
+            num_operations: int = len(pending_operations(path))
+            if num_operations == 0:
+                # all operations have completed: remove the journal
+                recover_journal(path, is_forward=True)
+            else:
+                journals.append(path)
+                num_pending += num_operations
+        if not journals:
+            return
+
+        message_box: QtWidgets.QMessageBox = QtWidgets.QMessageBox(self)
+        message_box.setIcon(QtWidgets.QMessageBox.Warning)
+        message_box.setWindowTitle("Interrupted run")
+        message_box.setText(
+            f"{num_pending} file operation(s) of an interrupted run did not complete."
+        )
+        message_box.setInformativeText(
+            "Roll forward to complete them, or roll back to undo them."
+        )
+        button_forward: QtWidgets.QPushButton = message_box.addButton(
+            "Roll forward", QtWidgets.QMessageBox.AcceptRole
+        )
+        button_back: QtWidgets.QPushButton = message_box.addButton(
+            "Roll back", QtWidgets.QMessageBox.DestructiveRole
+        )
+        message_box.addButton("Later", QtWidgets.QMessageBox.RejectRole)
+        message_box.exec()
+        clicked: QtWidgets.QAbstractButton = message_box.clickedButton()
+        if clicked is not button_forward and clicked is not button_back:
+            return
+
+        num_failed: int = 0
+        QtWidgets.QApplication.setOverrideCursor(QtCore.Qt.WaitCursor)
+        try:
+            for path in journals:
+                num_failed += recover_journal(path, is_forward=clicked is button_forward)[1]
+        finally:
+            QtWidgets.QApplication.restoreOverrideCursor()
+        if num_failed > 0:
+            QtWidgets.QMessageBox.warning(
+                self,
+                "Interrupted run",
+                f"{num_failed} file operation(s) could not be recovered; they will be offered "
+                "again on the next start.",
+            )
+
+    @QtCore.Slot()
+    def on_output_selected(self, output: str, is_checked: bool = True) -> None:
+        self._file_modify.set_output(output)
+        self._action_sidecar_rename.setEnabled(output == OUTPUT_SIDECAR)
+
+    @QtCore.Slot()
+    def on_benchmark_backends(self) -> None:
+        # Times all image backends on a sample of the files in the current folder and selects the
+        # fastest backend that round-trips the EXIF fields correctly.
+
+        paths: List[str] = self._file_list.paths()
+        if not paths:
+            QtWidgets.QMessageBox.information(
+                self, "Image backend", "Open a folder with images to benchmark the backends."
+            )
+            return
+        step: int = max(1, len(paths) // self._NUM_BENCHMARK_FILES)
+        sample: List[str] = paths[::step][: self._NUM_BENCHMARK_FILES]
+
+        QtWidgets.QApplication.setOverrideCursor(QtCore.Qt.WaitCursor)
+        try:
+            timings: Dict[str, Optional[float]] = benchmark_backends(sample)
+        finally:
+            QtWidgets.QApplication.restoreOverrideCursor()
+
+        lines: List[str] = []
+        for name, timing in timings.items():
+            if timing is None:
+                lines.append(f"{name}: failed")
+            else:
+                lines.append(f"{name}: {1000 * timing / len(sample):.1f} ms per image")
+        passed: Dict[str, float] = {
+            name: timing for name, timing in timings.items() if timing is not None
+        }
+        if passed:
+            fastest: str = min(passed, key=passed.get)
+            self.on_backend_selected(fastest)
+            lines.append(f"\nSelected '{fastest}'")
+        QtWidgets.QMessageBox.information(self, "Image backend", "\n".join(lines))
+
     @QtCore.Slot()
     def on_filelist_selection_changed(self) -> None:
         filepaths: List[str] = self._file_list.selected_paths()
@@ -168,9 +347,10 @@ class MainWindow(QtWidgets.QMainWindow):
             else:
                 self._image_viewer.enable_buttons(False)
 
-            # load first highlighted image
-            first_path: str = self._file_list.highlighted_paths()[0]
-            self.on_filelist_highlight_changed(first_path)
+            # load first highlighted image (none if the filter matches no files)
+            highlighted_paths: List[str] = self._file_list.highlighted_paths()
+            if highlighted_paths:
+                self.on_filelist_highlight_changed(highlighted_paths[0])
             
             selected_paths: List[str] = self._file_list.selected_paths()
             if len(selected_paths) > 1:
@@ -182,9 +362,19 @@ class MainWindow(QtWidgets.QMainWindow):
             self._file_edit.clear()
             self._file_modify.clear_images()
 
+    @QtCore.Slot()
+    def on_filelist_files_changed(self, num_files: int) -> None:
+        # files were added to or removed from the directory
+        if num_files > 0:
+            self._image_viewer.enable_buttons(num_files > 1)
+        elif self._image_viewer.has_image():
+            self._image_viewer.clear()
+            self._file_edit.clear()
+            self._file_modify.clear_images()
+
     @QtCore.Slot()
     def on_filelist_highlight_changed(self, path: str) -> None:
-        img: Image = self._image_viewer.load_image(path)
+        img: ImageMetadata = self._image_viewer.load_image(path)
         self._file_edit.set_file(img)
 
     @QtCore.Slot()
@@ -194,31 +384,27 @@ class MainWindow(QtWidgets.QMainWindow):
             path = self._file_list.next_highlight()
         else:
             path = self._file_list.previous_highlight()
-        self._image_viewer.load_image(path)
+        if path is not None:
+            self._image_viewer.load_image(path)
 
     @QtCore.Slot()
     def on_file_modify_done(self, is_done: bool) -> None:
         if not is_done:
             self._file_tree.setEnabled(False)
             self._file_list.setEnabled(False)
+            self._file_list.set_watching(False)
             self._file_edit.setEnabled(False)
         else:
             self._file_tree.setEnabled(True)
             self._file_edit.setEnabled(True)
             self._file_list.setEnabled(True)
 
-            # extract highlighted FileList filepaths
-            highlighted_unmodified_filepaths: List[str] = self._file_list.highlighted_paths()
-            highlighted_modified_filepaths: List[str] = highlighted_unmodified_filepaths.copy()
-            
-            # extract FileModify filepaths
-            unmodified_filepaths: List[str] = self._file_modify.filepaths()
-            modified_filepaths: List[str] = self._file_modify.modified_filepaths()
-
-            # update highlighted unmodified filepaths with modified filepaths
-            indices = [index for index, value in enumerate(highlighted_unmodified_filepaths) if value in unmodified_filepaths]
-            modified_filepaths_at_indices = [modified_filepaths[index] for index in indices]
-            for index, new_filepath in zip(indices, modified_filepaths_at_indices):
-                highlighted_modified_filepaths[index] = new_filepath
+            # the renames are already applied to the file list ('signal_renamed'; the modified
+            # files stay selected): resume watching the directory, and index the changed metadata
+            self._file_list.set_watching(True)
+            self._file_list.update_metadata(self._file_modify.modified_filepaths())
 
-            self._file_list.reload(selected_filepaths=modified_filepaths, highlighted_filepaths=highlighted_modified_filepaths)
+            # load the (possibly renamed) first highlighted image
+            highlighted_paths: List[str] = self._file_list.highlighted_paths()
+            if highlighted_paths:
+                self.on_filelist_highlight_changed(highlighted_paths[0])
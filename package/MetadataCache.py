@@ -0,0 +1,289 @@
+from __future__ import annotations
+import os
+import sys
+import sqlite3
+import datetime
+import threading
+from collections import OrderedDict
+from typing import Callable, Iterable, List, Optional, Tuple
+
+from package.ImageBackend import open_image
+from package.ImageMetadata import ImageMetadata
+from package.Sidecar import sidecar_path
+
+
+def cache_dir() -> str:
+    # Returns the per-user cache directory of the app (following the platform conventions).
+
+    if sys.platform == "win32":
+        root: str = os.environ.get("LOCALAPPDATA", os.path.expanduser("~\\AppData\\Local"))
+        return os.path.join(root, "ExifEdit", "Cache")
+    if sys.platform == "darwin":
+        return os.path.expanduser("~/Library/Caches/ExifEdit")
+    root = os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache"))
+    return os.path.join(root, "ExifEdit")
+
+
+def load_metadata(path: str) -> ImageMetadata:
+    # Reads the metadata of an image file with the default backend (without using the cache),
+    # merged with its XMP sidecar.
+
+    return open_image(path).metadata()
+
+
+class MetadataCache(object):
+    # Persistent cache of image metadata: an in-memory LRU in front of a SQLite database (in WAL
+    # mode) in the user cache directory. Entries are keyed by path and are only valid as long as
+    # the size and modification time of the file (and of its XMP sidecar) match, so changed files
+    # are re-read automatically. Looking up a cached file therefore only costs two stat calls.
+
+    _FILENAME: str = "metadata.sqlite3"
+    _VERSION: int = 2
+    _COLUMNS: Tuple[str, ...] = (
+        "path",
+        "size",
+        "mtime_ns",
+        "width",
+        "height",
+        "orientation",
+        "date_taken",
+        "camera_maker",
+        "camera_model",
+        "lens_model",
+        "fstop",
+        "exp_time",
+        "iso",
+        "focal_length",
+        "sidecar_mtime_ns",
+    )
+
+    _path: Optional[str]
+    _loader: Callable[[str], ImageMetadata]
+    _lru: OrderedDict
+    _lru_size: int
+    _lock: threading.RLock
+    _connection: Optional[sqlite3.Connection]
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        loader: Callable[[str], ImageMetadata] = load_metadata,
+        lru_size: int = 4096,
+    ) -> None:
+        if path is None:
+            path = os.path.join(cache_dir(), self._FILENAME)
+        self._path = path
+        self._loader = loader
+        self._lru = OrderedDict()
+        self._lru_size = lru_size
+        self._lock = threading.RLock()
+        self._connection = None
+
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self._connection = sqlite3.connect(
+                path, check_same_thread=False, isolation_level=None
+            )
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            version: int = self._connection.execute("PRAGMA user_version").fetchone()[0]
+            if version != self._VERSION:
+                self._connection.execute("DROP TABLE IF EXISTS metadata")
+                self._connection.execute(f"PRAGMA user_version={self._VERSION}")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS metadata ("
+                "path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, width INTEGER, "
+                "height INTEGER, orientation INTEGER, date_taken TEXT, camera_maker TEXT, "
+                "camera_model TEXT, lens_model TEXT, fstop REAL, exp_time REAL, iso INTEGER, "
+                "focal_length REAL, sidecar_mtime_ns INTEGER)"
+            )
+        except (OSError, sqlite3.Error) as e:
+            # without a database, the cache only lives in memory
+            print(f"Cannot open metadata cache '{path}': {e}")
+            self._connection = None
+
+    # protected
+    @classmethod
+    def _to_row(cls, metadata: ImageMetadata) -> tuple:
+        date_taken: Optional[datetime.datetime] = metadata.date_taken()
+        width, height = metadata.resolution()
+        return (
+            metadata.path(),
+            metadata.size(),
+            metadata.mtime_ns(),
+            width,
+            height,
+            metadata.orientation(),
+            date_taken.isoformat() if date_taken is not None else None,
+            metadata.camera_maker(),
+            metadata.camera_model(),
+            metadata.lens_model(),
+            metadata.fstop(),
+            metadata.exp_time(),
+            metadata.iso(),
+            metadata.focal_length(),
+            metadata.sidecar_mtime_ns(),
+        )
+
+    @classmethod
+    def _from_row(cls, row: tuple) -> ImageMetadata:
+        (
+            path, size, mtime_ns, width, height, orientation, date_taken, camera_maker,
+            camera_model, lens_model, fstop, exp_time, iso, focal_length, sidecar_mtime_ns,
+        ) = row
+        return ImageMetadata(
+            path=path,
+            size=size,
+            mtime_ns=mtime_ns,
+            resolution=(width, height),
+            orientation=orientation,
+            date_taken=(
+                datetime.datetime.fromisoformat(date_taken) if date_taken is not None else None
+            ),
+            camera_maker=camera_maker,
+            camera_model=camera_model,
+            lens_model=lens_model,
+            fstop=fstop,
+            exp_time=exp_time,
+            iso=iso,
+            focal_length=focal_length,
+            sidecar_mtime_ns=sidecar_mtime_ns,
+        )
+
+    @staticmethod
+    def _sidecar_mtime_ns(path: str) -> Optional[int]:
+        try:
+            return os.stat(sidecar_path(path)).st_mtime_ns
+        except OSError:
+            return None
+
+    def _remember(self, metadata: ImageMetadata) -> None:
+        self._lru[metadata.path()] = metadata
+        self._lru.move_to_end(metadata.path())
+        while len(self._lru) > self._lru_size:
+            self._lru.popitem(last=False)
+
+    def _store(self, metadatas: List[ImageMetadata]) -> None:
+        if self._connection is None:
+            return
+        placeholders: str = ", ".join("?" for _ in self._COLUMNS)
+        query: str = f"INSERT OR REPLACE INTO metadata VALUES ({placeholders})"
+        for metadata in metadatas:
+            try:
+                self._connection.execute(query, self._to_row(metadata))
+            except sqlite3.Error:
+                # values that cannot be stored (e.g., multi-valued tags) are only kept in memory
+                pass
+
+    # public
+    def path(self) -> Optional[str]:
+        return self._path
+
+    def get(
+        self,
+        path: str,
+        stat: Optional[os.stat_result] = None,
+        current_path: Optional[str] = None,
+    ) -> Optional[ImageMetadata]:
+        # Returns the cached metadata of a file if the file has not changed since it was cached;
+        # otherwise, returns None. If the file has been renamed since, 'current_path' is its path
+        # now (where it, and its sidecar, are checked).
+
+        if current_path is None:
+            current_path = path
+        if stat is None:
+            try:
+                stat = os.stat(current_path)
+            except OSError:
+                return None
+
+        with self._lock:
+            metadata: Optional[ImageMetadata] = self._lru.get(path)
+            if metadata is None and self._connection is not None:
+                query: str = f"SELECT {', '.join(self._COLUMNS)} FROM metadata WHERE path = ?"
+                row: Optional[tuple] = self._connection.execute(query, (path,)).fetchone()
+                if row is not None:
+                    metadata = self._from_row(row)
+            if metadata is None:
+                return None
+            if metadata.size() != stat.st_size or metadata.mtime_ns() != stat.st_mtime_ns:
+                return None
+            if metadata.sidecar_mtime_ns() != self._sidecar_mtime_ns(current_path):
+                return None
+            self._remember(metadata)
+            return metadata
+
+    def load(self, path: str) -> ImageMetadata:
+        # Returns the metadata of a file, from the cache if possible; otherwise, the file is read
+        # and the result is cached.
+
+        metadata: Optional[ImageMetadata] = self.get(path)
+        if metadata is None:
+            metadata = self._loader(path)
+            self.put(metadata)
+        return metadata
+
+    def put(self, metadata: ImageMetadata) -> None:
+        self.put_many([metadata])
+
+    def put_many(self, metadatas: Iterable[ImageMetadata]) -> None:
+        metadatas = list(metadatas)
+        with self._lock:
+            for metadata in metadatas:
+                self._remember(metadata)
+            if self._connection is not None:
+                self._connection.execute("BEGIN")
+                self._store(metadatas)
+                self._connection.execute("COMMIT")
+
+    def remove(self, path: str) -> None:
+        with self._lock:
+            self._lru.pop(path, None)
+            if self._connection is not None:
+                self._connection.execute("DELETE FROM metadata WHERE path = ?", (path,))
+
+    def update(self, old_path: str, new_path: str) -> ImageMetadata:
+        # Updates the cache after a file has been rewritten and/or renamed.
+
+        if old_path != new_path:
+            self.remove(old_path)
+        metadata: ImageMetadata = self._loader(new_path)
+        self.put(metadata)
+        return metadata
+
+    def rename(self, old_path: str, new_path: str) -> ImageMetadata:
+        # Updates the cache after a file (and its sidecar) has only been renamed (its contents,
+        # size and modification time are unchanged), without reading the file again.
+
+        with self._lock:
+            metadata: Optional[ImageMetadata] = self.get(old_path, current_path=new_path)
+            if metadata is None:
+                return self.update(old_path, new_path)
+            if old_path != new_path:
+                self.remove(old_path)
+                metadata = metadata.replace(path=new_path)
+                self.put(metadata)
+            return metadata
+
+    def close(self) -> None:
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+
+_default_cache: Optional[MetadataCache] = None
+_default_cache_pid: Optional[int] = None
+_default_cache_lock: threading.Lock = threading.Lock()
+
+
+def default_cache() -> MetadataCache:
+    # Returns the metadata cache shared within this process (a new connection is opened in child
+    # processes).
+
+    global _default_cache, _default_cache_pid
+    with _default_cache_lock:
+        if _default_cache is None or _default_cache_pid != os.getpid():
+            _default_cache = MetadataCache()
+            _default_cache_pid = os.getpid()
+        return _default_cache
@@ -0,0 +1,335 @@
+from __future__ import annotations
+import re
+import math
+import shlex
+import array
+import itertools
+import datetime
+from typing import Dict, Iterable, List, Mapping, Optional, Tuple
+
+from package.ImageMetadata import ImageMetadata
+
+
+# Filtering of the files of a folder by their metadata, free of Qt: the file list fills the index
+# in the background (see 'FileList.MetadataIndexer') and evaluates the query of its filter bar
+# against it, so typing a query never reads a file.
+#
+# Queries are words separated by spaces (quote words with spaces); all words must match:
+#   ILCE-7C                  camera maker, model or lens contains the text (case insensitive)
+#   maker:sony  model:7c  lens:"24-70mm"
+#   iso:400  iso:100..800  iso:..200
+#   f:2.8  f:1.4..4
+#   date:2023-04-22  date:2023-04-22T14:00..2023-04-22T16:00  date:2023-04..
+#   time:14:00..16:00        (time of day, on any date)
+# Ranges include both ends; dates and times without seconds (or without a day, ...) include the
+# whole minute (day, ...).
+
+TEXT_FIELDS: Tuple[str, ...] = ("maker", "model", "lens")
+NUMBER_FIELDS: Tuple[str, ...] = ("iso", "f", "date", "time")
+
+# f-stops are matched with this tolerance (e.g., 'f:2.8' matches 2.8 stored as 28/10 or 2.79...)
+_FSTOP_TOLERANCE: float = 0.05
+
+# the index is compacted when more than this many removed rows (and half its rows) are kept
+_MAX_REMOVED_ROWS: int = 1024
+
+_DATE_PATTERN: re.Pattern = re.compile(
+    r"(\d{4})(?:-(\d{1,2})(?:-(\d{1,2})(?:[T ](\d{1,2})(?::(\d{1,2})(?::(\d{1,2}))?)?)?)?)?"
+)
+_TIME_PATTERN: re.Pattern = re.compile(r"(\d{1,2})(?::(\d{1,2})(?::(\d{1,2}))?)?")
+
+
+def _date_seconds(dt: datetime.datetime) -> float:
+    # seconds since 0001-01-01 (naive dates, as in EXIF)
+    return float((dt.toordinal() - 1) * 86400 + dt.hour * 3600 + dt.minute * 60 + dt.second)
+
+
+def _parse_date(text: str) -> Tuple[float, float]:
+    # Returns the first and last second of a date (as far as it is given).
+
+    match: Optional[re.Match] = _DATE_PATTERN.fullmatch(text)
+    if match is None:
+        raise ValueError(f"invalid date '{text}' (expected YYYY[-MM[-DD[THH[:MM[:SS]]]]])")
+    year, month, day, hour, minute, second = (
+        int(group) if group is not None else None for group in match.groups()
+    )
+    try:
+        first: datetime.datetime = datetime.datetime(
+            year, month or 1, day or 1, hour or 0, minute or 0, second or 0
+        )
+    except ValueError as e:
+        raise ValueError(f"invalid date '{text}' ({e})")
+
+    # the first second after the given precision
+    after: datetime.datetime
+    if month is None:
+        after = first.replace(year=year + 1) if year < datetime.MAXYEAR else datetime.datetime.max
+    elif day is None:
+        after = (first + datetime.timedelta(days=31)).replace(day=1)
+    elif hour is None:
+        after = first + datetime.timedelta(days=1)
+    elif minute is None:
+        after = first + datetime.timedelta(hours=1)
+    elif second is None:
+        after = first + datetime.timedelta(minutes=1)
+    else:
+        after = first + datetime.timedelta(seconds=1)
+    return _date_seconds(first), _date_seconds(after) - 1
+
+
+def _parse_time(text: str) -> Tuple[float, float]:
+    # Returns the first and last second (of the day) of a time of day.
+
+    match: Optional[re.Match] = _TIME_PATTERN.fullmatch(text)
+    if match is None:
+        raise ValueError(f"invalid time '{text}' (expected HH[:MM[:SS]])")
+    hour, minute, second = (int(group) if group is not None else None for group in match.groups())
+    if hour > 23 or (minute or 0) > 59 or (second or 0) > 59:
+        raise ValueError(f"invalid time '{text}'")
+    first: int = hour * 3600 + (minute or 0) * 60 + (second or 0)
+    length: int = 3600 if minute is None else 60 if second is None else 1
+    return float(first), float(first + length - 1)
+
+
+def _parse_number(field: str, text: str) -> Tuple[float, float]:
+    try:
+        value: float = float(text)
+    except ValueError:
+        raise ValueError(f"invalid number '{text}' for '{field}'")
+    if field == "f":
+        return value - _FSTOP_TOLERANCE, value + _FSTOP_TOLERANCE
+    return value, value
+
+
+def _parse_range(field: str, text: str) -> Tuple[float, float]:
+    # Returns the (first, last) values of 'value' or 'first..last' (either end may be omitted).
+
+    parse = {"date": _parse_date, "time": _parse_time}.get(field)
+    if parse is None:
+        parse = lambda value: _parse_number(field, value)
+    if ".." not in text:
+        return parse(text)
+    first_text, _, last_text = text.partition("..")
+    if not first_text and not last_text:
+        raise ValueError(f"empty range for '{field}'")
+    first: float = parse(first_text)[0] if first_text else -math.inf
+    last: float = parse(last_text)[1] if last_text else math.inf
+    return first, last
+
+
+class MetadataQuery(object):
+    # A parsed query (see the top of this module): text conditions (field or None for any text
+    # field, lowercase text) and range conditions (field, first, last).
+
+    _text: str
+    _texts: List[Tuple[Optional[str], str]]
+    _ranges: List[Tuple[str, float, float]]
+
+    def __init__(
+        self,
+        text: str = "",
+        texts: Iterable[Tuple[Optional[str], str]] = (),
+        ranges: Iterable[Tuple[str, float, float]] = (),
+    ) -> None:
+        self._text = text
+        self._texts = list(texts)
+        self._ranges = list(ranges)
+
+    @classmethod
+    def parse(cls, text: str) -> MetadataQuery:
+        # Parses a query; raises 'ValueError' with a message for the user if it is invalid.
+
+        try:
+            words: List[str] = shlex.split(text)
+        except ValueError as e:
+            raise ValueError(f"invalid query ({e})")
+        texts: List[Tuple[Optional[str], str]] = []
+        ranges: List[Tuple[str, float, float]] = []
+        for word in words:
+            field, separator, value = word.partition(":")
+            if not separator or (field not in TEXT_FIELDS and field not in NUMBER_FIELDS):
+                if separator and field.isalpha():
+                    fields: str = ", ".join(TEXT_FIELDS + NUMBER_FIELDS)
+                    raise ValueError(f"unknown field '{field}' (expected {fields})")
+                # (e.g., a model name with a colon)
+                texts.append((None, word.lower()))
+            elif not value:
+                raise ValueError(f"no value for '{field}'")
+            elif field in TEXT_FIELDS:
+                texts.append((field, value.lower()))
+            else:
+                ranges.append((field, *_parse_range(field, value)))
+        return cls(text, texts, ranges)
+
+    def text(self) -> str:
+        return self._text
+
+    def is_empty(self) -> bool:
+        return not self._texts and not self._ranges
+
+    def texts(self) -> List[Tuple[Optional[str], str]]:
+        return self._texts
+
+    def ranges(self) -> List[Tuple[str, float, float]]:
+        return self._ranges
+
+
+class MetadataIndex(object):
+    # Column store of the metadata fields that can be queried, by file path. The fields are
+    # decoded once when a file is added; a query is then evaluated per column instead of per file:
+    # text columns hold ids of their distinct values (so text conditions are only matched against
+    # the distinct values), number columns hold floats (NaN if missing), and the comparisons are
+    # mapped over whole columns in C. Results are bitsets (one 0/1 byte per file, as in
+    # 'Selection'), combined by reading them as integers.
+    #
+    # Removed files leave unused rows behind, until there are many of them.
+
+    _rows: Dict[str, int]
+    _paths: List[Optional[str]]
+    _values: Dict[str, List[Optional[str]]]
+    _ids: Dict[str, Dict[Optional[str], int]]
+    _texts: Dict[str, array.array]
+    _numbers: Dict[str, array.array]
+
+    def __init__(self) -> None:
+        self.clear()
+
+    # protected
+    def _text_id(self, field: str, value: Optional[str]) -> int:
+        if value is not None:
+            value = value.strip().lower() or None
+        ids: Dict[Optional[str], int] = self._ids[field]
+        text_id: Optional[int] = ids.get(value)
+        if text_id is None:
+            text_id = ids[value] = len(self._values[field])
+            self._values[field].append(value)
+        return text_id
+
+    def _row_values(
+        self, metadata: ImageMetadata
+    ) -> Tuple[Tuple[int, ...], Tuple[float, ...]]:
+        # Returns the (text ids, numbers) of a file, in the order of the fields.
+
+        dt: Optional[datetime.datetime] = metadata.date_taken()
+        numbers: Tuple[Optional[float], ...] = (
+            metadata.iso(),
+            metadata.fstop(),
+            _date_seconds(dt) if dt is not None else None,
+            float(dt.hour * 3600 + dt.minute * 60 + dt.second) if dt is not None else None,
+        )
+        return (
+            (
+                self._text_id("maker", metadata.camera_maker()),
+                self._text_id("model", metadata.camera_model()),
+                self._text_id("lens", metadata.lens_model()),
+            ),
+            tuple(float(number) if number is not None else math.nan for number in numbers),
+        )
+
+    def _compact(self) -> None:
+        # Drops the rows of removed files.
+
+        kept: List[int] = sorted(self._rows.values())
+        self._paths = [self._paths[row] for row in kept]
+        self._rows = {path: row for row, path in enumerate(self._paths)}
+        for columns in (self._texts, self._numbers):
+            for field, column in columns.items():
+                columns[field] = array.array(column.typecode, (column[row] for row in kept))
+
+    def _text_bits(self, field: str, text: str) -> int:
+        values: List[Optional[str]] = self._values[field]
+        ids: frozenset = frozenset(
+            text_id for text_id, value in enumerate(values) if value is not None and text in value
+        )
+        if not ids:
+            return 0
+        return int.from_bytes(bytes(map(ids.__contains__, self._texts[field])), "little")
+
+    def _range_bits(self, field: str, first: float, last: float) -> int:
+        column: array.array = self._numbers[field]
+        bits: int = -1
+        # (NaN compares false, so files without the field never match)
+        if first > -math.inf:
+            bits &= int.from_bytes(bytes(map(first.__le__, column)), "little")
+        if last < math.inf:
+            bits &= int.from_bytes(bytes(map(last.__ge__, column)), "little")
+        return bits
+
+    # public
+    def clear(self) -> None:
+        self._rows = {}
+        self._paths = []
+        self._values = {field: [None] for field in TEXT_FIELDS}
+        self._ids = {field: {None: 0} for field in TEXT_FIELDS}
+        self._texts = {field: array.array("i") for field in TEXT_FIELDS}
+        self._numbers = {field: array.array("d") for field in NUMBER_FIELDS}
+
+    def num_files(self) -> int:
+        return len(self._rows)
+
+    def is_indexed(self, path: str) -> bool:
+        return path in self._rows
+
+    def add_many(self, metadatas: Iterable[ImageMetadata]) -> None:
+        # Adds files, or updates the fields of files that are already indexed.
+
+        for metadata in metadatas:
+            texts, numbers = self._row_values(metadata)
+            row: Optional[int] = self._rows.get(metadata.path())
+            if row is None:
+                self._rows[metadata.path()] = len(self._paths)
+                self._paths.append(metadata.path())
+                for field, value in zip(TEXT_FIELDS, texts):
+                    self._texts[field].append(value)
+                for field, value in zip(NUMBER_FIELDS, numbers):
+                    self._numbers[field].append(value)
+            else:
+                for field, value in zip(TEXT_FIELDS, texts):
+                    self._texts[field][row] = value
+                for field, value in zip(NUMBER_FIELDS, numbers):
+                    self._numbers[field][row] = value
+
+    def remove_many(self, paths: Iterable[str]) -> None:
+        for path in paths:
+            row: Optional[int] = self._rows.pop(path, None)
+            if row is not None:
+                self._paths[row] = None
+        num_removed: int = len(self._paths) - len(self._rows)
+        if num_removed > _MAX_REMOVED_ROWS and num_removed > len(self._rows):
+            self._compact()
+
+    def rename_paths(self, renamed: Mapping[str, str]) -> None:
+        # Moves the fields of renamed files (old path -> new path) to their new paths; files that
+        # are renamed onto an indexed file replace it.
+
+        rows: List[Tuple[str, int]] = [
+            (new_path, self._rows.pop(old_path))
+            for old_path, new_path in renamed.items()
+            if old_path in self._rows
+        ]
+        self.remove_many(new_path for new_path, row in rows)
+        for new_path, row in rows:
+            self._rows[new_path] = row
+            self._paths[row] = new_path
+
+    def match(self, query: MetadataQuery, paths: List[str]) -> bytearray:
+        # Returns the bitset of the given paths that match a query (files that are not indexed
+        # do not match, unless the query is empty).
+
+        if query.is_empty():
+            return bytearray(b"\x01") * len(paths)
+        num_rows: int = len(self._paths)
+        bits: int = int.from_bytes(b"\x01" * num_rows, "little")
+        for field, text in query.texts():
+            fields: Tuple[str, ...] = TEXT_FIELDS if field is None else (field,)
+            text_bits: int = 0
+            for text_field in fields:
+                text_bits |= self._text_bits(text_field, text)
+            bits &= text_bits
+        for field, first, last in query.ranges():
+            bits &= self._range_bits(field, first, last)
+
+        # (the byte after the rows is the result of files that are not indexed)
+        row_bits: bytes = bits.to_bytes(num_rows + 1, "little")
+        rows: Iterable[int] = map(self._rows.get, paths, itertools.repeat(num_rows))
+        return bytearray(map(row_bits.__getitem__, rows))
@@ -0,0 +1,115 @@
+from __future__ import annotations
+import os
+import re
+import sys
+from typing import Dict, Iterable, List, Set, Tuple
+
+
+class NameIndex(object):
+    # Index of the names taken in one or more directories, used to find free file names (adding
+    # a '-1', '-2', ... suffix as 'Image.add_suffix' does) without probing the file system for
+    # each candidate. Each directory is listed once (with 'os.scandir') when it is first used;
+    # afterwards, names are claimed and released as files are renamed. The next suffix to try is
+    # remembered per base name, so finding a free name takes amortized O(1).
+
+    _SUFFIX_PATTERN: re.Pattern = re.compile(r"^(.*)-(\d+)$")
+
+    # file names are case-insensitive on Windows and (by default) on macOS
+    _IS_CASE_INSENSITIVE: bool = sys.platform in ("win32", "darwin")
+
+    _names: Dict[str, Set[str]]
+    _next_suffix: Dict[Tuple[str, str, str], int]
+
+    def __init__(self) -> None:
+        self._names = {}
+        self._next_suffix = {}
+
+    # protected
+    @classmethod
+    def _key(cls, name: str) -> str:
+        return name.casefold() if cls._IS_CASE_INSENSITIVE else name
+
+    def _names_in(self, dirpath: str) -> Set[str]:
+        dirpath = os.path.normpath(dirpath)
+        names: Set[str] = self._names.get(dirpath)
+        if names is None:
+            names = set()
+            try:
+                with os.scandir(dirpath) as entries:
+                    for entry in entries:
+                        names.add(self._key(entry.name))
+            except OSError:
+                pass
+            self._names[dirpath] = names
+        return names
+
+    def _split(self, path: str) -> Tuple[str, str, str]:
+        dirpath: str = os.path.normpath(os.path.dirname(path))
+        basename, extension = os.path.splitext(os.path.basename(path))
+        return dirpath, basename, extension
+
+    # public
+    def key(self, path: str) -> Tuple[str, str]:
+        # Returns a key that is equal for paths that name the same file.
+
+        return os.path.normpath(os.path.dirname(path)), self._key(os.path.basename(path))
+
+    def is_taken(self, path: str) -> bool:
+        return self._key(os.path.basename(path)) in self._names_in(os.path.dirname(path))
+
+    def claim(self, path: str) -> None:
+        self._names_in(os.path.dirname(path)).add(self._key(os.path.basename(path)))
+
+    def release(self, path: str) -> None:
+        # Marks the name of a file that was removed or renamed as free.
+
+        dirpath, basename, extension = self._split(path)
+        self._names_in(dirpath).discard(self._key(os.path.basename(path)))
+
+        # let the suffix search start at the released suffix again
+        match = self._SUFFIX_PATTERN.match(basename)
+        if match is not None:
+            key: Tuple[str, str, str] = (
+                dirpath, self._key(match.group(1)), self._key(extension)
+            )
+            suffix: int = int(match.group(2))
+            if suffix >= 1 and self._next_suffix.get(key, 1) > suffix:
+                self._next_suffix[key] = suffix
+
+    def reserve(self, path: str) -> str:
+        # Returns the given path if it is free, or otherwise the path with the first free suffix,
+        # and claims it.
+
+        if not self.is_taken(path):
+            self.claim(path)
+            return path
+
+        dirpath, basename, extension = self._split(path)
+        key: Tuple[str, str, str] = (dirpath, self._key(basename), self._key(extension))
+        i: int = self._next_suffix.get(key, 1)
+        new_path: str = os.path.join(dirpath, f"{basename}-{i}{extension}")
+        while self.is_taken(new_path):
+            i += 1
+            new_path = os.path.join(dirpath, f"{basename}-{i}{extension}")
+        self._next_suffix[key] = i + 1
+        self.claim(new_path)
+        return new_path
+
+    def collisions(self, moves: Iterable[Tuple[str, str]]) -> Dict[str, List[str]]:
+        # Returns, for a batch of (source, target) paths, the targets that will need a suffix:
+        # targets requested by more than one source, or taken by a file that is not itself moved
+        # away in the batch. Maps each such target to its sources.
+
+        moves = list(moves)
+        sources: Set[Tuple[str, str]] = set(self.key(source) for source, _ in moves)
+        requests: Dict[str, List[str]] = {}
+        for source, target in moves:
+            if os.path.normpath(source) != os.path.normpath(target):
+                requests.setdefault(target, []).append(source)
+
+        collisions: Dict[str, List[str]] = {}
+        for target, target_sources in requests.items():
+            is_vacated: bool = self.key(target) in sources
+            if len(target_sources) > 1 or (self.is_taken(target) and not is_vacated):
+                collisions[target] = target_sources
+        return collisions
@@ -0,0 +1,475 @@
+from __future__ import annotations
+import os
+import datetime
+import collections
+import send2trash
+import concurrent.futures
+from typing import Callable, Deque, Dict, List, Optional, Set, Tuple, Union
+
+from package.Image import Image
+from package.ImageBackend import default_backend_name
+from package.FileOperation import EXECUTOR_PROCESS, create_executor, write_image
+from package.FilePlan import ACTION_RENAME, ACTION_REWRITE, ACTION_SIDECAR, FilePlan, PlannedFile
+from package.MetadataCache import MetadataCache, default_cache
+from package.Trash import TrashBin
+from package.ImageMetadata import ImageMetadata
+from package.Sidecar import move_sidecar, write_sidecar
+from package.Journal import (
+    Journal,
+    KIND_PATCH,
+    KIND_RENAME,
+    KIND_REWRITE,
+    KIND_SIDECAR,
+    KIND_SWAP,
+)
+
+
+class PlanExecutor(object):
+    # Executes a 'FilePlan' on the calling thread. The steps of the plan are carried out in
+    # order; rewriting files (parsing and serializing) is fanned out to a pool of worker processes
+    # ahead of their steps, while this thread moves the results into place. Names were assigned
+    # by the plan, so workers never race on a target name. The originals of rewritten files are
+    # trashed from their own paths in batches (see 'TrashBin'), each batch just before their
+    # rewritten files are moved into place. All operations are recorded in a write-ahead journal,
+    # so that an interrupted run can be recovered.
+
+    _plan: FilePlan
+    _is_send2trash: bool
+    _executor: Union[str, concurrent.futures.Executor]
+    _max_workers: Optional[int]
+
+    _new_filepaths: List[str]
+    _num_done: int
+    _num_temp: int
+    _cache: MetadataCache
+    _trash: TrashBin
+    _journal: Optional[Journal]
+    _swap_ids: Dict[str, int]
+    _tmp_paths: Dict[int, Optional[str]]
+    _trash_ids: Dict[str, int]
+    _placements: List[Tuple[PlannedFile, str, str, int]]
+    _removed: Dict[int, int]
+    _num_failed: int
+    _is_running: bool
+
+    def __init__(
+        self,
+        plan: FilePlan,
+        is_send2trash: bool = True,
+        executor: Union[str, concurrent.futures.Executor] = EXECUTOR_PROCESS,
+        max_workers: Optional[int] = None,
+    ) -> None:
+        self._plan = plan
+        self._is_send2trash = is_send2trash
+        self._executor = executor
+        self._max_workers = max_workers
+        self._cache = default_cache()
+        self._trash = TrashBin()
+        self._journal = None
+        self._swap_ids = {}
+        # the results of the write jobs of rewritten files (see 'write_image'), by file
+        self._tmp_paths = {}
+        # the journal entries of the originals in the trash bin
+        self._trash_ids = {}
+        # rewritten files that wait for the trash bin to be flushed before they are moved into
+        # place: (file, path of its sidecar, temporary path, journal entry)
+        self._placements = []
+        # the journal entries of files (of a rename cycle) whose original was removed at their
+        # first step, by file
+        self._removed = {}
+
+        self._new_filepaths = [file.source() for file in plan.files()]
+        self._num_done = 0
+        self._num_temp = 0
+        self._num_failed = 0
+        self._is_running = False
+
+    def stop(self) -> None:
+        # Stops the run after the work that has started (and any open rename cycle) is done.
+        self._is_running = False
+
+    def is_running(self) -> bool:
+        return self._is_running
+
+    def plan(self) -> FilePlan:
+        return self._plan
+
+    def new_filepaths(self) -> List[str]:
+        # the paths of all files of the plan after the run, in input order
+        return self._new_filepaths
+
+    def renamed(self) -> Dict[str, str]:
+        # the files of the plan that have a new path after the run (old path -> new path)
+        return {
+            file.source(): new_filepath
+            for file, new_filepath in zip(self._plan.files(), self._new_filepaths)
+            if new_filepath != file.source()
+        }
+
+    def num_skipped(self) -> int:
+        return self._plan.num_skipped()
+
+    def num_failed(self) -> int:
+        return self._num_failed
+
+    def _move(
+        self,
+        from_path: str,
+        to_path: str,
+        kind: str = KIND_RENAME,
+        old_date: Optional[datetime.datetime] = None,
+        new_date: Optional[datetime.datetime] = None,
+    ) -> str:
+        # Renames a file (and its sidecar) without reading or writing it; a suffix is added if the
+        # new path has been taken in the meantime. Returns the new path. A move to a temporary
+        # name (of a rename cycle) stays open in the journal until the last step of the file. The
+        # dates of a file that was patched in place (before it is moved) are journaled with it.
+
+        if os.path.exists(to_path) and not os.path.samefile(from_path, to_path):
+            to_path = Image.add_suffix(to_path)
+        if to_path != from_path:
+            entry_id: int = self._journal.begin(
+                kind, from_path, to_path, old_date=old_date, new_date=new_date
+            )
+            print(f"Renaming '{from_path}' -> '{to_path}'")
+            os.rename(from_path, to_path)
+            move_sidecar(from_path, to_path)
+            if kind == KIND_SWAP:
+                self._swap_ids[to_path] = entry_id
+            else:
+                self._journal.done(entry_id, to_path)
+        return to_path
+
+    def _replace(self, file: PlannedFile, from_path: str) -> str:
+        # Renames a file that was patched in place (see 'write_image') to its target. Returns the
+        # new path.
+
+        metadata: ImageMetadata = file.metadata()
+        entry_id: int = self._journal.begin(
+            KIND_PATCH,
+            from_path,
+            file.target(),
+            old_date=file.date_taken(),
+            new_date=file.new_date_taken(),
+        )
+        new_filepath: str = Image.replace_original(from_path, None, file.target())
+        move_sidecar(from_path, new_filepath)
+
+        # keep the date of a sidecar (which overrides the EXIF date) in sync
+        if metadata.sidecar_mtime_ns() is not None:
+            write_sidecar(new_filepath, date_taken=file.new_date_taken())
+        self._journal.done(entry_id, new_filepath)
+        return new_filepath
+
+    def _write(self, file: PlannedFile, from_path: str, backend: str) -> Optional[str]:
+        # Returns the result of the write job of a rewritten file; the file is written on this
+        # thread if it was not written by the pool.
+
+        if file.index() not in self._tmp_paths:
+            tmp_path: str = Image.temp_path(from_path)
+            self._journal.write(from_path, file.date_taken(), file.new_date_taken(), tmp=tmp_path)
+            self._tmp_paths[file.index()] = write_image(
+                backend, from_path, file.new_date_taken(), tmp_path
+            )
+        return self._tmp_paths[file.index()]
+
+    def _remove_original(self, file: PlannedFile, tmp_path: str, is_batched: bool) -> int:
+        # Trashes (or removes) the original of a rewritten file at its own path, so that the
+        # trash records its original location; if batched, it is only put in the trash bin (see
+        # '_flush'). Returns the journal entry of the rewrite, which is done once the rewritten
+        # file has been moved into place.
+
+        path: str = file.source()
+        entry_id: int = self._journal.begin(
+            KIND_REWRITE,
+            path,
+            file.target(),
+            tmp=tmp_path,
+            is_trash=self._is_send2trash,
+            old_date=file.date_taken(),
+            new_date=file.new_date_taken(),
+        )
+        if self._is_send2trash and is_batched:
+            self._trash.add(path)
+            self._trash_ids[path] = entry_id
+            return entry_id
+
+        if self._is_send2trash:
+            print(f"Moving '{path}' to trash")
+            send2trash.send2trash(path)
+        else:
+            os.remove(path)
+        self._journal.removed([entry_id])
+        return entry_id
+
+    def _place(self, file: PlannedFile, sidecar_path: str, tmp_path: str, entry_id: int) -> None:
+        # Moves a rewritten file (whose original has been removed) into place under its target.
+
+        metadata: ImageMetadata = file.metadata()
+        new_filepath: str = Image.move_into_place(file.source(), tmp_path, file.target())
+        move_sidecar(sidecar_path, new_filepath)
+
+        # keep the date of a sidecar (which overrides the EXIF date) in sync
+        if metadata.sidecar_mtime_ns() is not None:
+            write_sidecar(new_filepath, date_taken=file.new_date_taken())
+        self._journal.done(entry_id, new_filepath)
+        self._cache.update(file.source(), new_filepath)
+        self._new_filepaths[file.index()] = new_filepath
+
+    def _flush(self) -> None:
+        # Trashes the originals in the trash bin (in batches) and then moves their rewritten
+        # files into place. Called before any step that needs the names to be up to date.
+
+        if not self._placements:
+            return
+
+        failed: Set[str] = set(self._trash.flush())
+        removed_ids: List[int] = [
+            entry_id for path, entry_id in self._trash_ids.items() if path not in failed
+        ]
+        self._trash_ids = {}
+        if removed_ids:
+            self._journal.removed(removed_ids)
+
+        placements: List[Tuple[PlannedFile, str, str, int]] = self._placements
+        self._placements = []
+        for file, sidecar_path, tmp_path, entry_id in placements:
+            try:
+                if file.source() in failed:
+                    os.remove(tmp_path)
+                    raise OSError("the original was not moved to trash")
+                self._place(file, sidecar_path, tmp_path, entry_id)
+            except Exception as e:
+                print(f"Cannot modify '{file.source()}': {e!r}")
+                self._num_failed += 1
+
+    def _write_sidecar(self, file: PlannedFile, from_path: str) -> str:
+        # Writes the changes to the XMP sidecar of the file, leaving the file itself untouched
+        # (apart from renaming it, if planned). Returns the new path.
+
+        new_filepath: str = self._move(from_path, file.target())
+        recorded_filename: Optional[str] = (
+            None if self._plan.is_sidecar_rename() else file.new_filename()
+        )
+        if file.new_date_taken() is not None or recorded_filename is not None:
+            entry_id: int = self._journal.begin(
+                KIND_SIDECAR,
+                new_filepath,
+                new_filepath,
+                old_date=file.date_taken(),
+                new_date=file.new_date_taken(),
+            )
+            print(f"Writing sidecar of '{new_filepath}'")
+            write_sidecar(
+                new_filepath, date_taken=file.new_date_taken(), filename=recorded_filename
+            )
+            self._journal.done(entry_id, new_filepath)
+        return new_filepath
+
+    def _execute(
+        self,
+        file: PlannedFile,
+        from_path: str,
+        to_path: str,
+        is_last: bool,
+        backend: str,
+    ) -> None:
+        # Executes a step of the plan. A rewritten file is moved into place once the trash bin is
+        # flushed (see '_flush'); all other steps flush it first, so that they see the names of
+        # the previous steps.
+
+        i: int = file.index()
+        tmp_path: Optional[str] = None
+        if file.action() == ACTION_REWRITE:
+            tmp_path = self._write(file, from_path, backend)
+
+        if not is_last:
+            if tmp_path is not None:
+                # a rewritten file of a rename cycle waits at its temporary file, and its original
+                # is trashed right away to free its name
+                self._removed[i] = self._remove_original(file, tmp_path, is_batched=False)
+                move_sidecar(from_path, tmp_path)
+                self._num_temp += 1
+                return
+
+            # move out of the way (to a temporary name) to resolve a rename cycle
+            self._flush()
+            new_path: str
+            if file.action() == ACTION_REWRITE:
+                new_path = self._move(
+                    from_path,
+                    to_path,
+                    kind=KIND_SWAP,
+                    old_date=file.date_taken(),
+                    new_date=file.new_date_taken(),
+                )
+            else:
+                new_path = self._move(from_path, to_path, kind=KIND_SWAP)
+            self._cache.rename(from_path, new_path)
+            self._new_filepaths[i] = new_path
+            self._num_temp += 1
+            return
+
+        if tmp_path is not None:
+            entry_id: int
+            sidecar_path: str
+            if i in self._removed:
+                entry_id = self._removed.pop(i)
+                sidecar_path = tmp_path
+            else:
+                entry_id = self._remove_original(file, tmp_path, is_batched=True)
+                sidecar_path = from_path
+            del self._tmp_paths[i]
+            self._placements.append((file, sidecar_path, tmp_path, entry_id))
+            if self._trash.is_full():
+                self._flush()
+            return
+
+        self._flush()
+        new_filepath: str
+        if file.action() == ACTION_SIDECAR:
+            new_filepath = self._write_sidecar(file, from_path)
+            self._cache.update(from_path, new_filepath)
+        elif file.action() == ACTION_RENAME:
+            new_filepath = self._move(from_path, to_path)
+            self._cache.rename(from_path, new_filepath)
+        else:
+            self._tmp_paths.pop(i, None)
+            new_filepath = self._replace(file, from_path)
+            self._cache.update(from_path, new_filepath)
+        self._new_filepaths[i] = new_filepath
+
+        # the rename cycle of the file (if any) is complete
+        swap_id: Optional[int] = self._swap_ids.pop(from_path, None)
+        if swap_id is not None:
+            self._journal.done(swap_id, new_filepath)
+
+    def run(self, on_progress: Optional[Callable[[int], None]] = None) -> None:
+        # Executes the plan; 'on_progress' is called with the number of files done after each
+        # file.
+
+        assert self._is_running == False
+
+        self._is_running = True
+
+        self._journal = Journal()
+        backend: str = default_backend_name()
+        pool: Optional[concurrent.futures.Executor]
+        is_own_pool: bool
+        pool, is_own_pool = create_executor(self._executor, self._max_workers)
+        max_in_flight: int = 2 * (self._max_workers or os.cpu_count() or 1)
+
+        files: List[PlannedFile] = self._plan.files()
+        steps: List[Tuple[int, str, str]] = self._plan.steps()
+        first_steps: Dict[int, int] = {}
+        last_steps: Dict[int, int] = {}
+        for k, (i, _, _) in enumerate(steps):
+            first_steps.setdefault(i, k)
+            last_steps[i] = k
+
+        # files that are not changed count as done
+        self._num_done = self._plan.num_files() - self._plan.num_changes()
+
+        # steps (in order) with the write job that has to finish first, if any
+        pending: Deque[Tuple[int, Optional[concurrent.futures.Future]]] = collections.deque()
+        num_in_flight: int = 0
+        is_pool_broken: bool = False
+        # files with a failed step (their remaining step is not executed)
+        failed: Set[int] = set()
+
+        def commit() -> None:
+            nonlocal num_in_flight
+            k, job = pending.popleft()
+            i, from_path, to_path = steps[k]
+            file: PlannedFile = files[i]
+            if job is not None:
+                num_in_flight -= 1
+
+            # once stopped, only started work (and open rename cycles) is completed
+            if not self._is_running and self._num_temp == 0:
+                if job is None or job.cancel():
+                    if job is not None:
+                        self._journal.cancel(file.source())
+                    return
+
+            # a file at its temporary name leaves it in its last step (or stays there if the step
+            # fails); the remaining step of a failed file is not executed (i.e., a file whose
+            # temporary step failed was never moved)
+            is_last: bool = k == last_steps[i]
+            is_failed: bool = i in failed
+            is_temp: bool = is_last and from_path != file.source() and not is_failed
+
+            if not is_failed:
+                try:
+                    if job is not None:
+                        try:
+                            self._tmp_paths[i] = job.result()
+                        except concurrent.futures.BrokenExecutor as e:
+                            # the pool broke (e.g., a worker was killed): the file is written on
+                            # this thread instead (see '_execute')
+                            print(f"Cannot write '{file.source()}' in the pool: {e!r}")
+                    self._execute(file, from_path, to_path, is_last, backend)
+                except Exception as e:
+                    print(f"Cannot modify '{file.source()}': {e!r}")
+                    self._num_failed += 1
+                    failed.add(i)
+
+                    # the result of a write job that was not moved into place (unless its
+                    # original was removed: then it is left for recovery)
+                    tmp_path: Optional[str] = self._tmp_paths.pop(i, None)
+                    if (
+                        tmp_path is not None
+                        and i not in self._removed
+                        and os.path.isfile(tmp_path)
+                    ):
+                        os.remove(tmp_path)
+            if is_temp:
+                self._num_temp -= 1
+            if is_last:
+                self._num_done += 1
+                if on_progress is not None:
+                    on_progress(self._num_done)
+
+        try:
+            for k, (i, _, _) in enumerate(steps):
+                file: PlannedFile = files[i]
+                job: Optional[concurrent.futures.Future] = None
+                if (
+                    self._is_running
+                    and pool is not None
+                    and not is_pool_broken
+                    and k == first_steps[i]
+                    and file.action() == ACTION_REWRITE
+                ):
+                    try:
+                        tmp_path: str = Image.temp_path(file.source())
+                        self._journal.write(
+                            file.source(), file.date_taken(), file.new_date_taken(), tmp=tmp_path
+                        )
+                        job = pool.submit(
+                            write_image, backend, file.source(), file.new_date_taken(), tmp_path
+                        )
+                        num_in_flight += 1
+                    except Exception as e:
+                        # the remaining files are written on this thread (see '_execute'), where
+                        # a failure (e.g., of the journal) only fails the file
+                        print(f"Cannot submit '{file.source()}' to the pool: {e!r}")
+                        is_pool_broken = True
+                pending.append((k, job))
+
+                # execute finished steps, in order
+                while pending and (
+                    pending[0][1] is None
+                    or pending[0][1].done()
+                    or num_in_flight >= max_in_flight
+                ):
+                    commit()
+
+            while pending:
+                commit()
+            self._flush()
+        finally:
+            if is_own_pool:
+                pool.shutdown(wait=True, cancel_futures=True)
+            self._is_running = False
+        self._journal.close()
@@ -0,0 +1,108 @@
+from __future__ import annotations
+import os
+from typing import Dict, List, Optional
+
+from PySide6 import QtCore, QtWidgets
+
+from package.FilePlan import FilePlan
+
+
+class PlanModel(QtCore.QAbstractTableModel):
+    # Table model over the rows of a 'FilePlan' (one row per file, in input order).
+
+    _HEADERS: List[str] = ["Action", "File", "New file", "Date taken", "New date taken", "Notes"]
+    _KEYS: List[str] = ["action", "source", "target", "date_taken", "new_date_taken", "notes"]
+
+    _rows: List[Dict[str, object]]
+
+    def __init__(self, plan: FilePlan, parent: Optional[QtCore.QObject] = None) -> None:
+        super().__init__(parent)
+        self._rows = plan.rows()
+
+    def rowCount(self, parent: QtCore.QModelIndex = QtCore.QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self._rows)
+
+    def columnCount(self, parent: QtCore.QModelIndex = QtCore.QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self._KEYS)
+
+    def data(self, index: QtCore.QModelIndex, role: int = QtCore.Qt.DisplayRole) -> object:
+        if not index.isValid() or role not in (QtCore.Qt.DisplayRole, QtCore.Qt.ToolTipRole):
+            return None
+        key: str = self._KEYS[index.column()]
+        value: object = self._rows[index.row()][key]
+        if value is None:
+            return ""
+        if key in ("source", "target") and role == QtCore.Qt.DisplayRole:
+            return os.path.basename(value)
+        return str(value)
+
+    def headerData(
+        self, section: int, orientation: QtCore.Qt.Orientation, role: int = QtCore.Qt.DisplayRole
+    ) -> object:
+        if orientation == QtCore.Qt.Horizontal and role == QtCore.Qt.DisplayRole:
+            return self._HEADERS[section]
+        return None
+
+
+class PlanDialog(QtWidgets.QDialog):
+    # Shows a 'FilePlan' before it is executed: what happens to each file, with a summary of the
+    # changes. The plan can be exported (CSV or JSON); 'Modify files' accepts the dialog, after
+    # which the caller executes the same plan.
+
+    _plan: FilePlan
+    _model: PlanModel
+    _table: QtWidgets.QTableView
+
+    def __init__(self, plan: FilePlan, parent: Optional[QtWidgets.QWidget] = None) -> None:
+        super().__init__(parent)
+        self._plan = plan
+        self.setWindowTitle("Modification plan")
+        self.resize(900, 500)
+
+        layout: QtWidgets.QLayout = QtWidgets.QVBoxLayout()
+        self.setLayout(layout)
+
+        summary: QtWidgets.QLabel = QtWidgets.QLabel(
+            f"{plan.num_changes()}/{plan.num_files()} files change "
+            f"({plan.num_skipped()} skipped, {plan.num_collisions()} name collisions, "
+            f"{plan.num_cycles()} files in rename cycles)"
+        )
+        layout.addWidget(summary)
+
+        self._model = PlanModel(plan, self)
+        self._table = QtWidgets.QTableView()
+        self._table.setModel(self._model)
+        self._table.setSelectionMode(QtWidgets.QAbstractItemView.NoSelection)
+        self._table.verticalHeader().setVisible(False)
+        self._table.horizontalHeader().setStretchLastSection(True)
+        layout.addWidget(self._table)
+
+        buttons: QtWidgets.QDialogButtonBox = QtWidgets.QDialogButtonBox()
+        button_export: QtWidgets.QPushButton = buttons.addButton(
+            "Export...", QtWidgets.QDialogButtonBox.ActionRole
+        )
+        button_export.clicked.connect(self.on_export)
+        button_execute: QtWidgets.QPushButton = buttons.addButton(
+            "Modify files", QtWidgets.QDialogButtonBox.AcceptRole
+        )
+        button_execute.setEnabled(plan.num_changes() > 0)
+        buttons.addButton(QtWidgets.QDialogButtonBox.Cancel)
+        buttons.accepted.connect(self.accept)
+        buttons.rejected.connect(self.reject)
+        layout.addWidget(buttons)
+
+    def plan(self) -> FilePlan:
+        return self._plan
+
+    # handlers
+    @QtCore.Slot()
+    def on_export(self) -> None:
+        path, _ = QtWidgets.QFileDialog.getSaveFileName(
+            self, "Export plan", "plan.csv", "CSV (*.csv);;JSON (*.json)"
+        )
+        if not path:
+            return
+        try:
+            self._plan.export(path)
+        except OSError as e:
+            print(f"Cannot export plan to '{path}': {e}")
@@ -0,0 +1,256 @@
+from __future__ import annotations
+import re
+import datetime
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from package.ImageMetadata import ImageMetadata
+from package.ExifMap import ExifMap
+from package.FilePlan import OUTPUT_REWRITE, FilePlan
+
+
+# Rules of a batch modification, free of Qt (and picklable): the widgets configure them, and they
+# can also be used without a GUI (see 'package.cli').
+
+# tags of file name templates, as '[TAG]' (tags ending with ':' take an argument: '[TAG:text]')
+TAGS: Dict[str, str] = {
+    "ORG": "Original file name",
+    "YYYY": "Year",
+    "MM": "Month",
+    "DD": "Day",
+    "hh": "Hour",
+    "mm": "Minute",
+    "ss": "Second",
+    "MAK": "Camera maker",
+    "MOD": "Camera model",
+    "UPT:": "Up to",
+    "UPTI:": "Up to and including",
+    "FRM:": "From",
+    "FRMI:": "From and including",
+}
+
+
+class DateRule(object):
+    # Changes the date taken: relative to the date taken of each image, or to a specific date.
+
+    _delta: Optional[datetime.timedelta]
+    _date_time: Optional[datetime.datetime]
+
+    def __init__(
+        self,
+        delta: Optional[datetime.timedelta] = None,
+        date_time: Optional[datetime.datetime] = None,
+    ) -> None:
+        assert (delta is None) != (date_time is None), "Either a delta or a date is required"
+        self._delta = delta
+        self._date_time = date_time
+
+    def is_relative(self) -> bool:
+        return self._delta is not None
+
+    def delta(self) -> Optional[datetime.timedelta]:
+        return self._delta
+
+    def date_time(self) -> Optional[datetime.datetime]:
+        return self._date_time
+
+    def convert_date_taken(
+        self, dt: Optional[datetime.datetime]
+    ) -> Optional[datetime.datetime]:
+        if not self.is_relative():
+            return self._date_time
+        if dt is not None:
+            return dt + self._delta
+        return None
+
+    def convert_many(
+        self, dts: Sequence[Optional[datetime.datetime]]
+    ) -> List[Optional[datetime.datetime]]:
+        # Converts the dates of a batch of images in one pass (None stays None for relative
+        # changes).
+
+        if not self.is_relative():
+            return [self._date_time] * len(dts)
+        delta: datetime.timedelta = self._delta
+        return [dt + delta if dt is not None else None for dt in dts]
+
+
+class FileNameRule(object):
+    # Composes a new file name from a template of tags (see 'TAGS') and literal text. Date/time
+    # tags use the date taken after the date rule (if any) is applied. The template is parsed
+    # once into segments: literal text, or a getter of the EXIF map bound to its arguments.
+
+    _TAG_PATTERN: re.Pattern = re.compile(r"\[([^\[\]]*)\]")
+
+    # tag -> (method of 'ExifMap', extra arguments after the tag argument (if any))
+    _GETTERS: Dict[str, Tuple[str, Tuple]] = {
+        "ORG": ("basename", ()),
+        "YYYY": ("year", ()),
+        "MM": ("month", ()),
+        "DD": ("day", ()),
+        "hh": ("hour", ()),
+        "mm": ("minute", ()),
+        "ss": ("second", ()),
+        "MAK": ("camera_maker", ()),
+        "MOD": ("camera_model", ()),
+        "UPT:": ("text_upto", (False,)),
+        "UPTI:": ("text_upto", (True,)),
+        "FRM:": ("text_from", (False,)),
+        "FRMI:": ("text_from", (True,)),
+    }
+
+    _template: str
+    _date_rule: Optional[DateRule]
+    _map: ExifMap
+    _segments: List[Tuple[Optional[Callable], Tuple]]
+    _num_tags: int
+    _is_valid: bool
+    _is_alnum_literal: bool
+
+    def __init__(self, template: str, date_rule: Optional[DateRule] = None) -> None:
+        self._template = template
+        self._date_rule = date_rule
+        self._map = ExifMap(date_rule)
+        self._segments = []
+        self._num_tags = 0
+        self._is_valid = True
+        self._is_alnum_literal = False
+        self._compile()
+
+    def __reduce__(self) -> Tuple[type, Tuple[str, Optional[DateRule]]]:
+        # pickled by its configuration (the getters are bound to this instance)
+        return (FileNameRule, (self._template, self._date_rule))
+
+    # protected
+    def _compile(self) -> None:
+        # Splits the template into (literal text or getter, arguments) segments; the parts at odd
+        # positions are the tags.
+
+        parts: List[str] = self._TAG_PATTERN.split(self._template)
+        for i, part in enumerate(parts):
+            if i % 2 == 0:
+                if part:
+                    self._segments.append((None, (part,)))
+                    self._is_alnum_literal |= any(char.isalnum() for char in part)
+                continue
+
+            split: List[str] = part.rsplit(":", 1)
+            key: str = f"{split[0]}:" if len(split) > 1 else part
+            if key not in self._GETTERS:
+                self._is_valid = False
+                continue
+            name, args = self._GETTERS[key]
+            if len(split) > 1:
+                # tags with arguments
+                args = (split[1],) + args
+            self._segments.append((getattr(self._map, name), args))
+            self._num_tags += 1
+
+    # public
+    def template(self) -> str:
+        return self._template
+
+    def date_rule(self) -> Optional[DateRule]:
+        return self._date_rule
+
+    def is_valid(self) -> bool:
+        # Returns whether all tags of the template are known.
+        return self._is_valid
+
+    def compile_filename(self, img: ImageMetadata) -> Optional[str]:
+        # Returns the new file name of an image, or None if no tag applies (or the name would
+        # contain no letters or digits).
+
+        assert self._is_valid, f"Unknown tag in template '{self._template}'"
+        if self._num_tags == 0:
+            return None
+
+        parts: List[str] = []
+        is_applied: bool = False
+        for getter, args in self._segments:
+            if getter is None:
+                parts.append(args[0])
+                continue
+            element: Optional[str] = getter(img, *args)
+            if element is not None:
+                parts.append(element)
+                is_applied = True
+
+        if is_applied:
+            new_filename: str = "".join(parts)
+            # (a letter or digit in the literal text already makes the name valid)
+            if self._is_alnum_literal or any(char.isalnum() for char in new_filename):
+                return f"{new_filename}{img.extension()}"
+        return None
+
+
+class Rules(object):
+    # The file name and date rules of a batch modification (None if not changed). The widgets
+    # configure the rules; a snapshot is then evaluated for all files, on any thread or process.
+
+    _filename_rule: Optional[FileNameRule]
+    _date_rule: Optional[DateRule]
+
+    def __init__(
+        self,
+        filename_rule: Optional[FileNameRule] = None,
+        date_rule: Optional[DateRule] = None,
+    ) -> None:
+        self._filename_rule = filename_rule
+        self._date_rule = date_rule
+
+    def filename_rule(self) -> Optional[FileNameRule]:
+        return self._filename_rule
+
+    def date_rule(self) -> Optional[DateRule]:
+        return self._date_rule
+
+    def convert(
+        self, metadata: ImageMetadata
+    ) -> Tuple[Optional[str], Optional[datetime.datetime]]:
+        # Returns the new file name and the new date taken of a file (None if unchanged).
+
+        new_filename: Optional[str] = None
+        if self._filename_rule is not None:
+            new_filename = self._filename_rule.compile_filename(metadata)
+
+        new_dt: Optional[datetime.datetime] = None
+        if self._date_rule is not None:
+            new_dt = self._date_rule.convert_date_taken(metadata.date_taken())
+
+        return new_filename, new_dt
+
+    def convert_many(
+        self, metadatas: Sequence[ImageMetadata]
+    ) -> List[Tuple[Optional[str], Optional[datetime.datetime]]]:
+        # Returns the new file names and dates taken of a batch of files: the template is
+        # evaluated per file, and the dates are changed in one batch.
+
+        new_filenames: List[Optional[str]] = [None] * len(metadatas)
+        if self._filename_rule is not None:
+            rule: FileNameRule = self._filename_rule
+            new_filenames = [rule.compile_filename(metadata) for metadata in metadatas]
+
+        new_dts: List[Optional[datetime.datetime]] = [None] * len(metadatas)
+        if self._date_rule is not None:
+            new_dts = self._date_rule.convert_many(
+                [metadata.date_taken() for metadata in metadatas]
+            )
+
+        return list(zip(new_filenames, new_dts))
+
+    def plan(
+        self,
+        filepaths: Iterable[str],
+        output: str = OUTPUT_REWRITE,
+        is_sidecar_rename: bool = True,
+        on_progress: Optional[Callable[[int], None]] = None,
+    ) -> FilePlan:
+        # Evaluates the rules for all files (see 'FilePlan.build').
+
+        return FilePlan.build(
+            filepaths,
+            self.convert_many,
+            output=output,
+            is_sidecar_rename=is_sidecar_rename,
+            on_progress=on_progress,
+        )
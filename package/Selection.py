@@ -0,0 +1,284 @@
+from __future__ import annotations
+import itertools
+from typing import AbstractSet, Dict, FrozenSet, Iterable, List, Mapping, Optional, Tuple
+
+
+# operations to combine named selection sets
+SET_UNION: str = "union"
+SET_INTERSECT: str = "intersect"
+SET_DIFFERENCE: str = "difference"
+
+
+class Selection(object):
+    # Selected (checked) and highlighted state of the files of a list. The paths are indexed
+    # (path -> row) and the state is held in bitsets: byte arrays with one 0/1 byte per row, so
+    # counting, bulk changes and listing paths run in C. Bitsets are combined by reading them as
+    # integers (each byte is 0 or 1, so bitwise operations keep them 0 or 1).
+    #
+    # Named selection sets hold paths (not rows), so they stay valid when the list is reloaded;
+    # restoring one maps its paths back to rows in linear time.
+    #
+    # Files can be inserted and removed at any row (e.g., when the directory changes); the
+    # path -> row index is then rebuilt on the next lookup.
+
+    _filepaths: List[str]
+    _rows: Optional[Dict[str, int]]
+    _selected: bytearray
+    _highlighted: bytearray
+    _selected_paths: Optional[List[str]]
+    _sets: Dict[str, FrozenSet[str]]
+
+    def __init__(self) -> None:
+        self._filepaths = []
+        self._rows = {}
+        self._selected = bytearray()
+        self._highlighted = bytearray()
+        self._selected_paths = None
+        self._sets = {}
+
+    # protected
+    def _index(self) -> Dict[str, int]:
+        if self._rows is None:
+            self._rows = {filepath: row for row, filepath in enumerate(self._filepaths)}
+        return self._rows
+
+    def _bits(self, paths: Optional[Iterable[str]]) -> bytearray:
+        # Returns the bitset of the given paths (paths that are not listed are ignored).
+
+        bits: bytearray = bytearray(len(self._filepaths))
+        if paths:
+            rows: Dict[str, int] = self._index()
+            for path in paths:
+                row: Optional[int] = rows.get(path)
+                if row is not None:
+                    bits[row] = 1
+        return bits
+
+    @staticmethod
+    def _set_ranges(bits: bytearray, ranges: Iterable[Tuple[int, int]], value: bool) -> None:
+        byte: bytes = b"\x01" if value else b"\x00"
+        for first, last in ranges:
+            if last >= first:
+                bits[first : last + 1] = byte * (last - first + 1)
+
+    @staticmethod
+    def _ranges(bits: bytearray) -> List[Tuple[int, int]]:
+        # Returns the (first, last) rows of the contiguous runs of set bits.
+
+        ranges: List[Tuple[int, int]] = []
+        first: int = bits.find(1)
+        while first >= 0:
+            last: int = bits.find(0, first)
+            if last < 0:
+                last = len(bits)
+            ranges.append((first, last - 1))
+            first = bits.find(1, last)
+        return ranges
+
+    # public
+    def set_files(
+        self,
+        filepaths: List[str],
+        selected: Optional[Iterable[str]] = None,
+        highlighted: Optional[Iterable[str]] = None,
+    ) -> None:
+        # Sets the listed files, and the selected and highlighted ones among them (in linear
+        # time).
+
+        self._filepaths = filepaths
+        self._rows = None
+        self._selected = self._bits(selected)
+        self._highlighted = self._bits(highlighted)
+        self._selected_paths = None
+
+    def add_files(self, filepaths: List[str], selected: Optional[AbstractSet[str]] = None) -> None:
+        # Appends files (e.g., while a directory is listed); those in 'selected' are selected.
+
+        row: int = len(self._filepaths)
+        self._filepaths.extend(filepaths)
+        if self._rows is not None:
+            for filepath in filepaths:
+                self._rows[filepath] = row
+                row += 1
+        if selected:
+            self._selected.extend(filepath in selected for filepath in filepaths)
+        else:
+            self._selected.extend(bytes(len(filepaths)))
+        self._highlighted.extend(bytes(len(filepaths)))
+        self._selected_paths = None
+
+    def insert_files(
+        self,
+        row: int,
+        filepaths: List[str],
+        selected: Optional[bytes] = None,
+        highlighted: Optional[bytes] = None,
+    ) -> None:
+        # Inserts files before a row, with their selected and highlighted bits (by default, 0).
+
+        n: int = len(filepaths)
+        self._filepaths[row:row] = filepaths
+        self._selected[row:row] = selected if selected is not None else bytes(n)
+        self._highlighted[row:row] = highlighted if highlighted is not None else bytes(n)
+        self._rows = None
+        self._selected_paths = None
+
+    def remove_rows(self, first: int, last: int) -> None:
+        del self._filepaths[first : last + 1]
+        del self._selected[first : last + 1]
+        del self._highlighted[first : last + 1]
+        self._rows = None
+        self._selected_paths = None
+
+    def filepaths(self) -> List[str]:
+        return self._filepaths
+
+    def num_files(self) -> int:
+        return len(self._filepaths)
+
+    def row(self, path: str) -> Optional[int]:
+        # Returns the row of a path, or None if it is not listed.
+
+        return self._index().get(path)
+
+    # selected
+    def is_selected(self, row: int) -> bool:
+        return self._selected[row] == 1
+
+    def num_selected(self) -> int:
+        return self._selected.count(1)
+
+    def selected_paths(self) -> List[str]:
+        # (the list is kept until the selection changes; do not modify it)
+        if self._selected_paths is None:
+            self._selected_paths = list(itertools.compress(self._filepaths, self._selected))
+        return self._selected_paths
+
+    def set_selected(self, row: int, is_selected: bool) -> None:
+        self._selected[row] = is_selected
+        self._selected_paths = None
+
+    def set_selected_all(self, is_selected: bool) -> None:
+        self._selected = bytearray(b"\x01" if is_selected else b"\x00") * len(self._filepaths)
+        self._selected_paths = None
+
+    def set_selected_ranges(self, ranges: Iterable[Tuple[int, int]], is_selected: bool) -> None:
+        self._set_ranges(self._selected, ranges, is_selected)
+        self._selected_paths = None
+
+    def select_bits(self, bits: bytes, is_selected: bool) -> None:
+        # Selects (or deselects) the rows of a bitset (e.g., of the files shown by a filter).
+
+        n: int = len(self._filepaths)
+        selected: int = int.from_bytes(self._selected, "little")
+        other: int = int.from_bytes(bits, "little")
+        selected = selected | other if is_selected else selected & ~other
+        self._selected = bytearray(selected.to_bytes(n, "little"))
+        self._selected_paths = None
+
+    def select_highlighted(self, is_selected: bool) -> None:
+        # Selects (or deselects) the highlighted rows.
+
+        self.select_bits(self._highlighted, is_selected)
+
+    def num_selected_of(self, bits: bytes) -> int:
+        # Returns the number of selected rows of a bitset.
+
+        n: int = len(self._filepaths)
+        selected: int = int.from_bytes(self._selected, "little") & int.from_bytes(bits, "little")
+        return selected.to_bytes(n, "little").count(1)
+
+    # highlighted
+    def is_highlighted(self, row: int) -> bool:
+        return self._highlighted[row] == 1
+
+    def num_highlighted(self) -> int:
+        return self._highlighted.count(1)
+
+    def first_highlighted(self) -> Optional[int]:
+        row: int = self._highlighted.find(1)
+        return row if row >= 0 else None
+
+    def highlighted_paths(self) -> List[str]:
+        return list(itertools.compress(self._filepaths, self._highlighted))
+
+    def highlighted_ranges(self) -> List[Tuple[int, int]]:
+        return self._ranges(self._highlighted)
+
+    def set_highlighted_ranges(
+        self, ranges: Iterable[Tuple[int, int]], is_highlighted: bool
+    ) -> None:
+        self._set_ranges(self._highlighted, ranges, is_highlighted)
+
+    def keep_highlighted(self, bits: bytes) -> None:
+        # Unhighlights the rows that are not in a bitset (e.g., that a filter hides).
+
+        n: int = len(self._filepaths)
+        highlighted: int = int.from_bytes(self._highlighted, "little") & int.from_bytes(
+            bits, "little"
+        )
+        self._highlighted = bytearray(highlighted.to_bytes(n, "little"))
+
+    # named selection sets
+    def set_names(self) -> List[str]:
+        return sorted(self._sets)
+
+    def named_set(self, name: str) -> FrozenSet[str]:
+        return self._sets[name]
+
+    def save_set(self, name: str, paths: Optional[Iterable[str]] = None) -> None:
+        # Saves the given paths (by default, the selected paths) as a named set; replaces a set
+        # with the same name.
+
+        self._sets[name] = frozenset(self.selected_paths() if paths is None else paths)
+
+    def remove_set(self, name: str) -> None:
+        self._sets.pop(name, None)
+
+    def combine_sets(self, operation: str, names: List[str]) -> FrozenSet[str]:
+        # Combines named sets, from left to right, with 'SET_UNION', 'SET_INTERSECT' or
+        # 'SET_DIFFERENCE'.
+
+        assert names, "No sets to combine"
+        paths: FrozenSet[str] = self._sets[names[0]]
+        for name in names[1:]:
+            if operation == SET_UNION:
+                paths = paths | self._sets[name]
+            elif operation == SET_INTERSECT:
+                paths = paths & self._sets[name]
+            elif operation == SET_DIFFERENCE:
+                paths = paths - self._sets[name]
+            else:
+                raise ValueError(f"Unknown set operation '{operation}'")
+        return paths
+
+    def restore_set(self, name: str, operation: Optional[str] = None) -> None:
+        # Selects the listed paths of a named set: replaces the selection, or combines it with
+        # the selection ('SET_UNION', 'SET_INTERSECT' or 'SET_DIFFERENCE').
+
+        n: int = len(self._filepaths)
+        bits: bytearray = self._bits(self._sets[name])
+        if operation is None:
+            self._selected = bits
+        else:
+            selected: int = int.from_bytes(self._selected, "little")
+            other: int = int.from_bytes(bits, "little")
+            if operation == SET_UNION:
+                selected |= other
+            elif operation == SET_INTERSECT:
+                selected &= other
+            elif operation == SET_DIFFERENCE:
+                selected &= ~other
+            else:
+                raise ValueError(f"Unknown set operation '{operation}'")
+            self._selected = bytearray(selected.to_bytes(n, "little"))
+        self._selected_paths = None
+
+    def rename_paths(self, renamed: Mapping[str, str]) -> None:
+        # Updates the named sets after files were renamed (old path -> new path).
+
+        if not renamed:
+            return
+        for name, paths in self._sets.items():
+            if any(path in renamed for path in paths):
+                self._sets[name] = frozenset(renamed.get(path, path) for path in paths)
@@ -0,0 +1,183 @@
+from __future__ import annotations
+import os
+import datetime
+import uuid
+import xml.etree.ElementTree as ET
+from typing import Dict, Optional
+
+from package.ImageMetadata import ImageMetadata
+
+
+# XMP sidecar files ('<basename>.xmp' next to the image) can hold a new date taken and/or a new
+# file name, so that these can be changed without writing the JPEG file. Existing sidecars (e.g.,
+# written by other apps) are updated in place; other properties are kept.
+
+_NS_X: str = "adobe:ns:meta/"
+_NS_RDF: str = "http://www.w3.org/1999/02/22-rdf-syntax-ns#"
+_NS_EXIF: str = "http://ns.adobe.com/exif/1.0/"
+_NS_XMP_MM: str = "http://ns.adobe.com/xap/1.0/mm/"
+_NS_EXIFEDIT: str = "https://github.com/artjvl/ExifEdit/ns/1.0/"
+
+_NAMESPACES: Dict[str, str] = {
+    "x": _NS_X,
+    "rdf": _NS_RDF,
+    "exif": _NS_EXIF,
+    "xmpMM": _NS_XMP_MM,
+    "exifedit": _NS_EXIFEDIT,
+}
+
+_DATE_TAKEN: str = f"{{{_NS_EXIF}}}DateTimeOriginal"
+_PRESERVED_FILENAME: str = f"{{{_NS_XMP_MM}}}PreservedFileName"
+_FILENAME: str = f"{{{_NS_EXIFEDIT}}}FileName"
+
+_PACKET_BEGIN: str = '<?xpacket begin="﻿" id="W5M0MpCehiHzreSzNTczkc9d"?>\n'
+_PACKET_END: str = '\n<?xpacket end="w"?>\n'
+
+for prefix, uri in _NAMESPACES.items():
+    ET.register_namespace(prefix, uri)
+
+
+def sidecar_path(path: str) -> str:
+    return f"{os.path.splitext(path)[0]}.xmp"
+
+
+def has_sidecar(path: str) -> bool:
+    return os.path.isfile(sidecar_path(path))
+
+
+def _parse(xmp_path: str) -> ET.Element:
+    # parses a sidecar while registering its namespace prefixes, so that they are kept on write
+    for _, (prefix, uri) in ET.iterparse(xmp_path, events=("start-ns",)):
+        if prefix and uri not in _NAMESPACES.values():
+            ET.register_namespace(prefix, uri)
+    return ET.parse(xmp_path).getroot()
+
+
+def _description(root: ET.Element) -> ET.Element:
+    # returns the (first) rdf:Description element, creating the structure if needed
+    description: Optional[ET.Element] = root.find(f".//{{{_NS_RDF}}}Description")
+    if description is None:
+        rdf: Optional[ET.Element] = root.find(f".//{{{_NS_RDF}}}RDF")
+        if rdf is None:
+            rdf = ET.SubElement(root, f"{{{_NS_RDF}}}RDF")
+        description = ET.SubElement(rdf, f"{{{_NS_RDF}}}Description")
+        description.set(f"{{{_NS_RDF}}}about", "")
+    return description
+
+
+def _get(root: ET.Element, name: str) -> Optional[str]:
+    # properties can be stored as attribute or as child element of any rdf:Description
+    for description in root.iter(f"{{{_NS_RDF}}}Description"):
+        if name in description.attrib:
+            return description.attrib[name]
+        element: Optional[ET.Element] = description.find(name)
+        if element is not None and element.text is not None:
+            return element.text.strip()
+    return None
+
+
+def _set(root: ET.Element, name: str, value: str) -> None:
+    for description in root.iter(f"{{{_NS_RDF}}}Description"):
+        description.attrib.pop(name, None)
+        for element in description.findall(name):
+            description.remove(element)
+    _description(root).set(name, value)
+
+
+def _parse_date(text: str) -> Optional[datetime.datetime]:
+    # XMP dates are ISO 8601, optionally with fractional seconds and a time zone (which is dropped,
+    # as EXIF dates are local times)
+    if text.endswith("Z"):
+        text = text[:-1]
+    try:
+        return datetime.datetime.fromisoformat(text).replace(tzinfo=None, microsecond=0)
+    except ValueError:
+        return None
+
+
+def read_sidecar(path: str) -> Dict[str, object]:
+    # Returns the properties stored in the sidecar of an image: 'date_taken' and/or 'filename'.
+    # Returns an empty dict if there is no (valid) sidecar.
+
+    xmp_path: str = sidecar_path(path)
+    properties: Dict[str, object] = {}
+    if not os.path.isfile(xmp_path):
+        return properties
+    try:
+        root: ET.Element = _parse(xmp_path)
+    except (ET.ParseError, OSError) as e:
+        print(f"Cannot read sidecar '{xmp_path}': {e}")
+        return properties
+
+    date_text: Optional[str] = _get(root, _DATE_TAKEN)
+    if date_text is not None:
+        date_taken: Optional[datetime.datetime] = _parse_date(date_text)
+        if date_taken is not None:
+            properties["date_taken"] = date_taken
+    filename: Optional[str] = _get(root, _FILENAME)
+    if filename is not None:
+        properties["filename"] = filename
+    return properties
+
+
+def write_sidecar(
+    path: str,
+    date_taken: Optional[datetime.datetime] = None,
+    filename: Optional[str] = None,
+) -> str:
+    # Writes the given properties to the sidecar of an image (creating it if needed) and returns
+    # the sidecar path. The sidecar is replaced atomically.
+
+    xmp_path: str = sidecar_path(path)
+    root: ET.Element
+    if os.path.isfile(xmp_path):
+        root = _parse(xmp_path)
+    else:
+        root = ET.Element(f"{{{_NS_X}}}xmpmeta")
+        _description(root)
+
+    if date_taken is not None:
+        _set(root, _DATE_TAKEN, date_taken.strftime("%Y-%m-%dT%H:%M:%S"))
+    if filename is not None:
+        _set(root, _FILENAME, filename)
+        if _get(root, _PRESERVED_FILENAME) is None:
+            _set(root, _PRESERVED_FILENAME, os.path.basename(path))
+
+    text: str = _PACKET_BEGIN + ET.tostring(root, encoding="unicode") + _PACKET_END
+    # like 'Image.temp_path': a plain new file follows the umask (unlike 'tempfile.mkstemp')
+    tmp_path: str = os.path.join(os.path.dirname(xmp_path), f".exifedit-{uuid.uuid4().hex}.tmp")
+    with open(tmp_path, "x", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, xmp_path)
+    return xmp_path
+
+
+def move_sidecar(path: str, new_path: str) -> Optional[str]:
+    # Moves the sidecar of an image that was renamed from 'path' to 'new_path'. Returns the new
+    # sidecar path, or None if there is no sidecar (or its new name is taken).
+
+    xmp_path: str = sidecar_path(path)
+    new_xmp_path: str = sidecar_path(new_path)
+    if xmp_path == new_xmp_path or not os.path.isfile(xmp_path):
+        return None
+    if os.path.exists(new_xmp_path) and not os.path.samefile(xmp_path, new_xmp_path):
+        print(f"Cannot move sidecar '{xmp_path}': '{new_xmp_path}' exists")
+        return None
+    os.replace(xmp_path, new_xmp_path)
+    return new_xmp_path
+
+
+def apply_sidecar(metadata: ImageMetadata) -> ImageMetadata:
+    # Returns the metadata with the values of the sidecar (if any) merged over the embedded EXIF
+    # values.
+
+    xmp_path: str = sidecar_path(metadata.path())
+    try:
+        sidecar_mtime_ns: int = os.stat(xmp_path).st_mtime_ns
+    except OSError:
+        return metadata
+    properties: Dict[str, object] = read_sidecar(metadata.path())
+    return metadata.replace(
+        date_taken=properties.get("date_taken", metadata.date_taken()),
+        sidecar_mtime_ns=sidecar_mtime_ns,
+    )
@@ -0,0 +1,58 @@
+from __future__ import annotations
+import os
+import threading
+from typing import List
+
+import send2trash
+
+
+class TrashBin(object):
+    # Collects original files that are to be moved to the trash, so that they can be trashed in
+    # a few batched 'send2trash' calls instead of one call per file. Files are trashed from where
+    # they are (their original path), so that the trash records (and restores to) their original
+    # location; the caller moves their replacements into place once the bin has been flushed.
+
+    CHUNK_SIZE: int = 256
+
+    _paths: List[str]
+    _lock: threading.Lock
+
+    def __init__(self) -> None:
+        self._paths = []
+        self._lock = threading.Lock()
+
+    # public
+    def add(self, path: str) -> None:
+        with self._lock:
+            self._paths.append(path)
+
+    def paths(self) -> List[str]:
+        with self._lock:
+            return list(self._paths)
+
+    def num_paths(self) -> int:
+        with self._lock:
+            return len(self._paths)
+
+    def is_full(self) -> bool:
+        # whether the bin holds a full chunk, i.e., should be flushed
+        return self.num_paths() >= self.CHUNK_SIZE
+
+    def flush(self) -> List[str]:
+        # Moves all collected files to the trash, in chunks. Returns the files that could not be
+        # trashed (they are still in place).
+
+        with self._lock:
+            paths: List[str] = self._paths
+            self._paths = []
+
+        failed: List[str] = []
+        for i in range(0, len(paths), self.CHUNK_SIZE):
+            chunk: List[str] = paths[i: i + self.CHUNK_SIZE]
+            print(f"Moving {len(chunk)} file(s) to trash")
+            try:
+                send2trash.send2trash(chunk)
+            except Exception as e:
+                print(f"Cannot move files to trash: {e!r}")
+                failed.extend(path for path in chunk if os.path.lexists(path))
+        return failed
@@ -1,11 +1,21 @@
 import sys
+import argparse
 from PySide6.QtWidgets import QApplication
 
 from package.MainWindow import MainWindow
+from package.ImageBackend import backend_names
 
 
 def run():
-    app = QApplication(sys.argv)
-    window = MainWindow()
+    parser = argparse.ArgumentParser(prog="ExifEdit")
+    parser.add_argument(
+        "--backend",
+        choices=backend_names(),
+        help="image backend to use (overrides the saved choice)",
+    )
+    args, qt_args = parser.parse_known_args(sys.argv[1:])
+
+    app = QApplication(sys.argv[:1] + qt_args)
+    window = MainWindow(backend=args.backend)
     window.show()
     app.exec()
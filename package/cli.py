@@ -0,0 +1,248 @@
+from __future__ import annotations
+import os
+import re
+import sys
+import json
+import argparse
+import datetime
+from typing import Dict, List, Optional, TextIO
+
+from package.DirectoryScan import ScanOptions, list_directory
+from package.ImageBackend import backend_names, set_default_backend
+from package.FileOperation import EXECUTOR_PROCESS, EXECUTOR_SERIAL
+from package.FilePlan import OUTPUT_REWRITE, OUTPUT_SIDECAR, FilePlan
+from package.PlanExecutor import PlanExecutor
+from package.Rules import TAGS, DateRule, FileNameRule, Rules
+from package.Journal import incomplete_journals, recover_journal
+
+
+# Headless batch modification (without Qt), with the same rules and engine as the app:
+#   python -m package.cli DIR_OR_FILE... [--template TEXT] [--shift DELTA | --date DATE]
+
+# [+|-][DAYS:]HH:MM:SS
+_SHIFT_PATTERN = re.compile(r"([+-]?)(?:(\d+):)?(\d+):(\d+):(\d+)")
+
+
+def _parse_shift(text: str) -> datetime.timedelta:
+    match: Optional[re.Match] = _SHIFT_PATTERN.fullmatch(text.strip())
+    if match is None:
+        raise argparse.ArgumentTypeError(f"invalid shift '{text}' (expected [+|-][DAYS:]HH:MM:SS)")
+    sign, days, hours, minutes, seconds = match.groups()
+    delta: datetime.timedelta = datetime.timedelta(
+        days=int(days or 0), hours=int(hours), minutes=int(minutes), seconds=int(seconds)
+    )
+    return -delta if sign == "-" else delta
+
+
+def _parse_date(text: str) -> datetime.datetime:
+    try:
+        return datetime.datetime.fromisoformat(text.strip()).replace(microsecond=0, tzinfo=None)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid date '{text}' (expected YYYY-MM-DD HH:MM:SS)")
+
+
+def list_images(paths: List[str], options: Optional[ScanOptions] = None) -> List[str]:
+    # Returns the JPEG files of the given directories (like the file list of the app; see
+    # 'ScanOptions' for subdirectories) and the given files, in order.
+
+    filepaths: List[str] = []
+    for path in paths:
+        if os.path.isdir(path):
+            try:
+                filepaths.extend(list_directory(path, options))
+            except OSError as e:
+                print(f"Cannot list '{path}': {e}", file=sys.stderr)
+        elif os.path.isfile(path):
+            filepaths.append(path)
+        else:
+            print(f"'{path}' does not exist", file=sys.stderr)
+    return filepaths
+
+
+def _parser() -> argparse.ArgumentParser:
+    tags: str = ", ".join(f"[{tag}{'text]' if tag.endswith(':') else ']'}" for tag in TAGS)
+    parser = argparse.ArgumentParser(
+        prog="python -m package.cli",
+        description="Rename JPEG files and change their 'Date taken' without the GUI.",
+    )
+    parser.add_argument("paths", nargs="*", help="directories and/or image files")
+    parser.add_argument(
+        "-r", "--recursive", action="store_true", help="also list the images in subdirectories"
+    )
+    parser.add_argument(
+        "--max-depth", type=int, help="with --recursive, list at most this many levels down"
+    )
+    parser.add_argument(
+        "--include",
+        action="append",
+        default=[],
+        metavar="GLOB",
+        help="only list images whose name or relative path matches (repeatable)",
+    )
+    parser.add_argument(
+        "--exclude",
+        action="append",
+        default=[],
+        metavar="GLOB",
+        help="do not list images or enter directories that match (repeatable)",
+    )
+    parser.add_argument("-t", "--template", help=f"file name template with tags {tags}")
+    date_group = parser.add_mutually_exclusive_group()
+    date_group.add_argument(
+        "-s",
+        "--shift",
+        type=_parse_shift,
+        help="shift the date taken by [+|-][DAYS:]HH:MM:SS (write negative shifts as --shift=-...)",
+    )
+    date_group.add_argument(
+        "-d", "--date", type=_parse_date, help="set the date taken to 'YYYY-MM-DD HH:MM:SS'"
+    )
+    parser.add_argument(
+        "--output",
+        choices=[OUTPUT_REWRITE, OUTPUT_SIDECAR],
+        default=OUTPUT_REWRITE,
+        help="rewrite the image files, or write the changes to XMP sidecar files",
+    )
+    parser.add_argument(
+        "--no-sidecar-rename",
+        action="store_true",
+        help="in sidecar mode, record the new names in the sidecars instead of renaming",
+    )
+    parser.add_argument(
+        "-j", "--jobs", type=int, help="number of worker processes (1 = no workers)"
+    )
+    parser.add_argument(
+        "--no-trash",
+        action="store_true",
+        help="delete rewritten originals instead of moving them to the trash",
+    )
+    parser.add_argument("--backend", choices=backend_names(), help="image backend to use")
+    parser.add_argument(
+        "-n", "--dry-run", action="store_true", help="only show the plan, without modifying files"
+    )
+    parser.add_argument("--json", action="store_true", help="write the result as JSON")
+    parser.add_argument(
+        "--recover",
+        choices=["forward", "back"],
+        help="roll the incomplete operations of interrupted runs forward or back, and exit",
+    )
+    return parser
+
+
+def _print_plan(plan: FilePlan, new_filepaths: Optional[List[str]], out: TextIO) -> None:
+    for i, row in enumerate(plan.rows()):
+        target: object = new_filepaths[i] if new_filepaths is not None else row["target"]
+        line: str = f"{row['action']:<8} {row['source']}"
+        if target != row["source"]:
+            line += f" -> {target}"
+        if row["new_date_taken"] is not None:
+            line += f" [{row['date_taken']} -> {row['new_date_taken']}]"
+        if row["notes"]:
+            line += f" ({row['notes']})"
+        print(line, file=out)
+    print(
+        f"{plan.num_changes()}/{plan.num_files()} files change ({plan.num_skipped()} skipped, "
+        f"{plan.num_collisions()} name collisions, {plan.num_cycles()} files in rename cycles)",
+        file=out,
+    )
+
+
+def _recover(is_forward: bool) -> int:
+    num_failed: int = 0
+    for path in incomplete_journals():
+        recovered, failed = recover_journal(path, is_forward)
+        print(f"'{path}': {recovered} operation(s) recovered, {failed} failed")
+        num_failed += failed
+    return 1 if num_failed > 0 else 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser: argparse.ArgumentParser = _parser()
+    args: argparse.Namespace = parser.parse_args(argv)
+    if args.backend is not None:
+        set_default_backend(args.backend)
+    if args.recover is not None:
+        return _recover(args.recover == "forward")
+    if not args.paths:
+        parser.error("no directories or files given")
+
+    filename_rule: Optional[FileNameRule] = None
+    if args.template:
+        filename_rule = FileNameRule(args.template)
+        if not filename_rule.is_valid():
+            parser.error(f"unknown tag in template '{args.template}'")
+    date_rule: Optional[DateRule] = None
+    if args.shift is not None:
+        date_rule = DateRule(delta=args.shift)
+    elif args.date is not None:
+        date_rule = DateRule(date_time=args.date)
+    if filename_rule is None and date_rule is None:
+        parser.error("nothing to change (use --template, --shift and/or --date)")
+    if args.max_depth is not None and args.max_depth < 0:
+        parser.error("the depth limit cannot be negative")
+    if filename_rule is not None and date_rule is not None:
+        # date/time tags use the changed date
+        filename_rule = FileNameRule(args.template, date_rule)
+
+    # with JSON output, messages of the file operations go to stderr
+    out: TextIO = sys.stdout
+    if args.json:
+        sys.stdout = sys.stderr
+
+    if incomplete_journals():
+        print(
+            "Warning: an earlier run did not complete (see --recover)",
+            file=sys.stderr,
+        )
+
+    options: ScanOptions = ScanOptions(
+        args.recursive, args.max_depth, args.include, args.exclude
+    )
+    filepaths: List[str] = list_images(args.paths, options)
+    rules: Rules = Rules(filename_rule, date_rule)
+    plan: FilePlan = rules.plan(
+        filepaths, output=args.output, is_sidecar_rename=not args.no_sidecar_rename
+    )
+
+    new_filepaths: Optional[List[str]] = None
+    num_failed: int = 0
+    if not args.dry_run and plan.num_changes() > 0:
+        executor: PlanExecutor = PlanExecutor(
+            plan,
+            is_send2trash=not args.no_trash,
+            executor=EXECUTOR_SERIAL if args.jobs == 1 else EXECUTOR_PROCESS,
+            max_workers=args.jobs,
+        )
+        executor.run()
+        new_filepaths = executor.new_filepaths()
+        num_failed = executor.num_failed()
+
+    if args.json:
+        rows: List[Dict[str, object]] = plan.rows()
+        if new_filepaths is not None:
+            for row, new_filepath in zip(rows, new_filepaths):
+                row["result"] = new_filepath
+        json.dump(
+            {
+                "dry_run": args.dry_run,
+                "files": plan.num_files(),
+                "changes": plan.num_changes(),
+                "skipped": plan.num_skipped(),
+                "collisions": plan.num_collisions(),
+                "cycles": plan.num_cycles(),
+                "failed": num_failed,
+                "plan": rows,
+            },
+            out,
+            indent=2,
+        )
+        print(file=out)
+    else:
+        _print_plan(plan, new_filepaths, out)
+        if num_failed > 0:
+            print(f"{num_failed} files failed", file=out)
+    return 1 if num_failed > 0 else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
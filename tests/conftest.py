@@ -0,0 +1,35 @@
+from __future__ import annotations
+import os
+import sys
+import datetime
+import tempfile
+
+import piexif
+import pytest
+from PIL import Image as PILImage
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# the metadata cache and the journals of the tests are kept apart from those of the user
+os.environ["XDG_CACHE_HOME"] = tempfile.mkdtemp(prefix="exifedit-tests-")
+
+
+def make_jpeg(path: str, date_taken: datetime.datetime = datetime.datetime(2021, 6, 1, 12)) -> str:
+    # Writes a small JPEG with the date fields set (as a camera would).
+
+    date: bytes = date_taken.strftime("%Y:%m:%d %H:%M:%S").encode("ascii")
+    exif_bytes: bytes = piexif.dump({
+        "0th": {piexif.ImageIFD.Make: b"SONY", piexif.ImageIFD.Model: b"ILCE-7C"},
+        "Exif": {piexif.ExifIFD.DateTimeOriginal: date, piexif.ExifIFD.DateTimeDigitized: date},
+        "GPS": {},
+        "Interop": {},
+        "1st": {},
+        "thumbnail": None,
+    })
+    PILImage.new("RGB", (16, 8), (200, 100, 50)).save(path, "JPEG", exif=exif_bytes)
+    return path
+
+
+@pytest.fixture
+def jpeg(tmp_path) -> str:
+    return make_jpeg(os.path.join(str(tmp_path), "IMG_1.JPG"))
@@ -0,0 +1,23 @@
+from __future__ import annotations
+import os
+from typing import List
+
+from conftest import make_jpeg
+from package.DirectoryScan import ScanOptions, is_image_name, list_directory
+from package.FilePlan import FilePlan
+
+
+def test_temp_names_are_not_listed(tmp_path) -> None:
+    # A -> B and B -> A: A is moved to a temporary name first
+    paths: List[str] = [
+        make_jpeg(os.path.join(str(tmp_path), f"{name}.JPG")) for name in ("A", "B")
+    ]
+    plan: FilePlan = FilePlan.build(
+        paths, lambda metadata: [(name, None) for name in ("B.JPG", "A.JPG")]
+    )
+    _, from_path, temp_path = plan.steps()[0]
+    assert os.path.dirname(temp_path) == str(tmp_path)
+    assert not is_image_name(os.path.basename(temp_path))
+
+    os.rename(from_path, temp_path)
+    assert list_directory(str(tmp_path), ScanOptions()) == [paths[1]]
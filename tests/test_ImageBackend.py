@@ -0,0 +1,53 @@
+from __future__ import annotations
+import os
+import datetime
+from typing import Optional
+
+import pytest
+
+from package.Image import Image
+from package.ImageBackend import backend, backend_names, benchmark_backends
+
+
+@pytest.mark.parametrize("name", backend_names())
+def test_write(name: str, jpeg: str) -> None:
+    dt: datetime.datetime = datetime.datetime(2022, 3, 4, 5, 6, 7)
+    img: Image = backend(name)(jpeg)
+    img.set_date_taken(dt)
+    tmp_path: Optional[str] = img.write()
+    if tmp_path is not None:
+        assert os.path.isfile(tmp_path)
+        assert backend(name)(jpeg).date_taken() != dt
+        os.replace(tmp_path, jpeg)
+    assert backend(name)(jpeg).date_taken() == dt
+
+
+@pytest.mark.parametrize("name", backend_names())
+def test_write_unchanged(name: str, jpeg: str) -> None:
+    tmp_path: Optional[str] = backend(name)(jpeg).write()
+    if tmp_path is not None:
+        os.replace(tmp_path, jpeg)
+    assert backend(name)(jpeg).date_taken() == datetime.datetime(2021, 6, 1, 12)
+
+
+def test_benchmark_backends(jpeg: str) -> None:
+    with open(jpeg, "rb") as f:
+        original: bytes = f.read()
+    timings = benchmark_backends([jpeg])
+    assert set(timings) == set(backend_names())
+    assert all(timing is not None for timing in timings.values())
+    with open(jpeg, "rb") as f:
+        assert f.read() == original
+
+
+@pytest.mark.parametrize("name", backend_names())
+def test_write_keeps_mode(name: str, jpeg: str) -> None:
+    old_umask: int = os.umask(0o022)
+    try:
+        os.chmod(jpeg, 0o644)
+        img: Image = backend(name)(jpeg)
+        img.set_date_taken(datetime.datetime(2022, 3, 4, 5, 6, 7))
+        Image.replace_original(jpeg, img.write(), jpeg, is_send2trash=False)
+    finally:
+        os.umask(old_umask)
+    assert os.stat(jpeg).st_mode & 0o777 == 0o644
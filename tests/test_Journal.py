@@ -0,0 +1,194 @@
+from __future__ import annotations
+import os
+import sys
+import datetime
+import multiprocessing
+from typing import List
+
+import pytest
+
+from conftest import make_jpeg
+from package.FileOperation import EXECUTOR_SERIAL
+from package.FilePlan import FilePlan
+from package.Image import Image
+from package.ImageBackend import open_image
+from package.Journal import Journal, incomplete_journals, pending_operations, recover_journal
+from package.PlanExecutor import PlanExecutor
+
+_NEW_DATE: datetime.datetime = datetime.datetime(2022, 3, 4, 5, 6, 7)
+
+
+def test_recover_removes_own_temp_files(tmp_path, jpeg: str) -> None:
+    # a worker was writing to a temporary file when the app died, next to a temporary file of
+    # another instance
+    old_date: datetime.datetime = open_image(jpeg).date_taken()
+    own_tmp: str = Image.temp_path(jpeg)
+    other_tmp: str = Image.temp_path(jpeg)
+    for path in (own_tmp, other_tmp):
+        with open(path, "wb") as f:
+            f.write(b"partial")
+
+    journal: Journal = Journal(os.path.join(str(tmp_path), "journal", "run.jsonl"))
+    journal.write(jpeg, old_date, _NEW_DATE, tmp=own_tmp)
+    journal.close()
+    assert os.path.isfile(journal.path())
+
+    assert recover_journal(journal.path(), is_forward=False) == (1, 0)
+    assert not os.path.exists(journal.path())
+    assert not os.path.exists(own_tmp)
+    assert os.path.isfile(other_tmp)
+    assert open_image(jpeg).date_taken() == old_date
+
+
+def _run_until_swapped(plan: FilePlan) -> None:
+    # (child process) executes the plan, and dies once the first file of the rename cycle has
+    # been moved to its temporary name
+
+    execute = PlanExecutor._execute
+
+    def crashing(self, file, from_path, to_path, is_last, *args) -> None:
+        execute(self, file, from_path, to_path, is_last, *args)
+        if not is_last:
+            os._exit(1)
+
+    PlanExecutor._execute = crashing
+    PlanExecutor(plan, is_send2trash=False, executor=EXECUTOR_SERIAL).run()
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="the crash is simulated in a forked process")
+@pytest.mark.parametrize("is_forward", [True, False])
+def test_recover_rename_cycle(tmp_path, monkeypatch, is_forward: bool) -> None:
+    # A -> B and B -> A: the app dies while A is at its temporary name
+    monkeypatch.setenv("XDG_CACHE_HOME", os.path.join(str(tmp_path), "cache"))
+    dirpath: str = os.path.join(str(tmp_path), "photos")
+    os.mkdir(dirpath)
+    paths: List[str] = [
+        make_jpeg(os.path.join(dirpath, f"{name}.JPG"), datetime.datetime(2021, 6, 1, i))
+        for i, name in enumerate("AB")
+    ]
+    plan: FilePlan = FilePlan.build(
+        paths, lambda metadata: [(name, None) for name in ("B.JPG", "A.JPG")]
+    )
+    process = multiprocessing.get_context("fork").Process(target=_run_until_swapped, args=(plan,))
+    process.start()
+    process.join()
+    assert process.exitcode == 1
+    assert sorted(os.listdir(dirpath)) == sorted([os.path.basename(plan.steps()[0][2]), "B.JPG"])
+
+    journals: List[str] = incomplete_journals()
+    assert len(journals) == 1
+    assert len(pending_operations(journals[0])) == 1
+    assert recover_journal(journals[0], is_forward) == (1, 0)
+    assert not os.path.exists(journals[0])
+    assert sorted(os.listdir(dirpath)) == ["A.JPG", "B.JPG"]
+    assert [open_image(path).date_taken().hour for path in paths] == [0, 1]
+
+
+def _run_until_trashed(plan: FilePlan, num_placed: int) -> None:
+    # (child process) executes the plan, and dies once the originals have been trashed and the
+    # given number of rewritten copies have been moved into place
+
+    place = PlanExecutor._place
+
+    def crashing(self, *args) -> None:
+        nonlocal num_placed
+        if num_placed == 0:
+            os._exit(1)
+        num_placed -= 1
+        place(self, *args)
+
+    PlanExecutor._place = crashing
+    PlanExecutor(plan, executor=EXECUTOR_SERIAL).run()
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="the crash is simulated in a forked process")
+@pytest.mark.parametrize("is_forward", [True, False])
+@pytest.mark.parametrize("num_placed", [0, 1])
+def test_recover_trashed_rewrites(tmp_path, monkeypatch, is_forward: bool, num_placed: int) -> None:
+    # A -> B and B -> A (a rename cycle) and C -> C, all rewritten: the app dies once the
+    # originals are in the trash, before or after B has been moved into place (taking the name of
+    # the original of A)
+    monkeypatch.setenv("XDG_CACHE_HOME", os.path.join(str(tmp_path), "cache"))
+    monkeypatch.setattr("package.ImageBackend._default_name", "exif")
+    trash_dir: str = os.path.join(str(tmp_path), "trash")
+    os.mkdir(trash_dir)
+
+    def send2trash(paths) -> None:
+        for path in [paths] if isinstance(paths, str) else paths:
+            os.rename(path, os.path.join(trash_dir, os.path.basename(path)))
+
+    monkeypatch.setattr("send2trash.send2trash", send2trash)
+    dirpath: str = os.path.join(str(tmp_path), "photos")
+    os.mkdir(dirpath)
+    paths: List[str] = [
+        make_jpeg(os.path.join(dirpath, f"{name}.JPG"), datetime.datetime(2021, 6, 1, i))
+        for i, name in enumerate("ABC")
+    ]
+    plan: FilePlan = FilePlan.build(
+        paths,
+        lambda metadata: [
+            (name, datetime.datetime(2022, 1, 1, i)) for i, name in enumerate(["B.JPG", "A.JPG"])
+        ]
+        + [(None, _NEW_DATE)],
+    )
+    process = multiprocessing.get_context("fork").Process(
+        target=_run_until_trashed, args=(plan, num_placed)
+    )
+    process.start()
+    process.join()
+    assert process.exitcode == 1
+    assert sorted(os.listdir(trash_dir)) == ["A.JPG", "B.JPG", "C.JPG"]
+
+    journals: List[str] = incomplete_journals()
+    assert len(journals) == 1
+    assert len(pending_operations(journals[0])) == 3 - num_placed
+    assert recover_journal(journals[0], is_forward) == (3 - num_placed, 0)
+    names: List[str] = sorted(os.listdir(dirpath))
+    dates: List[datetime.datetime] = [
+        open_image(os.path.join(dirpath, name)).date_taken() for name in names
+    ]
+    if is_forward:
+        assert names == ["A.JPG", "B.JPG", "C.JPG"]
+        assert dates == [datetime.datetime(2022, 1, 1, 1), datetime.datetime(2022, 1, 1), _NEW_DATE]
+    elif num_placed == 0:
+        assert names == ["A.JPG", "B.JPG", "C.JPG"]
+        assert dates == [datetime.datetime(2021, 6, 1, i) for i in range(3)]
+    else:
+        # B was done (and keeps its new name and date); A is restored next to it
+        assert names == ["A-1.JPG", "A.JPG", "C.JPG"]
+        assert dates == [
+            datetime.datetime(2021, 6, 1, 0),
+            datetime.datetime(2022, 1, 1, 1),
+            datetime.datetime(2021, 6, 1, 2),
+        ]
+
+
+def _write_and_die(jpeg: str) -> None:
+    # (child process) records a write, and dies before it completes
+    Journal().write(jpeg, None, _NEW_DATE)
+    os._exit(1)
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="the crash is simulated in a forked process")
+def test_incomplete_journals_skips_active_runs(tmp_path, monkeypatch, jpeg: str) -> None:
+    monkeypatch.setenv("XDG_CACHE_HOME", os.path.join(str(tmp_path), "cache"))
+
+    # an active run (its journal is locked, also for this process)
+    journal: Journal = Journal()
+    journal.write(jpeg, None, _NEW_DATE)
+    assert os.path.isfile(journal.path())
+    assert incomplete_journals() == []
+
+    # a run that died
+    process = multiprocessing.get_context("fork").Process(target=_write_and_die, args=(jpeg,))
+    process.start()
+    process.join()
+    journals: List[str] = incomplete_journals()
+    assert len(journals) == 1 and journals[0] != journal.path()
+    assert recover_journal(journals[0], is_forward=False) == (1, 0)
+    name: str = os.path.basename(journal.path())
+    assert sorted(os.listdir(os.path.dirname(journal.path()))) == [name, f"{name}.lock"]
+
+    # the run ends with an incomplete operation
+    journal.close()
+    assert incomplete_journals() == [journal.path()]
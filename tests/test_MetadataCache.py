@@ -0,0 +1,62 @@
+from __future__ import annotations
+import os
+import datetime
+from typing import List
+
+from package.ImageMetadata import ImageMetadata
+from package.MetadataCache import MetadataCache, load_metadata
+from package.Sidecar import move_sidecar, write_sidecar
+
+
+class CountingLoader(object):
+    # reads the metadata, and counts the files read
+
+    paths: List[str]
+
+    def __init__(self) -> None:
+        self.paths = []
+
+    def __call__(self, path: str) -> ImageMetadata:
+        self.paths.append(path)
+        return load_metadata(path)
+
+
+def test_rename_does_not_read(tmp_path, jpeg: str) -> None:
+    loader: CountingLoader = CountingLoader()
+    cache: MetadataCache = MetadataCache(os.path.join(str(tmp_path), "cache.sqlite3"), loader)
+    cache.load(jpeg)
+    assert loader.paths == [jpeg]
+
+    # (as the plan executor does: the file is renamed first)
+    new_path: str = os.path.join(os.path.dirname(jpeg), "IMG_2.JPG")
+    os.rename(jpeg, new_path)
+    metadata: ImageMetadata = cache.rename(jpeg, new_path)
+    assert loader.paths == [jpeg]
+    assert metadata.path() == new_path
+    assert cache.get(jpeg) is None
+    assert cache.load(new_path) == metadata
+    assert loader.paths == [jpeg]
+    cache.close()
+
+
+def test_rename_with_sidecar(tmp_path, jpeg: str) -> None:
+    loader: CountingLoader = CountingLoader()
+    cache: MetadataCache = MetadataCache(os.path.join(str(tmp_path), "cache.sqlite3"), loader)
+    write_sidecar(jpeg, date_taken=datetime.datetime(2022, 3, 4, 5, 6, 7))
+    cache.load(jpeg)
+
+    new_path: str = os.path.join(os.path.dirname(jpeg), "IMG_2.JPG")
+    os.rename(jpeg, new_path)
+    move_sidecar(jpeg, new_path)
+    assert cache.rename(jpeg, new_path).date_taken() == datetime.datetime(2022, 3, 4, 5, 6, 7)
+    assert loader.paths == [jpeg]
+
+    # a changed file is read again
+    with open(new_path, "ab") as f:
+        f.write(b"\0")
+    newer_path: str = os.path.join(os.path.dirname(jpeg), "IMG_3.JPG")
+    os.rename(new_path, newer_path)
+    move_sidecar(new_path, newer_path)
+    cache.rename(new_path, newer_path)
+    assert loader.paths == [jpeg, newer_path]
+    cache.close()
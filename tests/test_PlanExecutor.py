@@ -0,0 +1,137 @@
+from __future__ import annotations
+import os
+import datetime
+import concurrent.futures
+from typing import List, Optional, Tuple
+
+from conftest import make_jpeg
+from package.FileOperation import EXECUTOR_SERIAL
+from package.FilePlan import FilePlan
+from package.ImageBackend import open_image
+from package.ImageMetadata import ImageMetadata
+from package.Journal import incomplete_journals, recover_journal
+from package.PlanExecutor import PlanExecutor
+
+_DATE: datetime.datetime = datetime.datetime(2021, 6, 1, 12)
+_NEW_DATE: datetime.datetime = datetime.datetime(2022, 3, 4, 5, 6, 7)
+
+
+def new_date(metadata: List[ImageMetadata]) -> List[Tuple[Optional[str], datetime.datetime]]:
+    return [(None, _NEW_DATE) for _ in metadata]
+
+
+def make_plan(dirpath: str, n: int = 3) -> FilePlan:
+    paths: List[str] = [make_jpeg(os.path.join(dirpath, f"IMG_{i}.JPG"), _DATE) for i in range(n)]
+    return FilePlan.build(paths, new_date)
+
+
+class BrokenExecutor(concurrent.futures.Executor):
+    # a pool whose workers died: every job fails
+
+    def submit(self, fn, *args, **kwargs) -> concurrent.futures.Future:
+        future: concurrent.futures.Future = concurrent.futures.Future()
+        future.set_exception(concurrent.futures.BrokenExecutor("worker died"))
+        return future
+
+
+def test_submit_fails(tmp_path) -> None:
+    pool: concurrent.futures.ThreadPoolExecutor = concurrent.futures.ThreadPoolExecutor(1)
+    pool.shutdown()
+    executor: PlanExecutor = PlanExecutor(
+        make_plan(str(tmp_path)), is_send2trash=False, executor=pool
+    )
+    executor.run()
+    assert executor.num_failed() == 0
+    assert [open_image(path).date_taken() for path in executor.new_filepaths()] == [_NEW_DATE] * 3
+
+
+def test_broken_pool(tmp_path) -> None:
+    executor: PlanExecutor = PlanExecutor(
+        make_plan(str(tmp_path)), is_send2trash=False, executor=BrokenExecutor()
+    )
+    executor.run()
+    assert executor.num_failed() == 0
+    assert [open_image(path).date_taken() for path in executor.new_filepaths()] == [_NEW_DATE] * 3
+
+
+def test_temp_move_fails(tmp_path, monkeypatch) -> None:
+    # A -> B and B -> A (a rename cycle): A cannot be moved to its temporary name, so it keeps
+    # its name (its date, written at its first step, is restored by the journal), and B gets a
+    # suffix
+    monkeypatch.setenv("XDG_CACHE_HOME", os.path.join(str(tmp_path), "cache"))
+    paths: List[str] = [
+        make_jpeg(os.path.join(str(tmp_path), f"{name}.JPG"), _DATE) for name in ("A", "B")
+    ]
+    plan: FilePlan = FilePlan.build(
+        paths, lambda metadata: [(name, _NEW_DATE) for name in ("B.JPG", "A.JPG")]
+    )
+    assert len(plan.steps()) == 3
+    i, from_path, temp_path = plan.steps()[0]
+    os.mkdir(temp_path)
+
+    executor: PlanExecutor = PlanExecutor(plan, is_send2trash=False, executor=EXECUTOR_SERIAL)
+    executor.run()
+    assert executor.num_failed() == 1
+    assert executor.new_filepaths()[i] == from_path
+    journals: List[str] = incomplete_journals()
+    assert len(journals) == 1
+    assert recover_journal(journals[0], is_forward=False) == (1, 0)
+    assert open_image(from_path).date_taken() == _DATE
+    assert open_image(executor.new_filepaths()[1 - i]).date_taken() == _NEW_DATE
+    assert sorted(os.listdir(str(tmp_path))) == sorted(
+        [os.path.basename(temp_path), "A.JPG", "A-1.JPG", "cache"]
+    )
+
+
+def test_stop_completes_cycles(tmp_path) -> None:
+    # stopped after the first file: the rename cycle that is open is completed, and the files
+    # after it are not modified
+    paths: List[str] = [
+        make_jpeg(os.path.join(str(tmp_path), f"{name}.JPG"), _DATE) for name in "ABCD"
+    ]
+    plan: FilePlan = FilePlan.build(
+        paths, lambda metadata: [(name, None) for name in ("B.JPG", "A.JPG", "X.JPG", "Y.JPG")]
+    )
+    executor: PlanExecutor = PlanExecutor(plan, is_send2trash=False, executor=EXECUTOR_SERIAL)
+    executor.run(on_progress=lambda n: executor.stop())
+    assert executor.num_failed() == 0
+    assert sorted(os.listdir(str(tmp_path))) == ["A.JPG", "B.JPG", "C.JPG", "D.JPG"]
+    assert executor.renamed() == {paths[0]: paths[1], paths[1]: paths[0]}
+
+
+def test_trash_original_paths(tmp_path, monkeypatch) -> None:
+    # A -> B and B -> A (a rename cycle), C -> C and D -> X, all rewritten: the originals are
+    # trashed from their own paths (so that the trash restores them there), in one batch apart
+    # from the original of the cycle that has to free its name first
+    monkeypatch.setenv("XDG_CACHE_HOME", os.path.join(str(tmp_path), "cache"))
+    monkeypatch.setattr("package.ImageBackend._default_name", "exif")
+    trashed: List[List[str]] = []
+
+    def send2trash(paths) -> None:
+        paths = [paths] if isinstance(paths, str) else list(paths)
+        trashed.append(paths)
+        for path in paths:
+            os.remove(path)
+
+    monkeypatch.setattr("send2trash.send2trash", send2trash)
+    dirpath: str = os.path.join(str(tmp_path), "photos")
+    os.mkdir(dirpath)
+    paths: List[str] = [make_jpeg(os.path.join(dirpath, f"{name}.JPG"), _DATE) for name in "ABCD"]
+    new_names: List[str] = ["B.JPG", "A.JPG", "C.JPG", "X.JPG"]
+    plan: FilePlan = FilePlan.build(
+        paths,
+        lambda metadata: [
+            (name, datetime.datetime(2022, 1, 1, i)) for i, name in enumerate(new_names)
+        ],
+    )
+
+    executor: PlanExecutor = PlanExecutor(plan, executor=EXECUTOR_SERIAL)
+    executor.run()
+    assert executor.num_failed() == 0
+    assert trashed == [paths[:1], paths[1:]]
+    assert sorted(os.listdir(dirpath)) == ["A.JPG", "B.JPG", "C.JPG", "X.JPG"]
+    for i, name in enumerate(new_names):
+        assert open_image(os.path.join(dirpath, name)).date_taken() == datetime.datetime(
+            2022, 1, 1, i
+        )
+    assert incomplete_journals() == []
@@ -0,0 +1,22 @@
+from __future__ import annotations
+import os
+import datetime
+
+from package.Sidecar import read_sidecar, sidecar_path, write_sidecar
+
+
+def test_write_sidecar_keeps_mode(jpeg: str) -> None:
+    old_umask: int = os.umask(0o022)
+    try:
+        xmp_path: str = write_sidecar(jpeg, date_taken=datetime.datetime(2022, 3, 4, 5, 6, 7))
+        assert os.stat(xmp_path).st_mode & 0o777 == 0o644
+        write_sidecar(jpeg, filename="IMG_2.JPG")
+    finally:
+        os.umask(old_umask)
+    assert os.stat(xmp_path).st_mode & 0o777 == 0o644
+    assert xmp_path == sidecar_path(jpeg)
+    assert read_sidecar(jpeg) == {
+        "date_taken": datetime.datetime(2022, 3, 4, 5, 6, 7),
+        "filename": "IMG_2.JPG",
+    }
+    assert sorted(os.listdir(os.path.dirname(jpeg))) == ["IMG_1.JPG", "IMG_1.xmp"]